@@ -0,0 +1,157 @@
+# agregados.py
+"""
+Tabelas agregadas (camada "gold") que alimentam as visões do dashboard.
+
+O pipeline materializa as agregações de todas as distribuidoras em tabelas Delta
+particionadas por distribuidora; o dashboard apenas consulta a fatia da distribuidora e
+do indicador selecionados. As mesmas funções de cálculo são usadas pelo dashboard para
+recalcular em memória quando as tabelas agregadas não existem ou são de outra versão.
+Todos os agrupamentos incluem a distribuidora, então o pipeline calcula as agregações uma
+distribuidora por vez, sem carregar a tabela processada inteira.
+"""
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from deltalake import DeltaTable
+from deltalake.writer import write_deltalake
+from tabela_delta import COLUNAS_DASHBOARD, INDICADORES, dataset_snapshot, ler_distribuidora, valores_particao
+
+# Arquivo com a versão da tabela de origem a partir da qual os agregados foram calculados
+NOME_ORIGEM = '_origem.json'
+
+
+def formato_longo(df, indicadores=INDICADORES):
+    """Uma linha por conjunto/mês/indicador, com o nome da distribuidora sem espaços nas bordas."""
+    df_longo = df.melt(id_vars=['Distribuidora', 'ConjuntoID', 'NomConjunto', 'Ano', 'Mes'],
+                       value_vars=[ind for ind in indicadores if ind in df.columns],
+                       var_name='Indicador', value_name='Valor')
+    df_longo['Distribuidora'] = df_longo['Distribuidora'].astype(str).str.strip()
+    return df_longo
+
+
+def calcular_anual(df_longo):
+    """Média, máximo e menor valor positivo por distribuidora, indicador e ano (KPIs e evolução anual)."""
+    grupos = df_longo.groupby(['Distribuidora', 'Indicador', 'Ano'], observed=True)
+    df_anual = grupos['Valor'].agg(Media='mean', Maximo='max').reset_index()
+    minimo_positivo = df_longo[df_longo['Valor'] > 0].groupby(
+        ['Distribuidora', 'Indicador', 'Ano'], observed=True)['Valor'].min().rename('MinimoPositivo')
+    df_anual = df_anual.merge(minimo_positivo.reset_index(), on=['Distribuidora', 'Indicador', 'Ano'], how='left')
+    df_anual['MinimoPositivo'] = df_anual['MinimoPositivo'].fillna(0.0)
+    return df_anual
+
+
+def calcular_mensal(df_longo):
+    """Média mensal por distribuidora e indicador (série temporal)."""
+    df_mensal = df_longo.groupby(['Distribuidora', 'Indicador', 'Ano', 'Mes'], observed=True)['Valor'].mean()
+    df_mensal = df_mensal.rename('Media').reset_index()
+    df_mensal['Data'] = pd.to_datetime(df_mensal['Ano'].astype(str) + '-' + df_mensal['Mes'].astype(str))
+    return df_mensal[['Distribuidora', 'Indicador', 'Data', 'Media']]
+
+
+def calcular_conjuntos_anual(df_longo):
+    """Média anual por conjunto e sua posição no ranking do ano (1 = pior, maior média)."""
+    df_conjuntos = df_longo.groupby(['Distribuidora', 'Indicador', 'Ano', 'ConjuntoID'], observed=True).agg(
+        NomConjunto=('NomConjunto', 'last'), Media=('Valor', 'mean')).reset_index()
+    df_conjuntos['Ranking'] = df_conjuntos.groupby(['Distribuidora', 'Indicador', 'Ano'], observed=True)[
+        'Media'].rank(method='first', ascending=False).astype('int32')
+    return df_conjuntos
+
+
+def calcular_conjuntos_historico(df_longo):
+    """Média e desvio padrão históricos (todos os meses) por conjunto, usados no Z-score."""
+    df_historico = df_longo.groupby(['Distribuidora', 'Indicador', 'ConjuntoID'], observed=True)['Valor'].agg(
+        MediaHistorica='mean', DesvioPadraoHistorico='std').reset_index()
+    return df_historico.fillna({'MediaHistorica': 0.0, 'DesvioPadraoHistorico': 0.0})
+
+
+CALCULOS = {
+    'anual': calcular_anual,
+    'mensal': calcular_mensal,
+    'conjuntos_anual': calcular_conjuntos_anual,
+    'conjuntos_historico': calcular_conjuntos_historico,
+}
+
+
+def _ler_preparados(caminho):
+    """Leitor em streaming de um arquivo IPC (lido por memory-map), lote a lote."""
+    leitor = pa.ipc.open_file(pa.memory_map(caminho, 'r'))
+    return pa.RecordBatchReader.from_batches(
+        leitor.schema, (leitor.get_batch(i) for i in range(leitor.num_record_batches)))
+
+
+def materializar_agregados(tabela, path_agregados, versao_origem, path_preparacao):
+    """
+    Recalcula e grava todas as tabelas agregadas a partir do snapshot da tabela processada,
+    lendo uma distribuidora por vez: o pico de memória fica no tamanho da maior distribuidora.
+    Os resultados de cada distribuidora são acumulados em arquivos Arrow IPC em `path_preparacao`,
+    e cada tabela agregada é gravada a partir deles em streaming, em um único commit.
+    Retorna o número de linhas lidas e o de linhas gravadas em cada tabela agregada, ou None se
+    os agregados já foram calculados a partir de `versao_origem` (nada é recalculado).
+    """
+    if versao_origem is not None and versao_origem_agregados(path_agregados) == versao_origem and all(
+            DeltaTable.is_deltatable(os.path.join(path_agregados, nome)) for nome in CALCULOS):
+        return None
+    shutil.rmtree(path_preparacao, ignore_errors=True)
+    os.makedirs(path_preparacao)
+    escritores, esquemas, linhas, linhas_entrada = {}, {}, {}, 0
+    try:
+        # Partições antigas guardam o nome com espaços à direita: ler_distribuidora junta as variantes
+        distribuidoras = sorted({valor.strip() for valor in valores_particao(tabela, 'Distribuidora')} - {''})
+        for distribuidora in distribuidoras:
+            df = ler_distribuidora(tabela, distribuidora, COLUNAS_DASHBOARD).to_pandas()
+            linhas_entrada += len(df)
+            df_longo = formato_longo(df)
+            for nome, calcular in CALCULOS.items():
+                parte = pa.Table.from_pandas(calcular(df_longo), preserve_index=False)
+                if nome not in escritores:
+                    esquemas[nome], linhas[nome] = parte.schema, 0
+                    escritores[nome] = pa.ipc.new_file(os.path.join(path_preparacao, f"{nome}.arrow"), parte.schema)
+                escritores[nome].write_table(parte.cast(esquemas[nome]))
+                linhas[nome] += parte.num_rows
+        for escritor in escritores.values():
+            escritor.close()
+
+        # Sem a versão de origem, o dashboard recalcula em memória enquanto as tabelas são trocadas
+        _gravar_origem(path_agregados, None)
+        for nome in escritores:
+            preparados = _ler_preparados(os.path.join(path_preparacao, f"{nome}.arrow"))
+            write_deltalake(os.path.join(path_agregados, nome), preparados, mode='overwrite',
+                            partition_by=['Distribuidora'], schema_mode='overwrite')
+        _gravar_origem(path_agregados, versao_origem)
+        return linhas_entrada, linhas
+    finally:
+        shutil.rmtree(path_preparacao, ignore_errors=True)
+
+
+def _gravar_origem(path_agregados, versao_origem):
+    """Grava a versão de origem de forma atômica, ou remove o arquivo se `versao_origem` for None."""
+    caminho = os.path.join(path_agregados, NOME_ORIGEM)
+    if versao_origem is None:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        return
+    os.makedirs(path_agregados, exist_ok=True)
+    with open(caminho + '.tmp', 'w') as f:
+        json.dump({'versao_origem': versao_origem}, f)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def versao_origem_agregados(path_agregados):
+    """Versão da tabela processada usada no último cálculo dos agregados (ou None)."""
+    try:
+        with open(os.path.join(path_agregados, NOME_ORIGEM), 'r') as f:
+            return json.load(f)['versao_origem']
+    except FileNotFoundError:
+        return None
+
+
+def ler_agregado(path_agregados, nome, distribuidora, indicador):
+    """Lê a fatia (distribuidora, indicador) de uma tabela agregada, ou None se ela não existir."""
+    path_tabela = os.path.join(path_agregados, nome)
+    if not DeltaTable.is_deltatable(path_tabela):
+        return None
+    dataset = dataset_snapshot(DeltaTable(path_tabela), lambda particao: particao['Distribuidora'] == distribuidora)
+    return dataset.to_table(filter=ds.field('Indicador') == pa.scalar(indicador)).to_pandas()
@@ -0,0 +1,132 @@
+# benchmarks/api_local.py
+# Substituto local do endpoint `datastore_search` do CKAN (portal de dados abertos da ANEEL),
+# servindo registros gerados por `gerar_dados.py` com paginação por `limit`/`offset`. As respostas
+# levam ETag e consultas com If-None-Match recebem 304, para medir a revalidação do cache HTTP.
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+RESOURCE_ID_PADRAO = '4493985c-baea-429c-9df5-3030422c71d7'
+# Mesmo teto do CKAN (`ckan.datastore.search.rows_max`)
+LIMITE_MAXIMO_PADRAO = 32000
+CAMINHO_ENDPOINT = '/api/3/action/datastore_search'
+CAMINHO_RECURSO = '/api/3/action/resource_show'
+
+
+class ManipuladorCKAN(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Mantém a conexão aberta entre páginas, como o pool do cliente espera
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parametros = {chave: valores[0] for chave, valores in parse_qs(url.query).items()}
+        if url.path == CAMINHO_RECURSO and parametros.get('id') == self.server.resource_id:
+            # Os registros não mudam enquanto o servidor está no ar: a data de alteração é a do início
+            return self._responder(200, {"success": True, "result": {
+                "id": self.server.resource_id, "datastore_active": True, "last_modified": self.server.modificado}})
+        if url.path != CAMINHO_ENDPOINT:
+            return self._responder(404, {"success": False, "error": {"message": "Not found", "__type": "Not Found Error"}})
+        if parametros.get('resource_id') != self.server.resource_id:
+            return self._responder(404, {"success": False, "error": {
+                "message": f"Resource \"{parametros.get('resource_id')}\" was not found.", "__type": "Not Found Error"}})
+        try:
+            offset = int(parametros.get('offset', 0))
+            limit = min(int(parametros.get('limit', 100)), self.server.limite_maximo)
+        except ValueError:
+            return self._responder(409, {"success": False, "error": {"__type": "Validation Error"}})
+
+        if self.server.latencia_ms:
+            time.sleep(self.server.latencia_ms / 1000)
+        registros = self.server.registros
+        resultado = {
+            "resource_id": self.server.resource_id,
+            "fields": self.server.campos,
+            "records": registros[offset:offset + limit],
+            "limit": limit,
+            "offset": offset,
+            "total": len(registros),
+        }
+        self._responder(200, {"help": f"http://{self.headers.get('Host')}/api/3/action/help_show?name=datastore_search",
+                              "success": True, "result": resultado})
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode('utf-8')
+        etag = f'"{hashlib.sha1(dados).hexdigest()}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        if status == 200:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass  # Sem log por requisição, para não interferir nas medições
+
+
+def carregar_registros(caminho_parquet):
+    """Lê os registros gerados e os converte no formato JSON do CKAN (com `_id` e campos numéricos)."""
+    df = pd.read_parquet(caminho_parquet)
+    for col in ['AnoIndice', 'NumPeriodoIndice']:
+        df[col] = df[col].astype(int)
+    df.insert(0, '_id', range(1, len(df) + 1))
+    return df.to_dict(orient='records')
+
+
+def criar_servidor(registros, porta=0, resource_id=RESOURCE_ID_PADRAO, latencia_ms=0,
+                   limite_maximo=LIMITE_MAXIMO_PADRAO):
+    """Cria o servidor (porta 0 = porta livre escolhida pelo sistema). Use `serve_forever` para atender."""
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), ManipuladorCKAN)
+    servidor.daemon_threads = True
+    servidor.registros = registros
+    servidor.campos = [{"id": campo, "type": "int" if campo == '_id' else "text"}
+                       for campo in (registros[0] if registros else {})]
+    servidor.resource_id = resource_id
+    servidor.latencia_ms = latencia_ms
+    servidor.limite_maximo = limite_maximo
+    servidor.modificado = datetime.now().isoformat(timespec='microseconds')
+    return servidor
+
+
+def url_servidor(servidor):
+    return f"http://127.0.0.1:{servidor.server_address[1]}{CAMINHO_ENDPOINT}"
+
+
+def iniciar_em_segundo_plano(servidor):
+    """Atende as requisições em uma thread daemon (para uso dentro de outro processo)."""
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return url_servidor(servidor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API CKAN local para os benchmarks.")
+    parser.add_argument('--registros', required=True, help="Parquet gerado por gerar_dados.py.")
+    parser.add_argument('--porta', type=int, default=0)
+    parser.add_argument('--resource-id', default=RESOURCE_ID_PADRAO)
+    parser.add_argument('--latencia-ms', type=float, default=0, help="Atraso artificial por requisição.")
+    parser.add_argument('--limite-maximo', type=int, default=LIMITE_MAXIMO_PADRAO)
+    args = parser.parse_args()
+
+    servidor = criar_servidor(carregar_registros(args.registros), args.porta, args.resource_id,
+                              args.latencia_ms, args.limite_maximo)
+    # A primeira linha da saída é a URL, lida por quem iniciou o processo
+    print(url_servidor(servidor), flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+# benchmarks/executar_benchmarks.py
+# Mede tempo e pico de memória das etapas do pipeline e dos carregamentos do dashboard sobre
+# dados sintéticos e a API local, gravando o resultado em JSON para comparar versões.
+#
+#   python benchmarks/executar_benchmarks.py --distribuidoras 20 --conjuntos 100
+#   python benchmarks/executar_benchmarks.py --comparar benchmarks/resultados/<anterior>.json
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+import yaml
+
+DIR_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RAIZ_REPO = os.path.dirname(DIR_BENCHMARKS)
+sys.path.insert(0, DIR_BENCHMARKS)
+from gerar_dados import dividir_fontes, gerar_registros, gravar_csvs, nomes_distribuidoras  # noqa: E402
+
+PATH_REGISTROS_BRUTOS = 'registros_brutos.parquet'
+PATH_REGISTROS_API = 'registros_api.parquet'
+PATH_ESCRITA = 'bench_escrita_delta'
+
+
+# --- CASOS DE BENCHMARK ---
+# Cada caso recebe a configuração do diretório de trabalho e devolve (preparar, executar):
+# `preparar` roda antes de cada repetição, fora da medição, e devolve a entrada de `executar`,
+# que retorna o número de linhas produzidas.
+
+def _caso_processar_dados_locais(config):
+    import processar_dados
+
+    def preparar():
+        shutil.rmtree(config['paths']['local_cache'], ignore_errors=True)  # Sempre sem cache
+
+    return preparar, lambda _: len(processar_dados.processar_dados_locais())
+
+
+def _caso_processar_dados_api(config):
+    import processar_dados
+
+    def preparar():
+        shutil.rmtree(config['paths']['api_pages'], ignore_errors=True)  # Sempre sem checkpoint
+        shutil.rmtree(config['paths']['http_cache'], ignore_errors=True)  # e sem cache HTTP
+
+    return preparar, lambda _: len(processar_dados.processar_dados_api())
+
+
+def _caso_processar_dados_api_revalidacao(config):
+    # Sem checkpoint, mas com o cache HTTP de uma execução anterior: todas as páginas voltam como 304
+    import processar_dados
+    shutil.rmtree(config['paths']['http_cache'], ignore_errors=True)
+    shutil.rmtree(config['paths']['api_pages'], ignore_errors=True)
+    processar_dados.baixar_paginas_api()
+
+    def preparar():
+        shutil.rmtree(config['paths']['api_pages'], ignore_errors=True)
+
+    return preparar, lambda _: len(processar_dados.processar_dados_api())
+
+
+def _caso_limpar_e_padronizar_dataframe(config):
+    import processar_dados
+    return (lambda: pd.read_parquet(PATH_REGISTROS_BRUTOS),
+            lambda df: len(processar_dados.limpar_e_padronizar_dataframe(df)))
+
+
+def _caso_validacao_schema(config):
+    # Mesma validação do pipeline: estrutura pelo Pandera e regras de valor em blocos no Arrow
+    import processar_dados
+    from tabela_delta import tabela_para_delta
+    from validacao import reunir_falhas, validar_em_blocos, validar_estrutura
+    df = processar_dados.limpar_e_padronizar_dataframe(pd.read_parquet(PATH_REGISTROS_BRUTOS))
+
+    def executar(df):
+        falhas = reunir_falhas(
+            validar_estrutura(processar_dados.SchemaDados, df),
+            validar_em_blocos(processar_dados.SchemaDados, tabela_para_delta(df), indice=df.index.to_numpy(),
+                              linhas_por_bloco=config['data_quality']['chunk_rows'],
+                              max_workers=config['data_quality']['max_workers']))
+        return len(df) - len(falhas)
+
+    return lambda: df, executar
+
+
+def _caso_escrita_delta(config):
+    import processar_dados
+    from deltalake import write_deltalake
+    from tabela_delta import tabela_para_delta
+    df = processar_dados.limpar_e_padronizar_dataframe(pd.read_parquet(PATH_REGISTROS_BRUTOS))
+
+    def preparar():
+        shutil.rmtree(PATH_ESCRITA, ignore_errors=True)
+        return df
+
+    def executar(df):
+        write_deltalake(PATH_ESCRITA, tabela_para_delta(df), mode='overwrite', partition_by=['Ano', 'Distribuidora'])
+        return len(df)
+
+    return preparar, executar
+
+
+def _importar_dashboard():
+    # Fora do `streamlit run` o script roda em modo "bare": a página padrão (Sobre o Projeto)
+    # é montada sem efeito e as funções em cache ficam disponíveis para chamada direta
+    import dashboard_integrado
+    return dashboard_integrado
+
+
+def _caso_obter_lista_distribuidoras(config):
+    dashboard = _importar_dashboard()
+    return dashboard.obter_catalogo.clear, lambda _: len(dashboard.obter_lista_distribuidoras())
+
+
+def _caso_carregar_dados_distribuidora(config):
+    dashboard = _importar_dashboard()
+    distribuidora = nomes_distribuidoras(1)[0]
+    return (lambda: dashboard.obter_cache_dados().limpar(disco=True),
+            lambda _: len(dashboard.carregar_dados_distribuidora(distribuidora)))
+
+
+def _caso_carregar_dados_distribuidora_cache_disco(config):
+    # Outro processo (réplica ou reinício) já carregou a distribuidora: lê o Arrow IPC mapeado do disco
+    dashboard = _importar_dashboard()
+    distribuidora = nomes_distribuidoras(1)[0]
+    dashboard.carregar_dados_distribuidora(distribuidora)
+    return (dashboard.obter_cache_dados().limpar,
+            lambda _: len(dashboard.carregar_dados_distribuidora(distribuidora)))
+
+
+def _caso_consulta_nacional(config):
+    dashboard = _importar_dashboard()
+
+    def executar(_):
+        # Ranking do último ano e faixas de percentis de todos os anos, entre todas as distribuidoras
+        df_percentis = dashboard.consultar_nacional('percentis', None, 'DEC')
+        return len(dashboard.consultar_nacional('ranking', None, 'DEC', int(df_percentis['Ano'].max())))
+    return dashboard.consultar_nacional.clear, executar
+
+
+def _preparar_tabela(config):
+    """Grava a tabela Delta e o catálogo lidos pelos casos do dashboard (não é medido)."""
+    import processar_dados
+    from deltalake import DeltaTable, write_deltalake
+    from tabela_delta import construir_catalogo, salvar_catalogo, tabela_para_delta
+    df = processar_dados.limpar_e_padronizar_dataframe(pd.read_parquet(PATH_REGISTROS_BRUTOS))
+    path = config['paths']['processed_data']
+    write_deltalake(path, tabela_para_delta(df), mode='overwrite', partition_by=['Ano', 'Distribuidora'])
+    salvar_catalogo(path, construir_catalogo(DeltaTable(path)))
+    return None, lambda _: len(df)
+
+
+CASOS = {
+    'processar_dados_locais': _caso_processar_dados_locais,
+    'processar_dados_api': _caso_processar_dados_api,
+    'processar_dados_api_revalidacao': _caso_processar_dados_api_revalidacao,
+    'limpar_e_padronizar_dataframe': _caso_limpar_e_padronizar_dataframe,
+    'validacao_schema': _caso_validacao_schema,
+    'escrita_delta': _caso_escrita_delta,
+    'obter_lista_distribuidoras': _caso_obter_lista_distribuidoras,
+    'carregar_dados_distribuidora': _caso_carregar_dados_distribuidora,
+    'carregar_dados_distribuidora_cache_disco': _caso_carregar_dados_distribuidora_cache_disco,
+    'consulta_nacional': _caso_consulta_nacional,
+}
+
+
+def _pico_rss_mb(quem):
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(quem).ru_maxrss / divisor, 1)
+
+
+def medir_caso(nome, repeticoes):
+    """
+    Executado no processo filho, dentro do diretório de trabalho. As repetições cronometradas
+    rodam sem rastreamento; uma execução extra com tracemalloc mede o pico de memória alocada
+    pelo Python/NumPy. O pico de RSS é o do processo inteiro (inclui a preparação).
+    """
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    if nome == '_preparar_tabela':
+        _, executar = _preparar_tabela(config)
+        return {'linhas': executar(None)}
+    preparar, executar = CASOS[nome](config)
+
+    tempos, tempos_cpu, linhas = [], [], 0
+    for _ in range(repeticoes):
+        entrada = preparar()
+        gc.collect()
+        inicio, inicio_cpu = time.perf_counter(), time.process_time()
+        linhas = executar(entrada)
+        tempos.append(time.perf_counter() - inicio)
+        tempos_cpu.append(time.process_time() - inicio_cpu)
+
+    entrada = preparar()
+    gc.collect()
+    tracemalloc.start()
+    executar(entrada)
+    _, pico_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'linhas': linhas,
+        'repeticoes': repeticoes,
+        'tempos_s': [round(t, 4) for t in tempos],
+        'mediana_s': round(float(pd.Series(tempos).median()), 4),
+        'minimo_s': round(min(tempos), 4),
+        'cpu_mediana_s': round(float(pd.Series(tempos_cpu).median()), 4),
+        'pico_python_mb': round(pico_python / 1024 / 1024, 1),
+        'pico_rss_mb': _pico_rss_mb(resource.RUSAGE_SELF),
+        'pico_rss_filhos_mb': _pico_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+# --- ORQUESTRAÇÃO ---
+
+def preparar_diretorio(diretorio, args):
+    """Gera os dados sintéticos (CSVs, registros da API e registros brutos completos) no diretório de trabalho."""
+    os.makedirs(diretorio, exist_ok=True)
+    df = gerar_registros(args.distribuidoras, args.conjuntos, args.ano_inicial, args.ano_final,
+                         semente=args.semente)
+    df_csv, df_api = dividir_fontes(df, args.anos_api)
+    shutil.rmtree(os.path.join(diretorio, 'dados_brutos'), ignore_errors=True)
+    gravar_csvs(df_csv, os.path.join(diretorio, 'dados_brutos'), args.arquivos)
+    df_api.to_parquet(os.path.join(diretorio, PATH_REGISTROS_API), index=False)
+    df.to_parquet(os.path.join(diretorio, PATH_REGISTROS_BRUTOS), index=False)
+    return {'registros': len(df), 'registros_csv': len(df_csv), 'registros_api': len(df_api)}
+
+
+def gravar_config(diretorio, url_api, engine):
+    with open(os.path.join(RAIZ_REPO, 'config.yaml'), 'r') as f:
+        config = yaml.safe_load(f)
+    config['api']['base_url'] = url_api
+    config['pipeline']['engine'] = engine
+    config['maintenance']['run_after_pipeline'] = False
+    config['forecasting']['enabled'] = False
+    config['dashboard']['table_version'] = None
+    with open(os.path.join(diretorio, 'config.yaml'), 'w') as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+
+
+def iniciar_api_local(diretorio, latencia_ms):
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(DIR_BENCHMARKS, 'api_local.py'),
+         '--registros', os.path.join(diretorio, PATH_REGISTROS_API), '--latencia-ms', str(latencia_ms)],
+        stdout=subprocess.PIPE, text=True)
+    url = processo.stdout.readline().strip()
+    if not url:
+        processo.kill()
+        raise RuntimeError("A API local não iniciou.")
+    return processo, url
+
+
+def executar_em_processo(nome, diretorio, repeticoes):
+    """Cada caso roda em um processo novo, para que o pico de memória de um não contamine o outro."""
+    resultado = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--caso', nome, '--repeticoes', str(repeticoes)],
+        cwd=diretorio, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [RAIZ_REPO, os.environ.get('PYTHONPATH')]))})
+    if resultado.returncode != 0:
+        raise RuntimeError(f"O caso '{nome}' falhou:\n{resultado.stderr[-3000:]}")
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def versao_codigo():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ_REPO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        alterado = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ_REPO,
+                                  capture_output=True, text=True).stdout.strip()
+        return commit + ('-modificado' if alterado else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ambiente():
+    import deltalake
+    import pyarrow
+    return {'python': platform.python_version(), 'pandas': pd.__version__, 'pyarrow': pyarrow.__version__,
+            'deltalake': deltalake.__version__, 'plataforma': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def comparar(resultado, caminho_base, limiar):
+    """Compara as medianas com um resultado anterior; retorna os casos que ficaram mais lentos que o limiar."""
+    with open(caminho_base, 'r') as f:
+        base = json.load(f)
+    print(f"\nComparação com {base.get('versao_codigo')} ({caminho_base}):")
+    regressoes = []
+    for nome, atual in resultado['casos'].items():
+        anterior = base.get('casos', {}).get(nome)
+        if not anterior:
+            continue
+        razao_tempo = atual['mediana_s'] / anterior['mediana_s'] if anterior['mediana_s'] else float('inf')
+        razao_memoria = atual['pico_python_mb'] / anterior['pico_python_mb'] if anterior['pico_python_mb'] else 1.0
+        marca = ''
+        if razao_tempo > limiar:
+            regressoes.append(nome)
+            marca = '  <-- REGRESSÃO'
+        print(f"  {nome:32s} {anterior['mediana_s']:8.3f}s -> {atual['mediana_s']:8.3f}s ({razao_tempo:5.2f}x)  "
+              f"memória {razao_memoria:5.2f}x{marca}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline e do dashboard com dados sintéticos.")
+    parser.add_argument('--distribuidoras', type=int, default=10)
+    parser.add_argument('--conjuntos', type=int, default=50)
+    parser.add_argument('--ano-inicial', type=int, default=2015)
+    parser.add_argument('--ano-final', type=int, default=2024)
+    parser.add_argument('--anos-api', type=int, default=2)
+    parser.add_argument('--arquivos', type=int, default=4)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--engine', default='pandas', choices=['pandas', 'polars'])
+    parser.add_argument('--latencia-ms', type=float, default=0, help="Atraso por requisição da API local.")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--casos', nargs='*', choices=sorted(CASOS), help="Padrão: todos.")
+    parser.add_argument('--diretorio', help="Diretório de trabalho (padrão: temporário, removido ao final).")
+    parser.add_argument('--saida', help="Arquivo JSON do resultado (padrão: benchmarks/resultados/<data>.json).")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparar.")
+    parser.add_argument('--limiar', type=float, default=1.10, help="Razão de tempo considerada regressão.")
+    parser.add_argument('--caso', help=argparse.SUPPRESS)  # Uso interno: executa um caso no processo filho
+    args = parser.parse_args()
+
+    if args.caso:
+        print(json.dumps(medir_caso(args.caso, args.repeticoes)))
+        return
+
+    diretorio = os.path.abspath(args.diretorio or tempfile.mkdtemp(prefix='benchmark_aneel_'))
+    print(f"Gerando dados sintéticos em '{diretorio}'...")
+    volumes = preparar_diretorio(diretorio, args)
+    api, url_api = iniciar_api_local(diretorio, args.latencia_ms)
+    resultado = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'versao_codigo': versao_codigo(),
+        'ambiente': ambiente(),
+        'parametros': {chave: valor for chave, valor in vars(args).items()
+                       if chave not in ('caso', 'diretorio', 'saida', 'comparar', 'limiar')},
+        'volumes': volumes,
+        'casos': {},
+    }
+    try:
+        gravar_config(diretorio, url_api, args.engine)
+        executar_em_processo('_preparar_tabela', diretorio, 1)
+        for nome in args.casos or CASOS:
+            print(f"Executando '{nome}' ({args.repeticoes} repetições)...")
+            resultado['casos'][nome] = executar_em_processo(nome, diretorio, args.repeticoes)
+            medicao = resultado['casos'][nome]
+            print(f"  mediana {medicao['mediana_s']:.3f}s | pico Python {medicao['pico_python_mb']} MB | "
+                  f"pico RSS {medicao['pico_rss_mb']} MB | {medicao['linhas']:,} linhas")
+    finally:
+        api.terminate()
+        api.wait()
+        if not args.diretorio:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    saida = args.saida or os.path.join(DIR_BENCHMARKS, 'resultados',
+                                       f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"Resultado gravado em '{saida}'.")
+
+    if args.comparar and comparar(resultado, args.comparar, args.limiar):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/gerar_dados.py
+# Gera registros sintéticos no formato longo dos indicadores de continuidade da ANEEL
+# (uma linha por distribuidora × conjunto × ano × mês × indicador), em CSVs latin1 separados
+# por ';' com vírgula decimal, como os arquivos baixados do portal, e em Parquet para a API local.
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+DISTRIBUIDORAS_CONHECIDAS = [
+    'CEMIG-D', 'ENEL SP', 'LIGHT', 'COPEL-DIS', 'CELESC-DIS', 'EQUATORIAL PA', 'CERAL ANITÁPOLIS',
+    'ENERGISA MT', 'COELBA', 'RGE SUL', 'CPFL PAULISTA', 'NEOENERGIA PE',
+]
+LOCALIDADES = ['São João', 'Conceição', 'Itaúna', 'Guaíra', 'Paraíso', 'Jacareí', 'Lagoa Dourada', 'Pirajuí']
+# Escala típica de cada indicador (horas ou número de interrupções)
+ESCALA_INDICADORES = {'DEC': 1.2, 'FEC': 0.6, 'DIC': 2.5, 'FIC': 1.1, 'DMIC': 1.8, 'DICRI': 3.0}
+COLUNAS_CSV = ['DatGeracaoConjuntoDados', 'SigAgente', 'NumCNPJ', 'IdeConjUndConsumidoras',
+               'DscConjUndConsumidoras', 'SigIndicador', 'AnoIndice', 'NumPeriodoIndice', 'VlrIndiceEnviado']
+
+
+def nomes_distribuidoras(quantidade):
+    """Nomes reais (com acentos) seguidos de nomes sintéticos até completar a `quantidade`."""
+    extras = [f'DISTRIBUIDORA {i:03d}' for i in range(max(0, quantidade - len(DISTRIBUIDORAS_CONHECIDAS)))]
+    return (DISTRIBUIDORAS_CONHECIDAS + extras)[:quantidade]
+
+
+def gerar_registros(distribuidoras=10, conjuntos=50, ano_inicial=2015, ano_final=2024,
+                    indicadores=('DEC', 'FEC', 'DIC', 'FIC'), fracao_vazios=0.01, semente=42):
+    """
+    Gera o DataFrame bruto (todas as colunas como texto, como chegam da ANEEL) com
+    distribuidoras × conjuntos × anos × 12 meses × indicadores registros.
+    """
+    rng = np.random.default_rng(semente)
+    nomes = nomes_distribuidoras(distribuidoras)
+    anos = np.arange(ano_inicial, ano_final + 1)
+    n_anos, n_ind = len(anos), len(indicadores)
+    por_distribuidora = conjuntos * n_anos * 12 * n_ind
+    total = distribuidoras * por_distribuidora
+
+    # Grade completa: a ordem das dimensões segue a dos arquivos da ANEEL (distribuidora, conjunto, período)
+    idx_dist = np.repeat(np.arange(distribuidoras), por_distribuidora)
+    idx_conj = np.tile(np.repeat(np.arange(conjuntos), n_anos * 12 * n_ind), distribuidoras)
+    idx_ano = np.tile(np.repeat(np.arange(n_anos), 12 * n_ind), distribuidoras * conjuntos)
+    meses = np.tile(np.repeat(np.arange(1, 13), n_ind), distribuidoras * conjuntos * n_anos)
+    idx_ind = np.tile(np.arange(n_ind), distribuidoras * conjuntos * n_anos * 12)
+
+    escalas = np.array([ESCALA_INDICADORES.get(ind, 1.0) for ind in indicadores])
+    # Cada conjunto tem um nível próprio; os meses de verão têm mais interrupções
+    nivel_conjunto = rng.gamma(2.0, 0.5, size=distribuidoras * conjuntos)[idx_dist * conjuntos + idx_conj]
+    sazonalidade = 1 + 0.3 * np.cos(2 * np.pi * (meses - 1) / 12)
+    valores = rng.gamma(2.0, escalas[idx_ind] * nivel_conjunto * sazonalidade / 2.0)
+
+    texto_valores = pd.Series(np.round(valores, 2)).map('{:.2f}'.format).str.replace('.', ',', regex=False)
+    texto_valores[rng.random(total) < fracao_vazios] = ''
+
+    # Na ANEEL a sigla do agente vem preenchida com espaços até 20 caracteres
+    siglas = np.array([nome.ljust(20) for nome in nomes], dtype=object)
+    cnpjs = np.array([f'{rng.integers(10 ** 12, 10 ** 13):014d}' for _ in nomes], dtype=object)
+    ids_conjunto = (idx_dist * 100000 + idx_conj + 1).astype(str)
+    nomes_conjunto = np.array(
+        [f'{LOCALIDADES[c % len(LOCALIDADES)]} {c + 1:03d}' for c in range(conjuntos)], dtype=object)
+
+    return pd.DataFrame({
+        'DatGeracaoConjuntoDados': '2025-01-31',
+        'SigAgente': siglas[idx_dist],
+        'NumCNPJ': cnpjs[idx_dist],
+        'IdeConjUndConsumidoras': ids_conjunto,
+        'DscConjUndConsumidoras': nomes_conjunto[idx_conj],
+        'SigIndicador': np.array(indicadores, dtype=object)[idx_ind],
+        'AnoIndice': anos[idx_ano].astype(str),
+        'NumPeriodoIndice': meses.astype(str),
+        'VlrIndiceEnviado': texto_valores.to_numpy(dtype=object),
+    }, columns=COLUNAS_CSV)
+
+
+def dividir_fontes(df, anos_api=2):
+    """Os anos mais recentes ficam para a API; o histórico vai para os arquivos locais."""
+    anos = df['AnoIndice'].astype(int)
+    corte = anos.max() - anos_api + 1
+    return df[anos < corte], df[anos >= corte]
+
+
+def gravar_csvs(df, pasta, arquivos=4):
+    """Grava os registros em `arquivos` CSVs por faixa de anos, em latin1 com ';' e vírgula decimal."""
+    os.makedirs(pasta, exist_ok=True)
+    anos = sorted(df['AnoIndice'].unique(), key=int)
+    caminhos = []
+    for faixa in np.array_split(np.array(anos), min(arquivos, len(anos))):
+        caminho = os.path.join(pasta, f'indicadores_continuidade_{faixa[0]}_{faixa[-1]}.csv')
+        df[df['AnoIndice'].isin(faixa)].to_csv(caminho, sep=';', encoding='latin1', index=False)
+        caminhos.append(caminho)
+    return caminhos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos da ANEEL para os benchmarks.")
+    parser.add_argument('--destino', default='dados_sinteticos')
+    parser.add_argument('--distribuidoras', type=int, default=10)
+    parser.add_argument('--conjuntos', type=int, default=50, help="Conjuntos por distribuidora.")
+    parser.add_argument('--ano-inicial', type=int, default=2015)
+    parser.add_argument('--ano-final', type=int, default=2024)
+    parser.add_argument('--anos-api', type=int, default=2, help="Anos mais recentes servidos pela API local.")
+    parser.add_argument('--arquivos', type=int, default=4, help="Quantidade de CSVs do histórico.")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    df = gerar_registros(args.distribuidoras, args.conjuntos, args.ano_inicial, args.ano_final, semente=args.semente)
+    df_csv, df_api = dividir_fontes(df, args.anos_api)
+    caminhos = gravar_csvs(df_csv, os.path.join(args.destino, 'dados_brutos'), args.arquivos)
+    df_api.to_parquet(os.path.join(args.destino, 'registros_api.parquet'), index=False)
+    print(f"{len(df_csv):,} registros em {len(caminhos)} CSVs e {len(df_api):,} registros para a API "
+          f"gravados em '{args.destino}'.")
+
+
+if __name__ == '__main__':
+    main()
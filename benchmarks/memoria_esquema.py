@@ -0,0 +1,61 @@
+# benchmarks/memoria_esquema.py
+# Compara a memória ocupada pelo DataFrame de cada distribuidora (o que o dashboard mantém em cache)
+# no layout antigo (texto como objeto, inteiros e indicadores de 64 bits) e no esquema compacto.
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tabela_delta import (COLUNAS_CATEGORICAS, COLUNAS_DASHBOARD, abrir_tabela, aplicar_esquema_compacto,  # noqa: E402
+                          ler_distribuidora, valores_particao)
+
+
+def layout_objeto(df):
+    """Layout anterior ao esquema compacto: texto como objeto Python e números de 64 bits."""
+    tipos = {col: object for col in COLUNAS_CATEGORICAS if col in df.columns}
+    tipos.update({col: 'int64' for col in ['Ano', 'Mes'] if col in df.columns})
+    return df.astype(tipos)
+
+
+def medir_distribuidora(tabela, distribuidora):
+    dados = ler_distribuidora(tabela, distribuidora, COLUNAS_DASHBOARD)
+    if dados is None:
+        return None
+    base = dados.to_pandas()
+    layouts = {
+        'objeto': layout_objeto(base),
+        'padrao': base,
+        'compacto': aplicar_esquema_compacto(base),
+        'compacto_float32': aplicar_esquema_compacto(base, indicadores_float32=True),
+    }
+    resultado = {nome: int(df.memory_usage(deep=True).sum()) for nome, df in layouts.items()}
+    resultado.update({'distribuidora': distribuidora, 'linhas': len(base)})
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória por distribuidora em cada layout de colunas.")
+    parser.add_argument('--tabela', default='dados_processados')
+    parser.add_argument('--distribuidoras', nargs='*', help="Padrão: todas as distribuidoras da tabela.")
+    args = parser.parse_args()
+
+    tabela = abrir_tabela(args.tabela)
+    distribuidoras = args.distribuidoras or sorted(
+        {valor.strip() for valor in valores_particao(tabela, 'Distribuidora')})
+    medicoes = [medir_distribuidora(tabela, dist) for dist in distribuidoras]
+    resultados = pd.DataFrame([medicao for medicao in medicoes if medicao is not None])
+    if resultados.empty:
+        parser.error("Nenhuma das distribuidoras informadas existe na tabela.")
+
+    totais = resultados[['objeto', 'padrao', 'compacto', 'compacto_float32']].sum()
+    resumo = {nome: {'bytes': int(total), 'reducao_vs_objeto': round(totais['objeto'] / total, 2)}
+              for nome, total in totais.items()}
+    print(json.dumps({'distribuidoras': len(resultados), 'linhas': int(resultados['linhas'].sum()),
+                      'layouts': resumo}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
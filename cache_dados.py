@@ -0,0 +1,130 @@
+# cache_dados.py
+"""
+Cache das tabelas carregadas pelo dashboard, indexado pela versão da tabela Delta.
+
+Cada entrada é uma tabela do Arrow guardada em dois níveis:
+- em memória, com despejo LRU quando o total passa de `limite_memoria_bytes`;
+- em disco, como arquivo Arrow IPC (sem compressão) lido por memory-map, o que permite que
+  outros processos (réplicas do dashboard ou um reinício) reaproveitem os dados sem reler o
+  Parquet. Quando o diretório passa de `limite_disco_bytes`, os arquivos usados há mais tempo
+  são removidos.
+
+A versão da tabela faz parte da chave: depois que o pipeline grava uma nova versão, as
+entradas antigas deixam de ser consultadas e saem do cache pelo LRU.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+
+EXTENSAO = '.arrow'
+
+
+class CacheArrow:
+    def __init__(self, diretorio, limite_memoria_bytes, limite_disco_bytes):
+        self.diretorio = diretorio
+        self.limite_memoria_bytes = limite_memoria_bytes
+        self.limite_disco_bytes = limite_disco_bytes
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._trava = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        nome, versao, *partes = chave
+        resumo = hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.diretorio, f"{nome}-v{versao}-{resumo}{EXTENSAO}")
+
+    def obter(self, chave, carregar):
+        """
+        Devolve a tabela da `chave` (nome, versão, demais partes) e de onde ela veio ('memoria',
+        'disco' ou 'origem'). Na falta, chama `carregar()`, que deve retornar uma tabela do Arrow
+        ou None (resultado que não é guardado).
+        """
+        with self._trava:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                return self._memoria[chave], 'memoria'
+
+        caminho = self._caminho(chave)
+        tabela = self._ler_disco(caminho)
+        origem = 'disco'
+        if tabela is None:
+            tabela = carregar()
+            if tabela is None:
+                return None, 'origem'
+            tabela = self._gravar_disco(caminho, tabela)
+            origem = 'origem'
+        self._guardar_memoria(chave, tabela)
+        return tabela, origem
+
+    def _ler_disco(self, caminho):
+        try:
+            tabela = pa.ipc.open_file(pa.memory_map(caminho, 'r')).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        try:
+            os.utime(caminho)  # Marca o uso para o LRU do disco
+        except OSError:
+            pass
+        return tabela
+
+    def _gravar_disco(self, caminho, tabela):
+        """Grava a tabela de forma atômica e a devolve mapeada do arquivo (fora do heap do processo)."""
+        caminho_temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with pa.OSFile(caminho_temporario, 'wb') as f, pa.ipc.new_file(f, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+            os.replace(caminho_temporario, caminho)
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar o cache em '{caminho}': {e}")
+            return tabela
+        self._limitar_disco()
+        mapeada = self._ler_disco(caminho)
+        return mapeada if mapeada is not None else tabela
+
+    def _guardar_memoria(self, chave, tabela):
+        with self._trava:
+            if chave in self._memoria:
+                return
+            self._memoria[chave] = tabela
+            self._bytes_memoria += tabela.nbytes
+            while self._bytes_memoria > self.limite_memoria_bytes and len(self._memoria) > 1:
+                _, despejada = self._memoria.popitem(last=False)
+                self._bytes_memoria -= despejada.nbytes
+
+    def _limitar_disco(self):
+        """Remove os arquivos usados há mais tempo até o diretório caber em `limite_disco_bytes`."""
+        arquivos = []
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.endswith(EXTENSAO):
+                try:
+                    estado = entrada.stat()
+                except OSError:
+                    continue  # Removido por outro processo durante a listagem
+                arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos)[:-1]:
+            if total <= self.limite_disco_bytes:
+                break
+            try:
+                os.remove(caminho)  # Processos que já mapearam o arquivo continuam lendo normalmente
+                total -= tamanho
+            except OSError:
+                pass
+
+    def limpar(self, disco=False):
+        """Esvazia o cache em memória deste processo e, com `disco`, também os arquivos compartilhados."""
+        with self._trava:
+            self._memoria.clear()
+            self._bytes_memoria = 0
+        if disco:
+            for entrada in os.scandir(self.diretorio):
+                if entrada.name.endswith(EXTENSAO):
+                    try:
+                        os.remove(entrada.path)
+                    except OSError:
+                        pass
@@ -0,0 +1,147 @@
+# cliente_api.py
+"""
+Cliente HTTP do endpoint `datastore_search` (CKAN) da API de dados abertos da ANEEL.
+
+- Sessão com pool de conexões e novas tentativas com backoff exponencial para erros de
+  conexão e respostas 429/5xx (respeitando o Retry-After do servidor).
+- Cache das respostas em disco, compactadas com gzip e indexadas por resource_id, offset e
+  limit. Se a resposta guardada trouxe ETag ou Last-Modified, a consulta seguinte é
+  condicional e um 304 reaproveita o corpo do disco, sem baixar a página de novo.
+- Data da última alteração do recurso (`resource_show`), que indica se os dados mudaram
+  desde o último download completo.
+- Modo offline: as consultas são atendidas apenas pelo cache, sem acessar a rede, o que
+  permite reconstruir os dados da API sem internet (desde que as páginas já tenham sido baixadas).
+"""
+import gzip
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+STATUS_RETENTATIVA = (429, 500, 502, 503, 504)
+NIVEL_COMPRESSAO = 5  # O JSON da API compacta bem já nos níveis baixos, que são bem mais rápidos
+
+
+class RespostaForaDoCache(requests.exceptions.RequestException):
+    """Consulta sem resposta no cache durante o modo offline (tratada como falha de requisição)."""
+
+
+class ClienteAPI:
+    def __init__(self, url_base, timeout, max_conexoes, diretorio_cache=None, offline=False,
+                 tentativas=5, backoff_segundos=1.0):
+        if offline and not diretorio_cache:
+            raise ValueError("O modo offline precisa de um diretório de cache.")
+        self.url_base = url_base
+        self.timeout = timeout
+        self.diretorio_cache = diretorio_cache
+        self.offline = offline
+        self.respostas_cache = 0  # Respostas servidas pelo cache (304 ou modo offline)
+        self._trava = threading.Lock()
+
+        self.sessao = requests.Session()
+        retentativas = Retry(total=tentativas, backoff_factor=backoff_segundos, status_forcelist=STATUS_RETENTATIVA,
+                             allowed_methods=frozenset({'GET'}), respect_retry_after_header=True)
+        adaptador = HTTPAdapter(pool_connections=max_conexoes, pool_maxsize=max_conexoes, max_retries=retentativas)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+    def _caminhos(self, resource_id, offset, limit):
+        base = os.path.join(self.diretorio_cache, resource_id, f"offset_{offset:010d}_limit_{limit}")
+        return base + '.json.gz', base + '.meta.json'
+
+    def consultar(self, resource_id, offset, limit):
+        """Devolve o `result` da consulta, vindo da rede ou do cache em disco."""
+        parametros = {"resource_id": resource_id, "limit": limit, "offset": offset}
+        if not self.diretorio_cache:
+            return self._baixar(parametros).json().get("result", {})
+
+        caminho_corpo, caminho_meta = self._caminhos(resource_id, offset, limit)
+        if self.offline:
+            corpo = self._ler_corpo(caminho_corpo)
+            if corpo is None:
+                raise RespostaForaDoCache(f"Modo offline: não há resposta em cache para o offset {offset} "
+                                          f"(limit {limit}) do recurso {resource_id}.")
+            return self._do_cache(corpo)
+
+        validadores = self._ler_validadores(caminho_meta) if os.path.exists(caminho_corpo) else {}
+        cabecalhos = {}
+        if validadores.get('etag'):
+            cabecalhos['If-None-Match'] = validadores['etag']
+        if validadores.get('last_modified'):
+            cabecalhos['If-Modified-Since'] = validadores['last_modified']
+        resposta = self._baixar(parametros, cabecalhos)
+        if resposta.status_code == 304:
+            corpo = self._ler_corpo(caminho_corpo)
+            if corpo is not None:
+                return self._do_cache(corpo)
+            resposta = self._baixar(parametros)  # O corpo sumiu do disco entre a leitura e a resposta
+        self._gravar(caminho_corpo, caminho_meta, resposta)
+        return resposta.json().get("result", {})
+
+    def modificacao_recurso(self, resource_id):
+        """
+        Data da última alteração dos dados do recurso (`last_modified` do `resource_show` do CKAN),
+        ou None se ela não estiver disponível (modo offline, erro ou recurso sem a informação).
+        """
+        if self.offline:
+            return None
+        url = self.url_base.rsplit('/', 1)[0] + '/resource_show'
+        try:
+            resposta = self.sessao.get(url, params={"id": resource_id}, timeout=self.timeout)
+            resposta.raise_for_status()
+            recurso = resposta.json().get("result") or {}
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        return recurso.get('last_modified') or recurso.get('metadata_modified')
+
+    def _baixar(self, parametros, cabecalhos=None):
+        resposta = self.sessao.get(self.url_base, params=parametros, headers=cabecalhos, timeout=self.timeout)
+        resposta.raise_for_status()
+        return resposta
+
+    def _do_cache(self, corpo):
+        with self._trava:
+            self.respostas_cache += 1
+        return json.loads(corpo).get("result", {})
+
+    @staticmethod
+    def _ler_corpo(caminho):
+        try:
+            with gzip.open(caminho, 'rb') as f:
+                return f.read()
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+            return None
+
+    @staticmethod
+    def _ler_validadores(caminho):
+        try:
+            with open(caminho, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _gravar(self, caminho_corpo, caminho_meta, resposta):
+        """
+        Grava o corpo compactado e depois os validadores, ambos de forma atômica. Os validadores
+        antigos saem antes, para que uma interrupção no meio nunca associe o ETag antigo ao corpo novo.
+        """
+        os.makedirs(os.path.dirname(caminho_corpo), exist_ok=True)
+        sufixo = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.remove(caminho_meta)
+        except FileNotFoundError:
+            pass
+        with open(caminho_corpo + sufixo, 'wb') as f:
+            f.write(gzip.compress(resposta.content, compresslevel=NIVEL_COMPRESSAO))
+        os.replace(caminho_corpo + sufixo, caminho_corpo)
+        validadores = {'etag': resposta.headers.get('ETag'), 'last_modified': resposta.headers.get('Last-Modified')}
+        if any(validadores.values()):
+            with open(caminho_meta + sufixo, 'w') as f:
+                json.dump(validadores, f)
+            os.replace(caminho_meta + sufixo, caminho_meta)
+
+    def fechar(self):
+        self.sessao.close()
@@ -0,0 +1,71 @@
+# consultas.py
+"""
+Consultas nacionais (entre distribuidoras) sobre a tabela processada.
+
+As consultas são montadas sobre o scan lazy do Polars do snapshot da tabela Delta: os
+filtros de Ano e Distribuidora podam partições e arquivos, apenas as colunas usadas são
+lidas e a execução em streaming processa os arquivos em lotes de `linhas_por_lote` linhas.
+A memória fica limitada pelo lote e pelo número de grupos do resultado, e não pela
+quantidade de partições da tabela.
+"""
+import polars as pl
+
+PERCENTIS_PADRAO = (0.10, 0.25, 0.50, 0.75, 0.90)
+
+# Gravações antigas usaram o nome da distribuidora com espaços à direita na partição.
+# A expressão é aplicada direto no scan para que o filtro continue podando as partições.
+DISTRIBUIDORA = pl.col('Distribuidora').str.strip_chars()
+
+
+def scan_tabela(path, versao=None):
+    """LazyFrame do snapshot da tabela (na `versao` indicada ou na mais recente); nada é lido ainda."""
+    return pl.scan_delta(path, version=versao)
+
+
+def coletar(lf, linhas_por_lote=50_000):
+    """Executa a consulta no engine de streaming do Polars e devolve um DataFrame do pandas."""
+    with pl.Config(streaming_chunk_size=linhas_por_lote):
+        return lf.collect(engine='streaming').to_pandas()
+
+
+def _media_anual(lf, indicador, filtro=None):
+    """Média do indicador por distribuidora e ano (a mesma média dos KPIs de cada distribuidora)."""
+    if filtro is not None:
+        lf = lf.filter(filtro)
+    return lf.group_by(DISTRIBUIDORA.alias('Distribuidora'), pl.col('Ano').cast(pl.Int32)).agg(
+        pl.col(indicador).mean().alias('Media'))
+
+
+def ranking_nacional(lf, indicador, ano):
+    """Distribuidoras ordenadas pela média do indicador no `ano` (Ranking 1 = pior, maior média)."""
+    return (
+        _media_anual(lf, indicador, pl.col('Ano') == ano)
+        .with_columns(pl.col('Media').rank(method='ordinal', descending=True).cast(pl.Int32).alias('Ranking'))
+        .sort('Ranking')
+    )
+
+
+def faixas_percentis(lf, indicador, percentis=PERCENTIS_PADRAO):
+    """
+    Percentis, entre as distribuidoras, da média anual do indicador, uma linha por ano
+    (colunas P10, P25...). Mostra onde uma distribuidora fica em relação às demais.
+    """
+    return (
+        _media_anual(lf, indicador)
+        .group_by('Ano')
+        .agg([pl.col('Media').quantile(p, interpolation='linear').alias(f'P{round(p * 100)}') for p in percentis]
+             + [pl.len().alias('Distribuidoras')])
+        .sort('Ano')
+    )
+
+
+def series_distribuidoras(lf, indicador, distribuidoras):
+    """Média mensal do indicador para cada uma das `distribuidoras` (séries sobrepostas)."""
+    return (
+        lf.filter(DISTRIBUIDORA.is_in(list(distribuidoras)))
+        .group_by(DISTRIBUIDORA.alias('Distribuidora'), pl.col('Ano').cast(pl.Int32), pl.col('Mes').cast(pl.Int32))
+        .agg(pl.col(indicador).mean().alias('Media'))
+        .with_columns(pl.date(pl.col('Ano'), pl.col('Mes'), 1).alias('Data'))
+        .sort('Distribuidora', 'Data')
+        .select('Distribuidora', 'Data', 'Media')
+    )
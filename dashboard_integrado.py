@@ -1,59 +1,114 @@
 # dashboard_integrado.py
 import os
+import yaml
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from urllib.parse import unquote
+from agregados import CALCULOS, formato_longo, ler_agregado, versao_origem_agregados
+from cache_dados import CacheArrow
+from consultas import coletar, faixas_percentis, ranking_nacional, scan_tabela, series_distribuidoras
+from metricas import ColetorMetricas, Perfilador
+from previsoes import ajustar_previsao, ler_previsao, preparar_serie
+from tabela_delta import (COLUNAS_CATEGORICAS, COLUNAS_DASHBOARD, FORMATOS_EXPORTACAO, abrir_tabela,
+                          aplicar_esquema_compacto, construir_catalogo, exportar_distribuidora, ler_catalogo,
+                          ler_distribuidora, versao_atual, versao_dados)
 
 # --- Configurações da Página ---
 st.set_page_config(layout="wide", page_title="Análise Avançada de Continuidade - ANEEL")
 
+with open('config.yaml', 'r') as f:
+    config = yaml.safe_load(f)
+
+# O Streamlit reexecuta o script a cada interação: cada execução tem suas próprias métricas
+coletor = ColetorMetricas('dashboard')
+
 
 # --- Funções de Lógica e Carregamento de Dados ---
+# A versão da tabela é resolvida uma vez por execução do script: todas as leituras de uma renderização
+# usam o mesmo snapshot, e um commit do pipeline gravado no meio dela só aparece na execução seguinte.
+versao_execucao = config['dashboard']['table_version']
+if versao_execucao is None:
+    versao_execucao = versao_atual(config['paths']['processed_data'])
+
+
+def versao_em_uso():
+    """Versão da tabela processada exibida pelo dashboard (a fixada no config ou a mais recente)."""
+    return versao_execucao
+
+
 @st.cache_data
-def obter_lista_distribuidoras(path='dados_processados'):
+def versao_dados_em_uso(versao):
+    """Versão do último commit que alterou os dados, até a `versao` exibida (ignora manutenções)."""
+    return versao_dados(config['paths']['processed_data'], versao)
+
+
+@st.cache_resource
+def obter_cache_dados():
+    """Cache dos dados carregados, único no processo e compartilhado em disco com os demais processos."""
+    return CacheArrow(config['dashboard']['cache_dir'], config['dashboard']['cache_memory_mb'] * 1024 ** 2,
+                      config['dashboard']['cache_disk_mb'] * 1024 ** 2)
+
+
+@st.cache_data(max_entries=4)
+def obter_catalogo(path=config['paths']['processed_data'], versao=None):
     """
-    Usa os.walk para varrer a estrutura de diretórios e encontrar as pastas
-    de partição da distribuidora de forma explícita e robusta.
+    Lê o catálogo de partições publicado pelo pipeline junto com a tabela. Se ele não
+    existir ou for de outra versão, reconstrói o catálogo a partir do log da tabela Delta.
+    A `versao` faz parte da chave do cache: uma nova versão da tabela gera um novo catálogo.
     """
-    distribuidoras = set()
+    catalogo = ler_catalogo(path)
+    if catalogo is None or catalogo['versao'] != versao:
+        catalogo = construir_catalogo(abrir_tabela(path, versao))
+    return catalogo
+
+
+def particoes_distribuidora(catalogo, distribuidora):
+    return [p for p in catalogo['particoes'] if p['Distribuidora'] == distribuidora]
+
+
+def obter_lista_distribuidoras(path=config['paths']['processed_data']):
+    """Lista as distribuidoras do snapshot atual a partir do catálogo de partições."""
     try:
         if not os.path.isdir(path):
             st.error(f"A pasta '{path}' não foi encontrada. Execute o '1_processar_dados.py' primeiro.")
             return []
 
-        for root, dirs, files in os.walk(path):
-            for dirname in dirs:
-                if dirname.startswith('Distribuidora='):
-                    nome_bruto_codificado = dirname.split('=', 1)[1]
-                    nome_decodificado = unquote(nome_bruto_codificado)
-                    nome_limpo = nome_decodificado.strip()
-                    if nome_limpo:
-                        distribuidoras.add(nome_limpo)
+        distribuidoras = {particao['Distribuidora'] for particao in obter_catalogo(path, versao_em_uso())['particoes']}
 
         if not distribuidoras:
             st.warning(
                 "Nenhuma partição de distribuidora foi encontrada na pasta 'dados_processados'. Verifique se o pipeline foi executado corretamente.")
             return []
 
-        return sorted(list(distribuidoras))
+        return sorted(distribuidoras)
 
     except Exception as e:
-        st.error(f"Ocorreu um erro ao ler a estrutura de pastas em '{path}'. Detalhes: {e}")
+        st.error(f"Ocorreu um erro ao ler o catálogo da tabela em '{path}'. Detalhes: {e}")
         return []
 
 
-@st.cache_data
-def carregar_dados_distribuidora(distribuidora):
+def carregar_dados_distribuidora(distribuidora, colunas=tuple(COLUNAS_DASHBOARD), versao=None, etapa=None):
     """
     Carrega dados de uma distribuidora específica do Data Lakehouse (Delta/Parquet).
-    O filtro de partição torna esta operação extremamente rápida.
+    Os arquivos vêm do log da tabela Delta (na `versao` indicada ou na em uso),
+    podados pela partição da distribuidora e lidos apenas nas `colunas` necessárias.
+    O resultado fica no cache de dados, indexado pela versão dos dados da tabela.
     """
     try:
-        df = pd.read_parquet('dados_processados', filters=[('Distribuidora', '==', distribuidora)])
+        versao = versao if versao is not None else versao_em_uso()
+        chave = ('distribuidora', versao_dados_em_uso(versao), distribuidora, tuple(colunas or ()))
+        dados, origem = obter_cache_dados().obter(chave, lambda: ler_distribuidora(
+            abrir_tabela(config['paths']['processed_data'], versao), distribuidora,
+            list(colunas) if colunas else None))
+        if etapa is not None:
+            etapa.registrar(origem_cache=origem)
+        if dados is None:
+            return pd.DataFrame()
+        df = aplicar_esquema_compacto(
+            dados.to_pandas(categories=[col for col in COLUNAS_CATEGORICAS if col in dados.column_names]),
+            config['pipeline']['float32_indicators'])
         df['Data'] = pd.to_datetime(df['Ano'].astype(str) + '-' + df['Mes'].astype(str))
         return df
     except Exception as e:
@@ -61,258 +116,398 @@ def carregar_dados_distribuidora(distribuidora):
         return pd.DataFrame()
 
 
-# --- Layout da Aplicação ---
-st.sidebar.title("Navegação e Filtros")
-
-tipo_analise = st.sidebar.radio(
-    "Selecione o Tipo de Análise:",
-    ["Sobre o Projeto", "Visão Geral (KPIs)", "Análise de Conjuntos", "Séries Temporais e Previsões",
-     "Simulação de Cenário"]
-)
-
-if tipo_analise == "Sobre o Projeto":
-    st.title("💡 Sobre o Projeto de Análise de Indicadores da ANEEL")
-    st.markdown("---")
-
-    st.header("Transformando Dados Abertos em Insights Acionáveis")
-    st.markdown("""
-      Este projeto demonstra um fluxo completo de **Engenharia e Análise de Dados**, desde a coleta de dados brutos até a criação de um dashboard interativo. 
-      O objetivo é extrair valor estratégico dos dados públicos da ANEEL sobre a qualidade da energia elétrica no Brasil, aplicando as melhores práticas e ferramentas do mercado.
-      """)
-
-    st.markdown("---")
-    st.subheader("🏛️ Arquitetura e Boas Práticas Implementadas")
-
-    # Layout em colunas para os cards de features
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        with st.container(border=True):
-            st.markdown("##### ⚙️ Pipeline de Dados Híbrido")
-            st.write(
-                "Extração de dados de arquivos CSV locais e consumo em tempo real da API da ANEEL, unificando as fontes para uma visão completa.")
-
-    with col2:
-        with st.container(border=True):
-            st.markdown("##### ✅ Qualidade de Dados Garantida")
-            st.write(
-                "Uso da biblioteca **Pandera** para validar o esquema e a integridade dos dados, garantindo a confiabilidade de cada análise.")
-
-    with col3:
-        with st.container(border=True):
-            st.markdown("##### 🗄️ Data Lakehouse com Delta Lake")
-            st.write(
-                "Armazenamento dos dados em formato **Delta Lake**, que oferece transações ACID, performance e escalabilidade.")
-
-    col4, col5, col6 = st.columns(3)
-
-    with col4:
-        with st.container(border=True):
-            st.markdown("##### 🐳 Containerização com Docker")
-            st.write(
-                "A aplicação é empacotada em um contêiner **Docker**, garantindo reprodutibilidade e facilitando o deploy em qualquer ambiente.")
-
-    with col5:
-        with st.container(border=True):
-            st.markdown("##### 📊 Múltiplas Análises Avançadas")
-            st.write(
-                "O dashboard oferece desde KPIs e rankings até detecção de anomalias, previsão de séries temporais e simulação de cenários.")
-
-    with col6:
-        with st.container(border=True):
-            st.markdown("##### 🔧 Estrutura Profissional")
-            st.write(
-                "O projeto utiliza logging, gestão de configuração (`config.yaml`) e `requirements.txt` para ser robusto e fácil de manter.")
-
-    st.markdown("---")
-    st.subheader("🧭 Como Navegar no Dashboard")
-    st.markdown("""
-      1.  **Selecione uma Análise:** Use o menu na barra lateral à esquerda para escolher o que você quer explorar.
-      2.  **Aplique os Filtros:** Após escolher uma análise, a barra lateral mostrará os filtros de Distribuidora, Indicador e Ano.
-      3.  **Interaja com os Gráficos:** Passe o mouse sobre os gráficos para ver detalhes, use o zoom e explore os dados de forma dinâmica.
-      """)
-
-    st.markdown("---")
-
-    st.subheader("🔗 Links Úteis")
-    col_gh, col_li = st.columns(2)
-    with col_gh:
-        st.link_button("Ver o Código no GitHub", "https://github.com/RodrigoLuisRibeiro/dadosaneel")
-    with col_li:
-        st.link_button("Conectar no LinkedIn",
-                       "https://www.linkedin.com/in/rodrigo-luis-ribeiro-9b5837139/")  # (Sugestão, altere para seu link)
-
-
-else:
-    lista_distribuidoras = obter_lista_distribuidoras()
-    if lista_distribuidoras:
-        distribuidora_selecionada = st.sidebar.selectbox(
-            "Selecione a Distribuidora:", lista_distribuidoras,
-            index=lista_distribuidoras.index('CRELUZ-D') if 'CRELUZ-D' in lista_distribuidoras else 0
-        )
-        df_distribuidora = carregar_dados_distribuidora(distribuidora_selecionada)
-        if not df_distribuidora.empty:
-            indicadores_disponiveis = [col for col in ['DEC', 'FEC', 'DIC', 'FIC'] if
-                                       col in df_distribuidora.columns and df_distribuidora[col].sum() > 0]
+@st.cache_data(max_entries=64)  # Fatias pequenas, mas uma por tabela × distribuidora × indicador consultados
+def carregar_agregado(nome, distribuidora, indicador, versao_origem):
+    """Lê a fatia pré-calculada de uma tabela agregada (None se ela não estiver disponível)."""
+    return ler_agregado(config['paths']['aggregated_data'], nome, distribuidora, indicador)
+
+
+def obter_agregado(nome, distribuidora, indicador, df_distribuidora):
+    """
+    Consulta a tabela agregada se ela foi calculada a partir da versão da tabela em uso;
+    caso contrário, recalcula a agregação em memória a partir dos dados da distribuidora.
+    """
+    versao_origem = versao_origem_agregados(config['paths']['aggregated_data'])
+    if versao_origem is not None and versao_origem == versao_dados_em_uso(versao_em_uso()):
+        df_agregado = carregar_agregado(nome, distribuidora, indicador, versao_origem)
+        if df_agregado is not None:
+            return df_agregado
+    return CALCULOS[nome](formato_longo(df_distribuidora, [indicador]))
+
+
+@st.cache_data(max_entries=32)
+def carregar_previsao(distribuidora, indicador, versao, versao_previsoes):
+    """
+    Previsão gerada em lote pelo pipeline para esta versão da tabela (None se não houver).
+    A versão da tabela de previsões faz parte da chave do cache: um None guardado enquanto o
+    pipeline ainda ajustava os modelos deixa de valer quando as previsões são gravadas.
+    """
+    return ler_previsao(config['paths']['aggregated_data'], distribuidora, indicador, versao)
+
+
+def grafico_previsao(ts_data, df_previsao, indicador):
+    fig_forecast = go.Figure()
+    fig_forecast.add_trace(
+        go.Scatter(x=ts_data.index, y=ts_data.values, mode='lines', name='Histórico'))
+    fig_forecast.add_trace(
+        go.Scatter(x=df_previsao['Data'], y=df_previsao['Previsao'], mode='lines', name='Previsão',
+                   line=dict(dash='dash')))
+    fig_forecast.add_trace(
+        go.Scatter(x=df_previsao['Data'], y=df_previsao['LimiteInferior'], fill=None, mode='lines',
+                   line_color='rgba(255,255,255,0)', showlegend=False))
+    fig_forecast.add_trace(
+        go.Scatter(x=df_previsao['Data'], y=df_previsao['LimiteSuperior'], fill='tonexty',
+                   fillcolor='rgba(0,176,246,0.4)', mode='lines',
+                   line_color='rgba(255,255,255,0)', name='Intervalo de Confiança'))
+    fig_forecast.update_layout(
+        title=f"Histórico vs. Previsão SARIMAX para {indicador}",
+        xaxis_title="Data", yaxis_title=f"Valor do {indicador}")
+    return fig_forecast
+
+
+@st.cache_data(max_entries=32, ttl=24 * 3600)  # Resultados de versões antigas expiram mesmo sem novas consultas
+def consultar_nacional(consulta, versao, *argumentos):
+    """
+    Executa uma consulta entre distribuidoras (`ranking`, `percentis` ou `series`) sobre a
+    `versao` da tabela, em streaming a partir dos arquivos Delta.
+    """
+    lf = scan_tabela(config['paths']['processed_data'], versao)
+    consultas = {'ranking': ranking_nacional, 'percentis': faixas_percentis, 'series': series_distribuidoras}
+    return coletar(consultas[consulta](lf, *argumentos), config['dashboard']['scan_chunk_rows'])
+
+
+@st.cache_data(max_entries=16)
+def gerar_exportacao(distribuidora, versao, formato):
+    """Arquivo de exportação da distribuidora na `versao` da tabela, gerado a partir dos arquivos Delta."""
+    return exportar_distribuidora(abrir_tabela(config['paths']['processed_data'], versao), distribuidora, formato)
+
+
+@st.fragment(run_every=config['dashboard']['refresh_check_seconds'])
+def acompanhar_versao():
+    """Reexecuta o dashboard quando o pipeline grava uma nova versão da tabela (só os nomes do _delta_log são lidos)."""
+    if config['dashboard']['table_version'] is None and \
+            versao_atual(config['paths']['processed_data']) != versao_execucao:
+        st.rerun()
+    if versao_execucao is not None:
+        st.caption(f"Dados na versão {versao_execucao} da tabela.")
+
+
+def renderizar_visao(tipo_analise, etapa_visao):
+    """Desenha a visão escolhida na barra lateral; a `etapa_visao` recebe os filtros selecionados."""
+    if tipo_analise == "Sobre o Projeto":
+        st.title("💡 Sobre o Projeto de Análise de Indicadores da ANEEL")
+        st.markdown("---")
+
+        st.header("Transformando Dados Abertos em Insights Acionáveis")
+        st.markdown("""
+          Este projeto demonstra um fluxo completo de **Engenharia e Análise de Dados**, desde a coleta de dados brutos até a criação de um dashboard interativo. 
+          O objetivo é extrair valor estratégico dos dados públicos da ANEEL sobre a qualidade da energia elétrica no Brasil, aplicando as melhores práticas e ferramentas do mercado.
+          """)
+
+        st.markdown("---")
+        st.subheader("🏛️ Arquitetura e Boas Práticas Implementadas")
+
+        # Layout em colunas para os cards de features
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            with st.container(border=True):
+                st.markdown("##### ⚙️ Pipeline de Dados Híbrido")
+                st.write(
+                    "Extração de dados de arquivos CSV locais e consumo em tempo real da API da ANEEL, unificando as fontes para uma visão completa.")
+
+        with col2:
+            with st.container(border=True):
+                st.markdown("##### ✅ Qualidade de Dados Garantida")
+                st.write(
+                    "Uso da biblioteca **Pandera** para validar o esquema e a integridade dos dados, garantindo a confiabilidade de cada análise.")
+
+        with col3:
+            with st.container(border=True):
+                st.markdown("##### 🗄️ Data Lakehouse com Delta Lake")
+                st.write(
+                    "Armazenamento dos dados em formato **Delta Lake**, que oferece transações ACID, performance e escalabilidade.")
+
+        col4, col5, col6 = st.columns(3)
+
+        with col4:
+            with st.container(border=True):
+                st.markdown("##### 🐳 Containerização com Docker")
+                st.write(
+                    "A aplicação é empacotada em um contêiner **Docker**, garantindo reprodutibilidade e facilitando o deploy em qualquer ambiente.")
+
+        with col5:
+            with st.container(border=True):
+                st.markdown("##### 📊 Múltiplas Análises Avançadas")
+                st.write(
+                    "O dashboard oferece desde KPIs e rankings até detecção de anomalias, previsão de séries temporais e simulação de cenários.")
+
+        with col6:
+            with st.container(border=True):
+                st.markdown("##### 🔧 Estrutura Profissional")
+                st.write(
+                    "O projeto utiliza logging, gestão de configuração (`config.yaml`) e `requirements.txt` para ser robusto e fácil de manter.")
+
+        st.markdown("---")
+        st.subheader("🧭 Como Navegar no Dashboard")
+        st.markdown("""
+          1.  **Selecione uma Análise:** Use o menu na barra lateral à esquerda para escolher o que você quer explorar.
+          2.  **Aplique os Filtros:** Após escolher uma análise, a barra lateral mostrará os filtros de Distribuidora, Indicador e Ano.
+          3.  **Interaja com os Gráficos:** Passe o mouse sobre os gráficos para ver detalhes, use o zoom e explore os dados de forma dinâmica.
+          """)
+
+        st.markdown("---")
+
+        st.subheader("🔗 Links Úteis")
+        col_gh, col_li = st.columns(2)
+        with col_gh:
+            st.link_button("Ver o Código no GitHub", "https://github.com/RodrigoLuisRibeiro/dadosaneel")
+        with col_li:
+            st.link_button("Conectar no LinkedIn",
+                           "https://www.linkedin.com/in/rodrigo-luis-ribeiro-9b5837139/")  # (Sugestão, altere para seu link)
+
+
+    else:
+        with coletor.etapa('carregar_lista_distribuidoras') as etapa:
+            lista_distribuidoras = obter_lista_distribuidoras()
+            etapa.registrar(linhas_saida=len(lista_distribuidoras))
+        if lista_distribuidoras:
+            distribuidora_selecionada = st.sidebar.selectbox(
+                "Selecione a Distribuidora:", lista_distribuidoras,
+                index=lista_distribuidoras.index('CRELUZ-D') if 'CRELUZ-D' in lista_distribuidoras else 0
+            )
+            # Indicadores e anos vêm do catálogo, sem carregar os dados da distribuidora
+            particoes = particoes_distribuidora(obter_catalogo(versao=versao_em_uso()), distribuidora_selecionada)
+            indicadores_disponiveis = [ind for ind in ['DEC', 'FEC', 'DIC', 'FIC'] if
+                                       any(ind in particao['indicadores'] for particao in particoes)]
             indicador_selecionado = st.sidebar.selectbox("Selecione o Indicador:", indicadores_disponiveis)
-            anos_disponiveis = sorted(df_distribuidora['Ano'].unique(), reverse=True)
+            anos_disponiveis = sorted({particao['Ano'] for particao in particoes}, reverse=True)
             ano_selecionado = st.sidebar.selectbox("Selecione o Ano:", anos_disponiveis)
 
-            st.title(f"Dashboard ANEEL: {distribuidora_selecionada}")
-            st.subheader(f"{tipo_analise} - Indicador {indicador_selecionado}")
-            df_analise_ano = df_distribuidora[df_distribuidora['Ano'] == ano_selecionado].copy()
-
-            if tipo_analise == "Visão Geral (KPIs)":
-                st.markdown(f"### Desempenho em {ano_selecionado}")
-                valores_sem_zero = df_analise_ano[df_analise_ano[indicador_selecionado] > 0][indicador_selecionado]
-                melhor_valor = valores_sem_zero.min()
-                if pd.isna(melhor_valor):
-                    melhor_valor = 0.0
-
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Valor Médio", f"{df_analise_ano[indicador_selecionado].mean():.2f}")
-                col2.metric("Pior Valor (Máx)", f"{df_analise_ano[indicador_selecionado].max():.2f}")
-                col3.metric("Melhor Valor (Mín)", f"{melhor_valor:.2f}")
-
-                st.markdown("### Evolução Histórica do Indicador")
-                evolucao_anual = df_distribuidora.groupby('Ano')[indicador_selecionado].mean().reset_index()
-                fig = px.line(evolucao_anual, x='Ano', y=indicador_selecionado,
-                              title=f'Média Anual de {indicador_selecionado}', markers=True)
-                st.plotly_chart(fig, use_container_width=True)
-
-            elif tipo_analise == "Análise de Conjuntos":
-                ranking_piores = df_analise_ano.groupby(['NomConjunto', 'ConjuntoID'])[
-                    indicador_selecionado].mean().sort_values(ascending=False).reset_index()
-
-                st.markdown(f"### Piores Conjuntos em {ano_selecionado}")
-                fig_piores = px.bar(ranking_piores.head(20), x=indicador_selecionado, y='NomConjunto', orientation='h',
-                                    title=f"Top 20 Piores Conjuntos por {indicador_selecionado}",
-                                    labels={indicador_selecionado: f'Valor Médio de {indicador_selecionado}',
-                                            'NomConjunto': 'Conjunto'})
-                fig_piores.update_layout(yaxis={'categoryorder': 'total descending'}, height=500, margin=dict(l=300))
-                st.plotly_chart(fig_piores, use_container_width=True, key="piores_conjuntos_bar")
-
-                with st.expander("🔍 Análise de Anomalias Estatísticas"):
-                    st.info(
-                        "Esta análise destaca conjuntos cujo desempenho no ano selecionado foi estatisticamente incomum em comparação com seu próprio histórico.")
-                    stats_historico = df_distribuidora.groupby('ConjuntoID')[indicador_selecionado].agg(
-                        ['mean', 'std']).reset_index()
-                    stats_historico.rename(columns={'mean': 'MediaHistorica', 'std': 'DesvioPadraoHistorico'},
-                                           inplace=True)
-                    stats_historico = stats_historico.fillna(0)
-
-                    df_anomalia = pd.merge(df_analise_ano, stats_historico, on='ConjuntoID')
-                    epsilon = 1e-6
-                    df_anomalia['Z_Score'] = (df_anomalia[indicador_selecionado] - df_anomalia['MediaHistorica']) / (
-                                df_anomalia['DesvioPadraoHistorico'] + epsilon)
-
-                    anomalias = df_anomalia[df_anomalia['Z_Score'].abs() > 2.5].sort_values('Z_Score', ascending=False)
-                    if not anomalias.empty:
-                        st.write("Conjuntos com desempenho estatisticamente anômalo (pior ou melhor que sua média):")
-                        st.dataframe(anomalias[['NomConjunto', indicador_selecionado, 'MediaHistorica', 'Z_Score']])
-                    else:
-                        st.success("Nenhuma anomalia estatística significativa encontrada para o ano selecionado.")
-
-                st.markdown("### Comparação Histórica do Pior Conjunto")
-                if not ranking_piores.empty:
-                    pior_conjunto_nome = ranking_piores['NomConjunto'].iloc[0]
-                    pior_conjunto_id = ranking_piores['ConjuntoID'].iloc[0]
-                    st.write(
-                        f"Analisando a evolução para o pior conjunto de {ano_selecionado}: **{pior_conjunto_nome}**")
-                    df_pior_conjunto = df_distribuidora[df_distribuidora['ConjuntoID'] == pior_conjunto_id]
-                    evolucao_pior = df_pior_conjunto.groupby('Ano')[indicador_selecionado].mean().reset_index()
-                    fig2 = px.bar(evolucao_pior, x='Ano', y=indicador_selecionado,
-                                  title=f"Evolução Histórica de {indicador_selecionado} para {pior_conjunto_nome}")
-                    st.plotly_chart(fig2, use_container_width=True, key="pior_conjunto_hist")
-
-                st.markdown("---")
-                ranking_melhores = df_analise_ano.groupby(['NomConjunto', 'ConjuntoID'])[
-                    indicador_selecionado].mean().sort_values(ascending=True).reset_index()
-                st.markdown(f"### Melhores Conjuntos em {ano_selecionado}")
-                fig_melhores = px.bar(ranking_melhores.head(20), x=indicador_selecionado, y='NomConjunto',
-                                      orientation='h',
-                                      title=f"Top 20 Melhores Conjuntos por {indicador_selecionado}",
-                                      labels={indicador_selecionado: f'Valor Médio de {indicador_selecionado}',
-                                              'NomConjunto': 'Conjunto'})
-                fig_melhores.update_layout(yaxis={'categoryorder': 'total ascending'}, height=500, margin=dict(l=300))
-                st.plotly_chart(fig_melhores, use_container_width=True, key="melhores_conjuntos_bar")
-
-                st.markdown("### Comparação Histórica do Melhor Conjunto")
-                if not ranking_melhores.empty:
-                    melhor_conjunto_nome = ranking_melhores['NomConjunto'].iloc[0]
-                    melhor_conjunto_id = ranking_melhores['ConjuntoID'].iloc[0]
-                    st.write(
-                        f"Analisando a evolução para o melhor conjunto de {ano_selecionado}: **{melhor_conjunto_nome}**")
-                    df_melhor_conjunto = df_distribuidora[df_distribuidora['ConjuntoID'] == melhor_conjunto_id]
-                    evolucao_melhor = df_melhor_conjunto.groupby('Ano')[indicador_selecionado].mean().reset_index()
-                    fig_melhor2 = px.bar(evolucao_melhor, x='Ano', y=indicador_selecionado,
-                                         title=f"Evolução Histórica de {indicador_selecionado} para {melhor_conjunto_nome}")
-                    st.plotly_chart(fig_melhor2, use_container_width=True, key="melhor_conjunto_hist")
-
-                st.markdown("### Ranking Completo dos Conjuntos (Ordenado do Pior ao Melhor)")
-                st.dataframe(ranking_piores, use_container_width=True)
-
-            elif tipo_analise == "Séries Temporais e Previsões":
-                ts_data = df_distribuidora.groupby('Data')[indicador_selecionado].mean().resample('MS').asfreq()
-                ts_data.fillna(ts_data.mean(), inplace=True)
-                st.markdown("### Série Temporal Mensal Histórica")
-                fig_hist = px.line(ts_data, x=ts_data.index, y=ts_data.values, labels={'x': 'Data', 'y': 'Valor Médio'},
-                                   title=f"Média Mensal de {indicador_selecionado}")
-                st.plotly_chart(fig_hist, use_container_width=True)
-                st.markdown("### Previsões para os Próximos 12 Meses")
-                if len(ts_data.dropna()) < 24:
-                    st.warning(
-                        "Não há dados históricos suficientes (mínimo de 24 meses) para gerar uma previsão confiável.")
-                elif st.button("Gerar Previsões (Pode levar um minuto)"):
-                    try:
-                        with st.spinner("Treinando modelo SARIMAX e gerando previsão..."):
-                            model_sarimax = SARIMAX(ts_data, order=(1, 1, 1), seasonal_order=(1, 1, 1, 12),
-                                                    enforce_stationarity=False, enforce_invertibility=False)
-                            results = model_sarimax.fit(disp=False)
-                            forecast_object = results.get_forecast(steps=12)
-                            forecast_ci = forecast_object.conf_int()
-                            forecast_mean = forecast_object.predicted_mean
-                            fig_forecast = go.Figure()
-                            fig_forecast.add_trace(
-                                go.Scatter(x=ts_data.index, y=ts_data.values, mode='lines', name='Histórico'))
-                            fig_forecast.add_trace(
-                                go.Scatter(x=forecast_mean.index, y=forecast_mean.values, mode='lines', name='Previsão',
-                                           line=dict(dash='dash')))
-                            fig_forecast.add_trace(
-                                go.Scatter(x=forecast_ci.index, y=forecast_ci.iloc[:, 0], fill=None, mode='lines',
-                                           line_color='rgba(255,255,255,0)', showlegend=False))
-                            fig_forecast.add_trace(
-                                go.Scatter(x=forecast_ci.index, y=forecast_ci.iloc[:, 1], fill='tonexty',
-                                           fillcolor='rgba(0,176,246,0.4)', mode='lines',
-                                           line_color='rgba(255,255,255,0)', name='Intervalo de Confiança'))
-                            fig_forecast.update_layout(
-                                title=f"Histórico vs. Previsão SARIMAX para {indicador_selecionado}",
-                                xaxis_title="Data", yaxis_title=f"Valor do {indicador_selecionado}")
-                            st.plotly_chart(fig_forecast, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Ocorreu um erro ao gerar a previsão: {e}")
+            with coletor.etapa('carregar_dados_distribuidora', distribuidora=distribuidora_selecionada) as etapa:
+                df_distribuidora = carregar_dados_distribuidora(distribuidora_selecionada, etapa=etapa)
+                etapa.registrar(linhas_saida=len(df_distribuidora))
+            etapa_visao.registrar(distribuidora=distribuidora_selecionada, indicador=indicador_selecionado,
+                                  ano=ano_selecionado)
+            if not df_distribuidora.empty:
+
+                st.title(f"Dashboard ANEEL: {distribuidora_selecionada}")
+                st.subheader(f"{tipo_analise} - Indicador {indicador_selecionado}")
+                df_analise_ano = df_distribuidora[df_distribuidora['Ano'] == ano_selecionado].copy()
+
+                if tipo_analise == "Visão Geral (KPIs)":
+                    st.markdown(f"### Desempenho em {ano_selecionado}")
+                    df_anual = obter_agregado('anual', distribuidora_selecionada, indicador_selecionado, df_distribuidora)
+                    kpis_ano = df_anual[df_anual['Ano'] == ano_selecionado].iloc[0]
+
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Valor Médio", f"{kpis_ano['Media']:.2f}")
+                    col2.metric("Pior Valor (Máx)", f"{kpis_ano['Maximo']:.2f}")
+                    col3.metric("Melhor Valor (Mín)", f"{kpis_ano['MinimoPositivo']:.2f}")
+
+                    st.markdown("### Evolução Histórica do Indicador")
+                    evolucao_anual = df_anual.sort_values('Ano')[['Ano', 'Media']].rename(
+                        columns={'Media': indicador_selecionado})
+                    fig = px.line(evolucao_anual, x='Ano', y=indicador_selecionado,
+                                  title=f'Média Anual de {indicador_selecionado}', markers=True)
+                    st.plotly_chart(fig, use_container_width=True)
+
+                elif tipo_analise == "Análise de Conjuntos":
+                    df_conjuntos = obter_agregado('conjuntos_anual', distribuidora_selecionada, indicador_selecionado,
+                                                  df_distribuidora).rename(columns={'Media': indicador_selecionado})
+                    ranking_piores = df_conjuntos[df_conjuntos['Ano'] == ano_selecionado].sort_values('Ranking')[
+                        ['NomConjunto', 'ConjuntoID', indicador_selecionado]].reset_index(drop=True)
+
+                    st.markdown(f"### Piores Conjuntos em {ano_selecionado}")
+                    fig_piores = px.bar(ranking_piores.head(20), x=indicador_selecionado, y='NomConjunto', orientation='h',
+                                        title=f"Top 20 Piores Conjuntos por {indicador_selecionado}",
+                                        labels={indicador_selecionado: f'Valor Médio de {indicador_selecionado}',
+                                                'NomConjunto': 'Conjunto'})
+                    fig_piores.update_layout(yaxis={'categoryorder': 'total descending'}, height=500, margin=dict(l=300))
+                    st.plotly_chart(fig_piores, use_container_width=True, key="piores_conjuntos_bar")
+
+                    with st.expander("🔍 Análise de Anomalias Estatísticas"):
                         st.info(
-                            "Isso pode acontecer se os dados históricos não forem adequados para o modelo (ex: pouca variação, muitos zeros).")
+                            "Esta análise destaca conjuntos cujo desempenho no ano selecionado foi estatisticamente incomum em comparação com seu próprio histórico.")
+                        stats_historico = obter_agregado('conjuntos_historico', distribuidora_selecionada,
+                                                         indicador_selecionado, df_distribuidora)[
+                            ['ConjuntoID', 'MediaHistorica', 'DesvioPadraoHistorico']]
+
+                        df_anomalia = pd.merge(df_analise_ano, stats_historico, on='ConjuntoID')
+                        epsilon = 1e-6
+                        df_anomalia['Z_Score'] = (df_anomalia[indicador_selecionado] - df_anomalia['MediaHistorica']) / (
+                                    df_anomalia['DesvioPadraoHistorico'] + epsilon)
+
+                        anomalias = df_anomalia[df_anomalia['Z_Score'].abs() > 2.5].sort_values('Z_Score', ascending=False)
+                        if not anomalias.empty:
+                            st.write("Conjuntos com desempenho estatisticamente anômalo (pior ou melhor que sua média):")
+                            st.dataframe(anomalias[['NomConjunto', indicador_selecionado, 'MediaHistorica', 'Z_Score']])
+                        else:
+                            st.success("Nenhuma anomalia estatística significativa encontrada para o ano selecionado.")
+
+                    st.markdown("### Comparação Histórica do Pior Conjunto")
+                    if not ranking_piores.empty:
+                        pior_conjunto_nome = ranking_piores['NomConjunto'].iloc[0]
+                        pior_conjunto_id = ranking_piores['ConjuntoID'].iloc[0]
+                        st.write(
+                            f"Analisando a evolução para o pior conjunto de {ano_selecionado}: **{pior_conjunto_nome}**")
+                        evolucao_pior = df_conjuntos[df_conjuntos['ConjuntoID'] == pior_conjunto_id].sort_values('Ano')[
+                            ['Ano', indicador_selecionado]]
+                        fig2 = px.bar(evolucao_pior, x='Ano', y=indicador_selecionado,
+                                      title=f"Evolução Histórica de {indicador_selecionado} para {pior_conjunto_nome}")
+                        st.plotly_chart(fig2, use_container_width=True, key="pior_conjunto_hist")
+
+                    st.markdown("---")
+                    ranking_melhores = ranking_piores.iloc[::-1].reset_index(drop=True)
+                    st.markdown(f"### Melhores Conjuntos em {ano_selecionado}")
+                    fig_melhores = px.bar(ranking_melhores.head(20), x=indicador_selecionado, y='NomConjunto',
+                                          orientation='h',
+                                          title=f"Top 20 Melhores Conjuntos por {indicador_selecionado}",
+                                          labels={indicador_selecionado: f'Valor Médio de {indicador_selecionado}',
+                                                  'NomConjunto': 'Conjunto'})
+                    fig_melhores.update_layout(yaxis={'categoryorder': 'total ascending'}, height=500, margin=dict(l=300))
+                    st.plotly_chart(fig_melhores, use_container_width=True, key="melhores_conjuntos_bar")
+
+                    st.markdown("### Comparação Histórica do Melhor Conjunto")
+                    if not ranking_melhores.empty:
+                        melhor_conjunto_nome = ranking_melhores['NomConjunto'].iloc[0]
+                        melhor_conjunto_id = ranking_melhores['ConjuntoID'].iloc[0]
+                        st.write(
+                            f"Analisando a evolução para o melhor conjunto de {ano_selecionado}: **{melhor_conjunto_nome}**")
+                        evolucao_melhor = df_conjuntos[df_conjuntos['ConjuntoID'] == melhor_conjunto_id].sort_values(
+                            'Ano')[['Ano', indicador_selecionado]]
+                        fig_melhor2 = px.bar(evolucao_melhor, x='Ano', y=indicador_selecionado,
+                                             title=f"Evolução Histórica de {indicador_selecionado} para {melhor_conjunto_nome}")
+                        st.plotly_chart(fig_melhor2, use_container_width=True, key="melhor_conjunto_hist")
+
+                    st.markdown("### Ranking Completo dos Conjuntos (Ordenado do Pior ao Melhor)")
+                    st.dataframe(ranking_piores, use_container_width=True)
+
+                elif tipo_analise == "Séries Temporais e Previsões":
+                    df_mensal = obter_agregado('mensal', distribuidora_selecionada, indicador_selecionado, df_distribuidora)
+                    ts_data = preparar_serie(df_mensal).rename(indicador_selecionado)
+                    st.markdown("### Série Temporal Mensal Histórica")
+                    fig_hist = px.line(ts_data, x=ts_data.index, y=ts_data.values, labels={'x': 'Data', 'y': 'Valor Médio'},
+                                       title=f"Média Mensal de {indicador_selecionado}")
+                    st.plotly_chart(fig_hist, use_container_width=True)
+                    st.markdown("### Previsões para os Próximos 12 Meses")
+                    df_previsao = carregar_previsao(
+                        distribuidora_selecionada, indicador_selecionado, versao_dados_em_uso(versao_em_uso()),
+                        versao_atual(os.path.join(config['paths']['aggregated_data'], 'previsoes')))
+                    if df_previsao is not None:
+                        st.caption("Previsão pré-calculada pelo pipeline para a versão atual dos dados.")
+                        st.plotly_chart(grafico_previsao(ts_data, df_previsao, indicador_selecionado),
+                                        use_container_width=True)
+                    elif len(ts_data.dropna()) < 24:
+                        st.warning(
+                            "Não há dados históricos suficientes (mínimo de 24 meses) para gerar uma previsão confiável.")
+                    elif st.button("Gerar Previsões (Pode levar um minuto)"):
+                        try:
+                            with st.spinner("Treinando modelo SARIMAX e gerando previsão..."):
+                                df_previsao, _ = ajustar_previsao(ts_data)
+                                st.plotly_chart(grafico_previsao(ts_data, df_previsao, indicador_selecionado),
+                                                use_container_width=True)
+                        except Exception as e:
+                            st.error(f"Ocorreu um erro ao gerar a previsão: {e}")
+                            st.info(
+                                "Isso pode acontecer se os dados históricos não forem adequados para o modelo (ex: pouca variação, muitos zeros).")
+
+                elif tipo_analise == "Simulação de Cenário":
+                    st.markdown("### Análise de Cenário 'What-if'")
+                    st.write(
+                        "Insira um valor para o indicador e veja qual seria sua posição em relação aos dados históricos da distribuidora.")
+                    valor_simulado = st.number_input(f"Insira um valor para {indicador_selecionado}:",
+                                                     value=float(df_distribuidora[indicador_selecionado].mean()), step=1.0,
+                                                     format="%.2f")
+                    if st.button("Analisar Cenário"):
+                        valores_historicos = df_distribuidora[indicador_selecionado].dropna()
+                        percentil = (valores_historicos < valor_simulado).mean() * 100
+                        st.success(
+                            f"Um valor de **{valor_simulado:.2f}** seria melhor que **{percentil:.2f}%** dos registros históricos para esta distribuidora.")
+
+                elif tipo_analise == "Comparação Nacional":
+                    versao_tabela = versao_em_uso()
+                    with coletor.etapa('consulta_nacional') as etapa:
+                        df_ranking = consultar_nacional('ranking', versao_tabela, indicador_selecionado, ano_selecionado)
+                        df_percentis = consultar_nacional('percentis', versao_tabela, indicador_selecionado)
+                        etapa.registrar(linhas_saida=len(df_ranking) + len(df_percentis))
+
+                    st.markdown(f"### Ranking Nacional de {indicador_selecionado} em {ano_selecionado}")
+                    posicao = df_ranking.loc[df_ranking['Distribuidora'] == distribuidora_selecionada, 'Ranking']
+                    if not posicao.empty:
+                        st.metric(f"Posição de {distribuidora_selecionada} (1 = pior)",
+                                  f"{posicao.iloc[0]}º de {len(df_ranking)}")
+                    df_ranking['Destaque'] = np.where(df_ranking['Distribuidora'] == distribuidora_selecionada,
+                                                      distribuidora_selecionada, 'Demais distribuidoras')
+                    fig_ranking = px.bar(df_ranking.head(30), x='Media', y='Distribuidora', orientation='h',
+                                         color='Destaque', title=f"30 Piores Distribuidoras por {indicador_selecionado}",
+                                         labels={'Media': f'Valor Médio de {indicador_selecionado}'})
+                    fig_ranking.update_layout(yaxis={'categoryorder': 'total ascending'}, height=700)
+                    st.plotly_chart(fig_ranking, use_container_width=True, key="ranking_nacional_bar")
+
+                    st.markdown("### Faixas de Percentis entre as Distribuidoras")
+                    df_anual = obter_agregado('anual', distribuidora_selecionada, indicador_selecionado, df_distribuidora)
+                    fig_faixas = go.Figure()
+                    for inferior, superior, opacidade in [('P10', 'P90', 0.15), ('P25', 'P75', 0.3)]:
+                        fig_faixas.add_trace(go.Scatter(x=df_percentis['Ano'], y=df_percentis[inferior], mode='lines',
+                                                        line_color='rgba(0,0,0,0)', showlegend=False))
+                        fig_faixas.add_trace(go.Scatter(x=df_percentis['Ano'], y=df_percentis[superior], mode='lines',
+                                                        fill='tonexty', fillcolor=f'rgba(0,176,246,{opacidade})',
+                                                        line_color='rgba(0,0,0,0)', name=f'{inferior}–{superior}'))
+                    fig_faixas.add_trace(go.Scatter(x=df_percentis['Ano'], y=df_percentis['P50'], mode='lines',
+                                                    name='Mediana nacional', line=dict(dash='dash')))
+                    evolucao_anual = df_anual.sort_values('Ano')
+                    fig_faixas.add_trace(go.Scatter(x=evolucao_anual['Ano'], y=evolucao_anual['Media'],
+                                                    mode='lines+markers', name=distribuidora_selecionada))
+                    fig_faixas.update_layout(title=f"Média Anual de {indicador_selecionado} em Relação às Demais",
+                                             xaxis_title="Ano", yaxis_title=f"Valor Médio de {indicador_selecionado}")
+                    st.plotly_chart(fig_faixas, use_container_width=True, key="faixas_percentis")
+
+                    st.markdown("### Comparação entre Distribuidoras")
+                    distribuidoras_comparadas = st.multiselect(
+                        "Distribuidoras para comparar:", lista_distribuidoras, default=[distribuidora_selecionada],
+                        max_selections=config['dashboard']['max_overlay_distributors'])
+                    if distribuidoras_comparadas:
+                        df_series = consultar_nacional('series', versao_tabela, indicador_selecionado,
+                                                       tuple(distribuidoras_comparadas))
+                        fig_series = px.line(df_series, x='Data', y='Media', color='Distribuidora',
+                                             title=f"Média Mensal de {indicador_selecionado}",
+                                             labels={'Media': f'Valor Médio de {indicador_selecionado}'})
+                        st.plotly_chart(fig_series, use_container_width=True, key="series_comparadas")
+
+                st.sidebar.markdown("---")
+                st.sidebar.subheader("Exportar Dados")
+                formato_exportacao = st.sidebar.radio("Formato do arquivo:", list(FORMATOS_EXPORTACAO),
+                                                      format_func=str.upper, horizontal=True)
+                versao_exportacao = versao_em_uso()
+                # O arquivo só é gerado quando o botão é clicado (e fica em cache por versão e formato)
+                st.sidebar.download_button(
+                    label=f"Baixar dados da distribuidora (.{formato_exportacao})",
+                    data=lambda: gerar_exportacao(distribuidora_selecionada, versao_exportacao, formato_exportacao),
+                    file_name=f"{distribuidora_selecionada}_dados_completos.{formato_exportacao}",
+                    mime=FORMATOS_EXPORTACAO[formato_exportacao],
+                )
 
-            elif tipo_analise == "Simulação de Cenário":
-                st.markdown("### Análise de Cenário 'What-if'")
-                st.write(
-                    "Insira um valor para o indicador e veja qual seria sua posição em relação aos dados históricos da distribuidora.")
-                valor_simulado = st.number_input(f"Insira um valor para {indicador_selecionado}:",
-                                                 value=float(df_distribuidora[indicador_selecionado].mean()), step=1.0,
-                                                 format="%.2f")
-                if st.button("Analisar Cenário"):
-                    valores_historicos = df_distribuidora[indicador_selecionado].dropna()
-                    percentil = (valores_historicos < valor_simulado).mean() * 100
-                    st.success(
-                        f"Um valor de **{valor_simulado:.2f}** seria melhor que **{percentil:.2f}%** dos registros históricos para esta distribuidora.")
-
-            st.sidebar.markdown("---")
-            st.sidebar.subheader("Exportar Dados")
-            csv = df_distribuidora.to_csv(index=False).encode('utf-8')
-            st.sidebar.download_button(
-                label="Baixar dados da distribuidora (.csv)",
-                data=csv,
-                file_name=f"{distribuidora_selecionada}_dados_completos.csv",
-                mime='text/csv',
-            )
\ No newline at end of file
+
+# --- Layout da Aplicação ---
+# O perfilador e a etapa da visão são encerrados mesmo se a execução for interrompida por um erro
+# ou por um st.rerun/st.stop (que o Streamlit implementa com exceções)
+perfilador = Perfilador(config['metrics']['profiler'], f"logs/perfil_dashboard_{coletor.execucao}").iniciar()
+try:
+    st.sidebar.title("Navegação e Filtros")
+    with st.sidebar:
+        acompanhar_versao()
+
+    tipo_analise = st.sidebar.radio(
+        "Selecione o Tipo de Análise:",
+        ["Sobre o Projeto", "Visão Geral (KPIs)", "Análise de Conjuntos", "Séries Temporais e Previsões",
+         "Simulação de Cenário", "Comparação Nacional"]
+    )
+
+    with coletor.etapa('visao', visao=tipo_analise) as etapa_visao:
+        renderizar_visao(tipo_analise, etapa_visao)
+finally:
+    # --- Métricas da execução ---
+    if config['metrics']['enabled']:
+        coletor.gravar_jsonl(config['metrics']['dashboard_jsonl'])
+    perfilador.encerrar()
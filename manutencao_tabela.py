@@ -0,0 +1,145 @@
+# manutencao_tabela.py
+"""
+Manutenção da tabela Delta de dados processados.
+
+1. Normaliza as chaves de partição: nomes de distribuidora com espaços nas bordas (de
+   gravações antigas) são corrigidos reescrevendo a tabela ordenada por ConjuntoID/Ano/Mes.
+2. Compacta os arquivos pequenos de cada partição (opcionalmente agrupando os dados por
+   ConjuntoID e Mes com Z-order, o que reescreve todas as partições).
+3. Remove (vacuum) os arquivos que não são mais referenciados pelo _delta_log.
+
+Pode ser executado diretamente (`python manutencao_tabela.py`) ou como etapa opcional
+do pipeline (`maintenance.run_after_pipeline` no config.yaml).
+"""
+import argparse
+import logging
+import os
+from functools import reduce
+import pyarrow as pa
+import pyarrow.compute as pc
+import yaml
+from deltalake import CommitProperties, DeltaTable
+from deltalake.writer import write_deltalake
+from tabela_delta import CHAVES_REGISTRO, METADADO_MANUTENCAO, construir_catalogo, salvar_catalogo
+
+# Commits de compactação e vacuum não alteram o conteúdo da tabela (ver tabela_delta.versao_dados).
+# A normalização das partições altera (nomes aparados, duplicatas removidas) e não usa esta marca.
+METADADOS_MANUTENCAO = {METADADO_MANUTENCAO: 'true'}
+
+
+def inventario_arquivos(path):
+    """Arquivos Parquet no disco e arquivos ativos no snapshot atual, com seus tamanhos."""
+    arquivos_disco, bytes_disco = 0, 0
+    for raiz, _, arquivos in os.walk(path):
+        if '_delta_log' in raiz:
+            continue
+        for nome in arquivos:
+            if nome.endswith('.parquet'):
+                arquivos_disco += 1
+                bytes_disco += os.path.getsize(os.path.join(raiz, nome))
+    acoes = pa.table(DeltaTable(path).get_add_actions(flatten=True))
+    return {
+        'arquivos_disco': arquivos_disco, 'bytes_disco': bytes_disco,
+        'arquivos_ativos': acoes.num_rows, 'bytes_ativos': pc.sum(acoes['size_bytes']).as_py() or 0,
+    }
+
+
+def normalizar_particoes(path):
+    """
+    Reescreve a tabela se algum valor de partição de Distribuidora tiver espaços nas bordas.
+    Uma chave presente tanto na partição antiga quanto na já normalizada (gravada depois)
+    fica só com a linha da partição normalizada. Aproveita a reescrita para ordenar os dados
+    e descartar a coluna de índice do pandas. Retorna True se a tabela foi reescrita.
+    O commit conta como alteração dos dados (gera uma nova `versao_dados`), para que caches,
+    agregados e previsões derivados da versão anterior sejam recalculados.
+    """
+    tabela = DeltaTable(path)
+    valores = {particao['Distribuidora'] for particao in tabela.partitions() if particao.get('Distribuidora')}
+    if all(valor == valor.strip() for valor in valores):
+        logging.info("As chaves de partição já estão normalizadas.")
+        return False
+    logging.info(f"Normalizando {sum(valor != valor.strip() for valor in valores)} nomes de distribuidora "
+                 f"com espaços nas bordas...")
+    dados = tabela.to_pyarrow_table()
+    if '__index_level_0__' in dados.column_names:
+        dados = dados.drop_columns(['__index_level_0__'])
+    indice = dados.column_names.index('Distribuidora')
+    aparada = pc.utf8_trim_whitespace(dados['Distribuidora'])
+    dados = dados.set_column(indice, 'Distribuidora', aparada).append_column(
+        '_normalizada', pc.equal(dados['Distribuidora'], aparada))
+    # Em cada chave, a linha da partição já normalizada fica por último e é a mantida
+    dados = dados.sort_by([(col, 'ascending') for col in CHAVES_REGISTRO] + [('_normalizada', 'ascending')])
+    dados = _manter_ultima_por_chave(dados).drop_columns(['_normalizada'])
+    write_deltalake(path, dados, mode='overwrite', partition_by=tabela.metadata().partition_columns,
+                    schema_mode='overwrite')
+    return True
+
+
+def _manter_ultima_por_chave(dados):
+    """Mantém a última linha de cada `CHAVES_REGISTRO` em uma tabela já ordenada pelas chaves."""
+    if dados.num_rows < 2:
+        return dados
+    igual_proxima = reduce(pc.and_, [pc.equal(dados[col][:-1], dados[col][1:]) for col in CHAVES_REGISTRO])
+    manter = pa.concat_arrays([pc.invert(pc.fill_null(igual_proxima, False)).combine_chunks(), pa.array([True])])
+    descartadas = dados.num_rows - pc.sum(manter).as_py()
+    if descartadas:
+        logging.info(f"{descartadas:,} linhas duplicadas entre partições antigas e normalizadas foram descartadas.")
+    return dados.filter(manter)
+
+
+def _remover_pastas_vazias(path):
+    for raiz, pastas, arquivos in os.walk(path, topdown=False):
+        if raiz != path and '_delta_log' not in raiz and not os.listdir(raiz):
+            os.rmdir(raiz)
+
+
+def executar_manutencao(path, retencao_horas=168, tamanho_alvo_mb=128, z_order=False):
+    """Executa normalização, compactação e vacuum, registrando e devolvendo o antes/depois."""
+    antes = inventario_arquivos(path)
+    logging.info(f"Antes da manutenção: {antes}")
+
+    normalizar_particoes(path)
+
+    tabela = DeltaTable(path)
+    opcoes = dict(target_size=tamanho_alvo_mb * 1024 * 1024,
+                  commit_properties=CommitProperties(custom_metadata=METADADOS_MANUTENCAO))
+    if z_order:
+        metricas = tabela.optimize.z_order(['ConjuntoID', 'Mes'], **opcoes)
+    else:
+        metricas = tabela.optimize.compact(**opcoes)
+    logging.info(f"Compactação: {metricas.get('numFilesRemoved', 0)} arquivos removidos, "
+                 f"{metricas.get('numFilesAdded', 0)} adicionados.")
+
+    # 'full' também remove arquivos órfãos que nunca entraram no log
+    removidos = DeltaTable(path).vacuum(retention_hours=retencao_horas, dry_run=False,
+                                        enforce_retention_duration=False, full=True)
+    _remover_pastas_vazias(path)
+    logging.info(f"Vacuum: {len(removidos)} arquivos não referenciados removidos "
+                 f"(retenção de {retencao_horas} horas).")
+
+    depois = inventario_arquivos(path)
+    logging.info(f"Depois da manutenção: {depois}")
+    return {'antes': antes, 'depois': depois}
+
+
+if __name__ == "__main__":
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    parser = argparse.ArgumentParser(description="Manutenção da tabela Delta de dados processados.")
+    parser.add_argument('--retencao-horas', type=int, default=config['maintenance']['retention_hours'],
+                        help="Idade mínima dos arquivos não referenciados para serem removidos.")
+    parser.add_argument('--tamanho-alvo-mb', type=int, default=config['maintenance']['target_file_size_mb'],
+                        help="Tamanho desejado dos arquivos após a compactação.")
+    parser.add_argument('--z-order', action='store_true', default=config['maintenance']['z_order'],
+                        help="Agrupa os dados de cada partição por ConjuntoID e Mes (reescreve todas as partições).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    path_dados_processados = config['paths']['processed_data']
+    relatorio = executar_manutencao(path_dados_processados, args.retencao_horas, args.tamanho_alvo_mb,
+                                    args.z_order)
+
+    salvar_catalogo(path_dados_processados, construir_catalogo(DeltaTable(path_dados_processados)))
+    print(f"Arquivos no disco: {relatorio['antes']['arquivos_disco']} -> {relatorio['depois']['arquivos_disco']} "
+          f"({relatorio['antes']['bytes_disco'] / 1e6:.1f} MB -> {relatorio['depois']['bytes_disco'] / 1e6:.1f} MB)")
+    print(f"Arquivos ativos: {relatorio['antes']['arquivos_ativos']} -> {relatorio['depois']['arquivos_ativos']}")
@@ -0,0 +1,240 @@
+# metricas.py
+# Métricas estruturadas por etapa (tempo, CPU, memória e volumes) do pipeline e do dashboard,
+# exportadas em JSON lines e no formato textfile do Prometheus, e perfilamento opcional.
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Descrição das métricas numéricas conhecidas (usada no HELP do Prometheus)
+DESCRICOES = {
+    'duracao_segundos': "Tempo de parede da etapa.",
+    'cpu_segundos': "Tempo de CPU da etapa (processo principal e processos filhos encerrados).",
+    'pico_rss_bytes': "Maior memória residente do processo observada durante a etapa.",
+    'linhas_entrada': "Linhas recebidas pela etapa.",
+    'linhas_saida': "Linhas produzidas pela etapa.",
+    'bytes_lidos': "Bytes lidos do disco ou da rede.",
+    'bytes_gravados': "Bytes gravados em disco.",
+    'arquivos_processados': "Arquivos processados.",
+    'arquivos_reaproveitados': "Arquivos reaproveitados do cache.",
+    'paginas_api': "Páginas baixadas da API.",
+    'paginas_reaproveitadas': "Páginas da API reaproveitadas do checkpoint.",
+    'requisicoes_api': "Requisições HTTP feitas à API.",
+    'retentativas_api': "Novas tentativas de requisições à API.",
+    'falhas_api': "Páginas da API que falharam.",
+    'respostas_cache': "Respostas da API servidas pelo cache HTTP (304 ou modo offline).",
+    'falhas_validacao': "Casos de falha encontrados na validação.",
+    'particoes': "Partições processadas pelo executor por partições.",
+}
+# Métricas de pico são combinadas pelo máximo; as demais são somadas quando a etapa se repete
+METRICAS_PICO = {'pico_rss_bytes'}
+INTERVALO_AMOSTRAGEM_RSS = 0.05
+
+
+def _rss_atual():
+    """Memória residente atual do processo (Linux); None onde /proc não está disponível."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _pico_rss_processo():
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+def _cpu_filhos():
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return uso.ru_utime + uso.ru_stime
+
+
+class _MonitorRSS(threading.Thread):
+    """Amostra a memória residente em segundo plano para obter o pico dentro de uma etapa."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pico = _rss_atual() or 0
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(INTERVALO_AMOSTRAGEM_RSS):
+            self.pico = max(self.pico, _rss_atual() or 0)
+
+    def encerrar(self):
+        self._parar.set()
+        self.join()
+        return max(self.pico, _rss_atual() or 0)
+
+
+class Etapa:
+    """
+    Mede uma etapa do início ao `encerrar` (ou ao sair do bloco `with`). Contagens da etapa
+    (linhas, bytes, páginas...) são informadas com `registrar`, e uma etapa interrompida sem
+    exceção pode ser marcada com `status`. No bloco `with`, uma exceção marca a etapa como
+    'erro', e uma interrupção (KeyboardInterrupt, st.rerun/st.stop do Streamlit) como 'interrompida'.
+    """
+
+    STATUS_FALHA = ('erro', 'falhou', 'interrompida')  # Os demais ('ok', 'sem_alteracao'...) contam como sucesso
+
+    def __init__(self, coletor, nome, atributos):
+        self.coletor = coletor
+        self.nome = nome
+        self.atributos = atributos
+        self.valores = {}
+        self.status = 'ok'
+        self._monitor = _MonitorRSS() if _rss_atual() is not None else None
+        if self._monitor:
+            self._monitor.start()
+        self._inicio = time.perf_counter()
+        self._inicio_cpu = time.process_time() + _cpu_filhos()
+
+    def registrar(self, **valores):
+        self.valores.update(valores)
+
+    def encerrar(self, status=None):
+        duracao = time.perf_counter() - self._inicio
+        cpu = time.process_time() + _cpu_filhos() - self._inicio_cpu
+        pico_rss = self._monitor.encerrar() if self._monitor else _pico_rss_processo()
+        inicio = datetime.fromtimestamp(time.time() - duracao).isoformat(timespec='milliseconds')
+        self.coletor.adicionar({
+            'execucao': self.coletor.execucao, 'componente': self.coletor.componente, 'etapa': self.nome,
+            'status': status or self.status, 'inicio': inicio,
+            'duracao_segundos': round(duracao, 4), 'cpu_segundos': round(cpu, 4), 'pico_rss_bytes': pico_rss,
+            **self.valores, **self.atributos,
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        if tipo_excecao is None:
+            self.encerrar()
+        else:
+            self.encerrar('erro' if issubclass(tipo_excecao, Exception) else 'interrompida')
+        return False
+
+
+class ColetorMetricas:
+    """Acumula as métricas das etapas de uma execução (do pipeline ou de um render do dashboard)."""
+
+    def __init__(self, componente):
+        self.componente = componente
+        self._trava = threading.Lock()
+        self.nova_execucao()
+
+    def nova_execucao(self):
+        self.execucao = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.registros = []
+
+    def etapa(self, nome, **atributos):
+        return Etapa(self, nome, atributos)
+
+    def adicionar(self, registro):
+        with self._trava:
+            self.registros.append(registro)
+
+    def gravar_jsonl(self, caminho):
+        """Acrescenta uma linha JSON por etapa ao arquivo."""
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        with open(caminho, 'a', encoding='utf-8') as f:
+            for registro in self.registros:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+
+    def gravar_prometheus(self, caminho, prefixo):
+        """
+        Grava as métricas da execução no formato textfile do Prometheus (lido pelo textfile
+        collector do node_exporter), de forma atômica para que o coletor nunca leia pela metade.
+        """
+        por_etapa = {}
+        for registro in self.registros:
+            acumulado = por_etapa.setdefault(registro['etapa'], {'sucesso': 1})
+            acumulado['sucesso'] &= int(registro['status'] not in Etapa.STATUS_FALHA)
+            for chave, valor in registro.items():
+                if chave in DESCRICOES and isinstance(valor, (int, float)):
+                    acumulado[chave] = max(acumulado.get(chave, 0), valor) if chave in METRICAS_PICO \
+                        else acumulado.get(chave, 0) + valor
+
+        linhas = []
+        for chave, descricao in {**DESCRICOES, 'sucesso': "1 se a etapa terminou sem erro."}.items():
+            amostras = [(etapa, valores[chave]) for etapa, valores in por_etapa.items() if chave in valores]
+            if not amostras:
+                continue
+            nome = f"{prefixo}_etapa_{chave}"
+            linhas += [f"# HELP {nome} {descricao}", f"# TYPE {nome} gauge"]
+            linhas += [f'{nome}{{etapa="{etapa}"}} {valor}' for etapa, valor in amostras]
+        linhas += [f"# HELP {prefixo}_ultima_execucao_timestamp_segundos Fim da última execução (epoch).",
+                   f"# TYPE {prefixo}_ultima_execucao_timestamp_segundos gauge",
+                   f"{prefixo}_ultima_execucao_timestamp_segundos {time.time():.0f}"]
+
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        caminho_temporario = caminho + '.tmp'
+        with open(caminho_temporario, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(linhas) + '\n')
+        os.replace(caminho_temporario, caminho)
+
+
+class Perfilador:
+    """
+    Perfila o código entre `iniciar` e `encerrar` com o cProfile ou, se instalado, o pyinstrument,
+    gravando o relatório em `prefixo_saida` + extensão. Com `modo` None não faz nada.
+    """
+
+    def __init__(self, modo, prefixo_saida):
+        self.modo = modo
+        self.prefixo_saida = prefixo_saida
+        self._perfil = None
+        if modo == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                self._perfil = Profiler()
+            except ImportError:
+                logging.warning("pyinstrument não está instalado; usando o cProfile no perfilamento.")
+                self.modo = 'cprofile'
+        if self.modo == 'cprofile':
+            self._perfil = cProfile.Profile()
+        elif self.modo not in (None, 'pyinstrument'):
+            raise ValueError(f"Modo de perfilamento desconhecido: {modo} (use 'cprofile' ou 'pyinstrument').")
+
+    def iniciar(self):
+        if self._perfil is not None:
+            self._perfil.start() if self.modo == 'pyinstrument' else self._perfil.enable()
+        return self
+
+    def encerrar(self):
+        if self._perfil is None:
+            return None
+        os.makedirs(os.path.dirname(self.prefixo_saida) or '.', exist_ok=True)
+        if self.modo == 'pyinstrument':
+            self._perfil.stop()
+            caminho = self.prefixo_saida + '.html'
+            with open(caminho, 'w', encoding='utf-8') as f:
+                f.write(self._perfil.output_html())
+        else:
+            self._perfil.disable()
+            self._perfil.dump_stats(self.prefixo_saida + '.prof')
+            caminho = self.prefixo_saida + '.txt'
+            texto = io.StringIO()
+            pstats.Stats(self._perfil, stream=texto).sort_stats('cumulative').print_stats(50)
+            with open(caminho, 'w', encoding='utf-8') as f:
+                f.write(texto.getvalue())
+        self._perfil = None
+        logging.info(f"Relatório de perfilamento gravado em '{caminho}'.")
+        return caminho
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        self.encerrar()
+        return False
@@ -0,0 +1,151 @@
+# previsoes.py
+"""
+Previsões SARIMAX em lote para todas as séries distribuidora × indicador.
+
+O pipeline ajusta os modelos em paralelo (um processo por série) a partir da tabela
+agregada mensal e grava as previsões com seus intervalos de confiança, junto com a versão
+da tabela processada que as originou. Os parâmetros ajustados também são guardados e
+usados como ponto de partida (warm start) na execução seguinte.
+"""
+import logging
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from deltalake import DeltaTable
+from deltalake.writer import write_deltalake
+from tabela_delta import dataset_snapshot
+
+ORDEM = (1, 1, 1)
+ORDEM_SAZONAL = (1, 1, 1, 12)
+MINIMO_MESES = 24  # Histórico mínimo para uma previsão confiável
+
+
+def preparar_serie(df_mensal):
+    """Série mensal contínua (meses faltantes preenchidos com a média), como usada pelo modelo."""
+    serie = df_mensal.set_index('Data').sort_index()['Media'].resample('MS').asfreq()
+    return serie.fillna(serie.mean())
+
+
+def _sarimax():
+    # O statsmodels leva mais de um segundo para importar: só é carregado quando um modelo é
+    # ajustado, e não ao abrir o dashboard ou rodar o pipeline sem previsões
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    return SARIMAX
+
+
+def ajustar_previsao(serie, passos=12, parametros_iniciais=None):
+    """
+    Ajusta o SARIMAX e devolve (previsões, parâmetros). As previsões têm as colunas
+    Data, Previsao, LimiteInferior e LimiteSuperior.
+    """
+    modelo = _sarimax()(serie, order=ORDEM, seasonal_order=ORDEM_SAZONAL,
+                     enforce_stationarity=False, enforce_invertibility=False)
+    if parametros_iniciais is not None and len(parametros_iniciais) != len(modelo.start_params):
+        parametros_iniciais = None
+    resultado = modelo.fit(start_params=parametros_iniciais, disp=False)
+    previsao = resultado.get_forecast(steps=passos)
+    intervalo = previsao.conf_int()
+    df_previsao = pd.DataFrame({
+        'Data': previsao.predicted_mean.index,
+        'Previsao': previsao.predicted_mean.values,
+        'LimiteInferior': intervalo.iloc[:, 0].values,
+        'LimiteSuperior': intervalo.iloc[:, 1].values,
+    })
+    return df_previsao, np.asarray(resultado.params, dtype=float).tolist()
+
+
+def _ajustar_serie(distribuidora, indicador, serie, passos, parametros_iniciais):
+    """Tarefa executada em cada processo do pool."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # Avisos de convergência de centenas de séries poluiriam o log
+        df_previsao, parametros = ajustar_previsao(serie, passos, parametros_iniciais)
+    df_previsao.insert(0, 'Indicador', indicador)
+    df_previsao.insert(0, 'Distribuidora', distribuidora)
+    return df_previsao, parametros
+
+
+def _ler_parametros_anteriores(path_parametros):
+    if not DeltaTable.is_deltatable(path_parametros):
+        return {}
+    df = DeltaTable(path_parametros).to_pandas()
+    return {(linha.Distribuidora, linha.Indicador): list(linha.Parametros) for linha in df.itertuples()}
+
+
+def _previsoes_atualizadas(path_parametros, versao_origem, passos):
+    """
+    Indica se as previsões gravadas já são desta versão dos dados e deste horizonte. Os
+    parâmetros são gravados depois das previsões, então servem de marca de conclusão.
+    """
+    if versao_origem is None or not DeltaTable.is_deltatable(path_parametros):
+        return False
+    tabela = DeltaTable(path_parametros)
+    if 'Passos' not in pa.schema(tabela.schema()).names:
+        return False  # Gravadas antes de o horizonte ser registrado
+    df = tabela.to_pandas(columns=['VersaoTabela', 'Passos'])
+    return not df.empty and (df['VersaoTabela'] == versao_origem).all() and (df['Passos'] == passos).all()
+
+
+def gerar_previsoes(path_agregados, versao_origem, max_workers=4, passos=12):
+    """
+    Ajusta e grava as previsões de todas as séries com histórico suficiente. Retorna o número
+    de séries gravadas, ou None se as previsões já eram desta versão dos dados (nada é ajustado).
+    """
+    path_parametros = os.path.join(path_agregados, 'previsoes_parametros')
+    if _previsoes_atualizadas(path_parametros, versao_origem, passos):
+        logging.info(f"As previsões já correspondem à versão {versao_origem} dos dados. Nenhum modelo será ajustado.")
+        return None
+    df_mensal = DeltaTable(os.path.join(path_agregados, 'mensal')).to_pandas()
+    parametros_anteriores = _ler_parametros_anteriores(path_parametros)
+
+    previsoes, parametros, falhas = [], [], 0
+    _sarimax()  # Importado antes de criar o pool, para os processos o herdarem já carregado
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {}
+        for (distribuidora, indicador), df_serie in df_mensal.groupby(['Distribuidora', 'Indicador']):
+            serie = preparar_serie(df_serie)
+            if len(serie.dropna()) < MINIMO_MESES:
+                continue
+            chave = (distribuidora, indicador)
+            futuros[executor.submit(_ajustar_serie, distribuidora, indicador, serie, passos,
+                                    parametros_anteriores.get(chave))] = chave
+        logging.info(f"Ajustando {len(futuros)} modelos SARIMAX com {max_workers} processos "
+                     f"({sum(chave in parametros_anteriores for chave in futuros.values())} com warm start)...")
+        for futuro in as_completed(futuros):
+            distribuidora, indicador = futuros[futuro]
+            try:
+                df_previsao, parametros_serie = futuro.result()
+            except Exception as e:
+                falhas += 1
+                logging.warning(f"Não foi possível ajustar o modelo de {distribuidora}/{indicador}: {e}")
+                continue
+            previsoes.append(df_previsao)
+            parametros.append({'Distribuidora': distribuidora, 'Indicador': indicador, 'Parametros': parametros_serie})
+
+    if not previsoes:
+        logging.warning("Nenhuma previsão foi gerada.")
+        return 0
+    df_previsoes = pd.concat(previsoes, ignore_index=True)
+    df_previsoes['VersaoTabela'] = versao_origem
+    df_parametros = pd.DataFrame(parametros)
+    df_parametros['VersaoTabela'] = versao_origem
+    df_parametros['Passos'] = passos
+    write_deltalake(os.path.join(path_agregados, 'previsoes'), df_previsoes, mode='overwrite',
+                    partition_by=['Distribuidora'], schema_mode='overwrite')
+    write_deltalake(path_parametros, df_parametros, mode='overwrite', schema_mode='overwrite')
+    logging.info(f"{len(parametros)} previsões gravadas ({falhas} séries falharam).")
+    return len(parametros)
+
+
+def ler_previsao(path_agregados, distribuidora, indicador, versao_origem):
+    """Previsão armazenada para a série, ou None se não houver uma para esta versão da tabela."""
+    path_tabela = os.path.join(path_agregados, 'previsoes')
+    if not DeltaTable.is_deltatable(path_tabela):
+        return None
+    dataset = dataset_snapshot(DeltaTable(path_tabela), lambda particao: particao['Distribuidora'] == distribuidora)
+    df = dataset.to_table(filter=(ds.field('Indicador') == pa.scalar(indicador)) &
+                                 (ds.field('VersaoTabela') == pa.scalar(versao_origem, pa.int64()))).to_pandas()
+    return df if not df.empty else None
@@ -1,14 +1,39 @@
 # processar_dados.py
 import pandas as pd
+import numpy as np
 import os
+import argparse
 import requests
 import json
 import yaml  # Para ler o config
 import logging  # Para logging profissional
 import glob
+import csv
+import hashlib
+import shutil
+import threading
+import time
+import operator
+from functools import reduce
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import pyarrow as pa_arrow
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import polars as pl
 import pandera as pa  # Para validação de dados
 from pandera.typing import Series
+from deltalake import DeltaTable, CommitProperties
 from deltalake.writer import write_deltalake  # Para escrever em Delta Lake
+from cliente_api import ClienteAPI
+from metricas import ColetorMetricas, Perfilador
+from tabela_delta import (CHAVES_REGISTRO, METADADO_MANUTENCAO, aplicar_esquema_compacto, bytes_adicionados,
+                          construir_catalogo, dataset_snapshot, salvar_catalogo, tabela_para_delta, versao_atual,
+                          versao_dados)
+from manutencao_tabela import executar_manutencao, normalizar_particoes
+from validacao import reunir_falhas, validar_em_blocos, validar_estrutura
+from agregados import materializar_agregados
+from previsoes import gerar_previsoes
 
 # --- 1. CONFIGURAÇÃO E LOGGING ---
 # Carrega as configurações do arquivo YAML
@@ -28,29 +53,59 @@ logging.basicConfig(
     ]
 )
 
+# Métricas por etapa da execução corrente, exportadas ao final do pipeline
+coletor = ColetorMetricas('pipeline')
+
 
 # --- 2. ESQUEMA DE VALIDAÇÃO DE DADOS ---
+TipoIndicador = np.float32 if config['pipeline']['float32_indicators'] else np.float64
+
+
 class SchemaDados(pa.DataFrameModel):
-    Ano: Series[int] = pa.Field(ge=config['data_quality']['valid_year_range'][0],
-                                le=config['data_quality']['valid_year_range'][1])
-    DEC: Series[float] = pa.Field(ge=0, nullable=True)
-    FEC: Series[float] = pa.Field(ge=0, nullable=True)
-    DIC: Series[float] = pa.Field(ge=0, nullable=True)
-    FIC: Series[float] = pa.Field(ge=0, nullable=True)
-    Distribuidora: Series[str] = pa.Field(nullable=False)
+    Ano: Series[np.int16] = pa.Field(ge=config['data_quality']['valid_year_range'][0],
+                                     le=config['data_quality']['valid_year_range'][1])
+    Mes: Series[np.int8]
+    DEC: Series[TipoIndicador] = pa.Field(ge=0, nullable=True)
+    FEC: Series[TipoIndicador] = pa.Field(ge=0, nullable=True)
+    DIC: Series[TipoIndicador] = pa.Field(ge=0, nullable=True)
+    FIC: Series[TipoIndicador] = pa.Field(ge=0, nullable=True)
+    Distribuidora: Series[pd.CategoricalDtype] = pa.Field(nullable=False)
+    CNPJ: Series[pd.CategoricalDtype] = pa.Field(nullable=True)
+    ConjuntoID: Series[pd.CategoricalDtype] = pa.Field(nullable=False)
+    NomConjunto: Series[pd.CategoricalDtype] = pa.Field(nullable=False)
 
 
 # --- 3. FUNÇÕES DO PIPELINE ---
-def limpar_e_padronizar_dataframe(df_bruto: pd.DataFrame) -> pd.DataFrame:
-    logging.info("Iniciando limpeza e padronização...")
-    # ... (a lógica interna desta função permanece a mesma da versão anterior)
-    df_bruto = df_bruto.rename(columns={
-        'SigAgente': 'Distribuidora', 'NumCNPJ': 'CNPJ', 'IdeConjUndConsumidoras': 'ConjuntoID',
-        'DscConjUndConsumidoras': 'NomConjunto', 'AnoIndice': 'Ano', 'NumPeriodoIndice': 'Mes',
-        'VlrIndiceEnviado': 'Valor', 'SigIndicador': 'Indicador'
-    })
-    colunas_essenciais = ['Distribuidora', 'CNPJ', 'ConjuntoID', 'NomConjunto', 'Ano', 'Mes', 'Valor', 'Indicador']
-    for col in colunas_essenciais:
+COLUNAS_ESSENCIAIS = ['Distribuidora', 'CNPJ', 'ConjuntoID', 'NomConjunto', 'Ano', 'Mes', 'Valor', 'Indicador']
+
+# Esquema dos registros normalizados (formato longo) gravados no cache dos arquivos locais
+ESQUEMA_REGISTROS = pa_arrow.schema([
+    ('Distribuidora', pa_arrow.string()), ('CNPJ', pa_arrow.string()), ('ConjuntoID', pa_arrow.string()),
+    ('NomConjunto', pa_arrow.string()), ('Ano', pa_arrow.int16()), ('Mes', pa_arrow.int8()),
+    ('Valor', pa_arrow.float64()), ('Indicador', pa_arrow.string()),
+])
+
+# Incrementar quando a normalização mudar, para invalidar o cache dos arquivos locais
+VERSAO_CACHE_LOCAL = 3
+
+# Textos lidos como nulos nos CSVs locais (a mesma lista padrão do pd.read_csv)
+VALORES_NULOS_CSV = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                     '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+MAPA_COLUNAS_ANEEL = {
+    'SigAgente': 'Distribuidora', 'NumCNPJ': 'CNPJ', 'IdeConjUndConsumidoras': 'ConjuntoID',
+    'DscConjUndConsumidoras': 'NomConjunto', 'AnoIndice': 'Ano', 'NumPeriodoIndice': 'Mes',
+    'VlrIndiceEnviado': 'Valor', 'SigIndicador': 'Indicador'
+}
+INDICADORES_PRINCIPAIS = ['DEC', 'FEC', 'DIC', 'FIC']
+CHAVES_PIVOT = ['Distribuidora', 'CNPJ', 'ConjuntoID', 'Ano', 'Mes']
+
+
+def normalizar_registros(df_bruto: pd.DataFrame) -> pd.DataFrame:
+    """Renomeia, converte e filtra os registros brutos (formato longo), sem pivotar."""
+    df_bruto = df_bruto.rename(columns=MAPA_COLUNAS_ANEEL)
+    for col in COLUNAS_ESSENCIAIS:
         if col not in df_bruto.columns:
             df_bruto[col] = None
     df_bruto['Valor'] = pd.to_numeric(df_bruto['Valor'].astype(str).str.replace(',', '.', regex=False), errors='coerce')
@@ -58,123 +113,1015 @@ def limpar_e_padronizar_dataframe(df_bruto: pd.DataFrame) -> pd.DataFrame:
                     inplace=True)
     df_bruto['Ano'] = pd.to_numeric(df_bruto['Ano'], errors='coerce', downcast='integer')
     df_bruto['Mes'] = pd.to_numeric(df_bruto['Mes'], errors='coerce', downcast='integer')
+    df_bruto['Distribuidora'] = df_bruto['Distribuidora'].astype(str).str.strip()
     df_bruto['ConjuntoID'] = df_bruto['ConjuntoID'].astype(str).str.strip()
     df_bruto['NomConjunto'] = df_bruto['NomConjunto'].astype(str).str.strip()
+    return df_bruto
+
+
+def mapa_nomes_conjuntos(df_bruto: pd.DataFrame) -> pd.DataFrame:
+    """Último nome registrado de cada conjunto (o nome usado em todas as linhas do conjunto)."""
+    return df_bruto[['ConjuntoID', 'NomConjunto']].drop_duplicates(subset=['ConjuntoID'], keep='last')
 
-    mapa_nomes = df_bruto[['ConjuntoID', 'NomConjunto']].drop_duplicates(subset=['ConjuntoID'], keep='last')
+
+def pivotar_indicadores(df_bruto: pd.DataFrame, mapa_nomes: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Transforma os registros normalizados em uma linha por conjunto/mês, com um indicador por coluna.
+    `mapa_nomes` (ConjuntoID -> NomConjunto) permite usar os nomes calculados sobre todos os
+    registros quando `df_bruto` é só uma parte deles.
+    """
+    if mapa_nomes is None:
+        mapa_nomes = mapa_nomes_conjuntos(df_bruto)
 
     df_pivotado = df_bruto.pivot_table(
-        index=['Distribuidora', 'CNPJ', 'ConjuntoID', 'Ano', 'Mes'],
+        index=CHAVES_PIVOT,
         columns='Indicador', values='Valor'
     ).reset_index()
 
     df_pivotado = df_pivotado.rename_axis(None, axis=1)
-    indicadores_possiveis = ['DEC', 'FEC', 'DIC', 'FIC']
-    for ind in indicadores_possiveis:
+    for ind in INDICADORES_PRINCIPAIS:
         if ind not in df_pivotado.columns:
             df_pivotado[ind] = 0.0  # Adiciona a coluna se não existir
-    df_pivotado.fillna({k: 0.0 for k in indicadores_possiveis}, inplace=True)
+    df_pivotado.fillna({k: 0.0 for k in INDICADORES_PRINCIPAIS}, inplace=True)
 
     df_final = pd.merge(df_pivotado, mapa_nomes, on='ConjuntoID', how='left')
     df_final['NomConjunto'] = df_final['NomConjunto'].fillna('Não identificado')
+    return df_final
+
+
+def _normalizar_registros_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Equivalente de `normalizar_registros` como consulta lazy do Polars."""
+    colunas = lf.collect_schema().names()
+    lf = lf.rename({origem: destino for origem, destino in MAPA_COLUNAS_ANEEL.items() if origem in colunas})
+    colunas = lf.collect_schema().names()
+    lf = lf.with_columns([pl.lit(None).alias(col) for col in COLUNAS_ESSENCIAIS if col not in colunas])
+    return (
+        lf.with_columns(
+            pl.col('Valor').cast(pl.Utf8).str.replace_all(',', '.', literal=True).str.strip_chars()
+            .cast(pl.Float64, strict=False).fill_nan(None)
+        )
+        .drop_nulls(subset=['Valor', 'Ano', 'Mes', 'Indicador', 'Distribuidora', 'ConjuntoID', 'NomConjunto'])
+        .with_columns(
+            pl.col('Ano').cast(pl.Utf8).str.strip_chars().cast(pl.Float64, strict=False),
+            pl.col('Mes').cast(pl.Utf8).str.strip_chars().cast(pl.Float64, strict=False),
+            pl.col('Distribuidora').cast(pl.Utf8).str.strip_chars(),
+            pl.col('ConjuntoID').cast(pl.Utf8).str.strip_chars(),
+            pl.col('NomConjunto').cast(pl.Utf8).str.strip_chars(),
+        )
+    )
+
+
+def _pivotar_indicadores_polars(lf: pl.LazyFrame, mapa_nomes: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Equivalente de `pivotar_indicadores` em Polars (multithread). Reproduz as regras do
+    `pivot_table` do pandas: média por chave, chaves nulas descartadas, linhas ordenadas
+    pelas chaves e colunas de indicadores em ordem alfabética.
+    """
+    df_registros = lf.collect()
+    indicadores = sorted(df_registros.get_column('Indicador').unique().to_list())
+    if mapa_nomes is None:
+        mapa_nomes = df_registros.select(['ConjuntoID', 'NomConjunto']).unique(
+            subset=['ConjuntoID'], keep='last', maintain_order=True)
+    else:
+        mapa_nomes = pl.from_pandas(mapa_nomes[['ConjuntoID', 'NomConjunto']].astype(str))
 
+    df_final = (
+        df_registros.lazy()
+        .drop_nulls(subset=CHAVES_PIVOT)
+        .group_by(CHAVES_PIVOT)
+        .agg([pl.col('Valor').filter(pl.col('Indicador') == ind).mean().alias(ind) for ind in indicadores])
+        .sort(CHAVES_PIVOT)
+        .with_columns([pl.lit(0.0).alias(ind) for ind in INDICADORES_PRINCIPAIS if ind not in indicadores])
+        .with_columns([pl.col(ind).fill_null(0.0) for ind in INDICADORES_PRINCIPAIS])
+        .with_row_index('_ordem')
+        .join(mapa_nomes.lazy(), on='ConjuntoID', how='left')
+        .sort('_ordem')
+        .drop('_ordem')
+        .with_columns(pl.col('NomConjunto').fill_null('Não identificado'))
+        .collect()
+        .to_pandas()
+    )
+    # Mesmos tipos inteiros que o pandas gera com downcast
+    df_final['Ano'] = pd.to_numeric(df_final['Ano'], downcast='integer')
+    df_final['Mes'] = pd.to_numeric(df_final['Mes'], downcast='integer')
+    return df_final
+
+
+def limpar_e_padronizar_dataframe(df_bruto: pd.DataFrame, engine: str = None) -> pd.DataFrame:
+    """
+    Normaliza e pivota os registros brutos. `engine` pode ser 'pandas' ou 'polars'
+    (padrão definido em `pipeline.engine` no config.yaml); ambos produzem o mesmo resultado.
+    """
+    engine = engine or config['pipeline']['engine']
+    logging.info(f"Iniciando limpeza e padronização (engine: {engine})...")
+    if engine == 'polars':
+        df_final = _pivotar_indicadores_polars(_normalizar_registros_polars(pl.from_pandas(df_bruto).lazy()))
+    else:
+        df_final = pivotar_indicadores(normalizar_registros(df_bruto))
+    df_final = aplicar_esquema_compacto(df_final, config['pipeline']['float32_indicators'])
     logging.info("Limpeza e padronização concluídas.")
     return df_final
 
 
-def processar_dados_locais():
+def _hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+
+def _normalizar_csv_em_blocos(arquivo, caminho_saida):
+    """
+    Lê um CSV da ANEEL em blocos com o leitor do Arrow e grava os registros normalizados
+    de cada bloco em Parquet, sem nunca manter o arquivo inteiro em memória.
+    Executado em um processo separado por arquivo.
+    """
+    with open(arquivo, 'r', encoding='latin1', newline='') as f:
+        cabecalho = next(csv.reader(f, delimiter=';'))
+    leitor = pacsv.open_csv(
+        arquivo,
+        read_options=pacsv.ReadOptions(encoding='latin1',
+                                       block_size=config['local_files']['block_size_mb'] * 1024 * 1024),
+        parse_options=pacsv.ParseOptions(delimiter=';'),
+        # Tudo como texto, como nas páginas da API: a conversão fica a cargo da normalização.
+        # Células vazias e marcadores de ausência viram nulos, como no pd.read_csv
+        convert_options=pacsv.ConvertOptions(column_types={col: pa_arrow.string() for col in cabecalho},
+                                             strings_can_be_null=True, null_values=VALORES_NULOS_CSV),
+    )
+    caminho_temporario = caminho_saida + '.tmp'
+    linhas_lidas = linhas_gravadas = 0
+    with pq.ParquetWriter(caminho_temporario, ESQUEMA_REGISTROS) as escritor:
+        for lote in leitor:
+            linhas_lidas += lote.num_rows
+            df_bloco = normalizar_registros(lote.to_pandas()).dropna(subset=['Ano', 'Mes'])
+            escritor.write_table(
+                pa_arrow.Table.from_pandas(df_bloco[COLUNAS_ESSENCIAIS], schema=ESQUEMA_REGISTROS, preserve_index=False))
+            linhas_gravadas += len(df_bloco)
+    os.replace(caminho_temporario, caminho_saida)
+    return linhas_lidas, linhas_gravadas
+
+
+def _ler_manifesto(path_cache):
+    """Manifesto do cache dos arquivos locais (vazio se não existir ou for de outra versão da normalização)."""
+    caminho_manifesto = os.path.join(path_cache, 'manifesto.json')
+    manifesto = {}
+    if os.path.exists(caminho_manifesto):
+        with open(caminho_manifesto, 'r') as f:
+            manifesto = json.load(f)
+    if manifesto.get('versao') != VERSAO_CACHE_LOCAL:
+        manifesto = {'versao': VERSAO_CACHE_LOCAL, 'arquivos': {}}
+    return manifesto
+
+
+def _salvar_manifesto(path_cache, manifesto):
+    os.makedirs(path_cache, exist_ok=True)
+    with open(os.path.join(path_cache, 'manifesto.json'), 'w') as f:
+        json.dump(manifesto, f, indent=2)
+
+
+def _hash_com_manifesto(arquivo, manifesto):
+    """Hash do conteúdo do arquivo, registrado no manifesto. Tamanho e data de modificação iguais dispensam recalcular."""
+    estado = os.stat(arquivo)
+    anterior = manifesto['arquivos'].get(os.path.basename(arquivo), {})
+    if anterior.get('tamanho') == estado.st_size and anterior.get('mtime_ns') == estado.st_mtime_ns:
+        hash_conteudo = anterior['sha256']
+    else:
+        hash_conteudo = _hash_arquivo(arquivo)
+    manifesto['arquivos'][os.path.basename(arquivo)] = {
+        'sha256': hash_conteudo, 'tamanho': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+    return hash_conteudo
+
+
+def hashes_arquivos_locais():
+    """Hashes do conteúdo dos CSVs locais atuais, em ordem (usados na marca d'água da tabela)."""
+    arquivos_csv = sorted(glob.glob(os.path.join(config['paths']['raw_data'], '*.csv')))
+    manifesto = _ler_manifesto(config['paths']['local_cache'])
+    hashes = sorted(_hash_com_manifesto(arquivo, manifesto) for arquivo in arquivos_csv)
+    _salvar_manifesto(config['paths']['local_cache'], manifesto)  # O processamento reaproveita os hashes
+    return hashes
+
+
+def normalizar_dados_locais():
+    """
+    Normaliza os CSVs locais em paralelo e em blocos, reaproveitando a saída já processada
+    dos arquivos cujo conteúdo (hash SHA-256) não mudou desde a execução anterior.
+    Retorna os Parquets de registros normalizados (formato longo), na ordem dos arquivos.
+    """
     path_dados_brutos = config['paths']['raw_data']
     if not os.path.exists(path_dados_brutos):
         logging.warning(f"A pasta '{path_dados_brutos}' não foi encontrada. Pulando processamento local.")
-        return pd.DataFrame()
-    # ... (resto da função igual, trocando prints por logging)
-    arquivos_csv = glob.glob(os.path.join(path_dados_brutos, '*.csv'))
+        return []
+    arquivos_csv = sorted(glob.glob(os.path.join(path_dados_brutos, '*.csv')))
     if not arquivos_csv:
         logging.info(f"Nenhum arquivo .csv encontrado na pasta '{path_dados_brutos}'.")
-        return pd.DataFrame()
+        return []
     logging.info(f"Encontrados {len(arquivos_csv)} arquivos locais para processamento...")
-    lista_dfs = []
-    for arquivo in arquivos_csv:
-        try:
-            df_temp = pd.read_csv(arquivo, encoding='latin1', sep=';')
-            lista_dfs.append(df_temp)
-        except Exception as e:
-            logging.error(f"Erro ao ler o arquivo {arquivo}: {e}")
-    if not lista_dfs: return pd.DataFrame()
-    df_completo = pd.concat(lista_dfs, ignore_index=True)
-    logging.info(f"Arquivos locais unificados. Total de {len(df_completo):,} linhas.")
-    return limpar_e_padronizar_dataframe(df_completo)
 
+    path_cache = config['paths']['local_cache']
+    os.makedirs(path_cache, exist_ok=True)
+    manifesto = _ler_manifesto(path_cache)
 
-def processar_dados_api():
-    logging.info("Iniciando carregamento de dados da API da ANEEL...")
-    # ... (resto da função igual, trocando prints por logging e usando config)
-    all_records = []
-    offset = 0
-    limit = 32000
-    while True:
-        params = {"resource_id": config['api']['resource_id'], "limit": limit, "offset": offset}
-        try:
-            response = requests.get(config['api']['base_url'], params=params, timeout=config['api']['timeout_seconds'])
-            response.raise_for_status()
-            data = response.json()
-            records = data.get("result", {}).get("records", [])
-            if not records: break
-            all_records.extend(records)
-            logging.info(f"Carregados {len(all_records)} registros da API...")
-            offset += len(records)
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Erro na requisição à API: {e}")
-            break
-    if not all_records:
+    with coletor.etapa('dados_locais_csv') as etapa:
+        saidas, pendentes = {}, {}
+        for arquivo in arquivos_csv:
+            caminho_saida = os.path.join(path_cache, f"{_hash_com_manifesto(arquivo, manifesto)}.parquet")
+            saidas[arquivo] = caminho_saida
+            if not os.path.exists(caminho_saida):
+                pendentes[arquivo] = caminho_saida
+        logging.info(f"{len(arquivos_csv) - len(pendentes)} arquivos sem alteração reaproveitados do cache; "
+                     f"{len(pendentes)} serão processados.")
+
+        total_lido = total_gravado = 0
+        with ProcessPoolExecutor(max_workers=config['local_files']['max_workers']) as executor:
+            futuros = {executor.submit(_normalizar_csv_em_blocos, arquivo, saida): arquivo
+                       for arquivo, saida in pendentes.items()}
+            for futuro in as_completed(futuros):
+                arquivo = futuros[futuro]
+                try:
+                    linhas_lidas, linhas_gravadas = futuro.result()
+                    total_lido, total_gravado = total_lido + linhas_lidas, total_gravado + linhas_gravadas
+                    logging.info(f"Arquivo {arquivo} processado: {linhas_lidas:,} linhas lidas, "
+                                 f"{linhas_gravadas:,} registros válidos.")
+                except Exception as e:
+                    logging.error(f"Erro ao ler o arquivo {arquivo}: {e}")
+                    del saidas[arquivo]
+                    manifesto['arquivos'].pop(os.path.basename(arquivo), None)
+        etapa.registrar(
+            arquivos_processados=len(pendentes), arquivos_reaproveitados=len(arquivos_csv) - len(pendentes),
+            linhas_entrada=total_lido, linhas_saida=total_gravado,
+            bytes_lidos=sum(os.path.getsize(arquivo) for arquivo in pendentes),
+            bytes_gravados=sum(os.path.getsize(saidas[arquivo]) for arquivo in pendentes if arquivo in saidas))
+
+    # Remove do manifesto e do cache os arquivos que não existem mais
+    nomes_atuais = {os.path.basename(arquivo) for arquivo in saidas}
+    manifesto['arquivos'] = {nome: dados for nome, dados in manifesto['arquivos'].items() if nome in nomes_atuais}
+    for caminho in glob.glob(os.path.join(path_cache, '*.parquet')):
+        if caminho not in saidas.values():
+            os.remove(caminho)
+    _salvar_manifesto(path_cache, manifesto)
+    return [saidas[arquivo] for arquivo in arquivos_csv if arquivo in saidas]
+
+
+def _hashes_das_saidas(saidas):
+    """Hashes dos CSVs processados com sucesso, tirados dos nomes dos arquivos do cache."""
+    return sorted(os.path.splitext(os.path.basename(caminho))[0] for caminho in saidas)
+
+
+def processar_dados_locais():
+    """
+    Normaliza os CSVs locais (com cache) e pivota todos os registros em um único DataFrame,
+    com os hashes dos arquivos processados em `attrs`.
+    """
+    saidas = normalizar_dados_locais()
+    if not saidas: return pd.DataFrame()
+    with coletor.etapa('dados_locais_pivot') as etapa:
+        df_completo = pa_arrow.concat_tables([pq.read_table(caminho) for caminho in saidas]).to_pandas()
+        logging.info(f"Arquivos locais unificados. Total de {len(df_completo):,} registros normalizados.")
+        engine = config['pipeline']['engine']
+        logging.info(f"Iniciando padronização (pivot dos indicadores, engine: {engine})...")
+        if engine == 'polars':
+            df_final = _pivotar_indicadores_polars(pl.from_pandas(df_completo).lazy())
+        else:
+            df_final = pivotar_indicadores(df_completo)
+        df_final = aplicar_esquema_compacto(df_final, config['pipeline']['float32_indicators'])
+        etapa.registrar(linhas_entrada=len(df_completo), linhas_saida=len(df_final),
+                        bytes_lidos=sum(os.path.getsize(caminho) for caminho in saidas))
+    logging.info("Limpeza e padronização concluídas.")
+    df_final.attrs['arquivos_locais'] = _hashes_das_saidas(saidas)
+    return df_final
+
+
+def _criar_cliente_api(max_conexoes):
+    """Cliente da API com pool de conexões, retentativas com backoff e cache das respostas em disco."""
+    return ClienteAPI(config['api']['base_url'], config['api']['timeout_seconds'], max_conexoes,
+                      diretorio_cache=config['paths']['http_cache'], offline=config['api']['offline'],
+                      tentativas=config['api']['retries'], backoff_segundos=config['api']['backoff_seconds'])
+
+
+def _consultar_api(cliente, offset, limit):
+    return cliente.consultar(config['api']['resource_id'], offset, limit)
+
+
+def _salvar_pagina(records, caminho_pagina):
+    """Grava uma página da API em Parquet (todas as colunas como texto) de forma atômica."""
+    colunas = sorted({chave for registro in records for chave in registro})
+    tabela = pa_arrow.table({
+        col: pa_arrow.array([None if r.get(col) is None else str(r.get(col)) for r in records], type=pa_arrow.string())
+        for col in colunas
+    })
+    caminho_temporario = caminho_pagina + '.tmp'
+    pq.write_table(tabela, caminho_temporario)
+    os.replace(caminho_temporario, caminho_pagina)  # A página só "existe" depois de completa
+    return tabela.num_rows
+
+
+def _preparar_checkpoint(path_paginas, total, limit, modificado):
+    """
+    Reaproveita as páginas de uma execução anterior do mesmo recurso, total e data de alteração
+    (`modificado`): se ela foi interrompida, o download é retomado; se terminou, as páginas são
+    usadas sem baixar nada, mas só quando a API informa a data de alteração (o total sozinho
+    não revela revisões que mantêm a quantidade de registros). Caso contrário, começa um
+    download novo. Retorna o caminho do arquivo de progresso e se o download anterior terminou.
+    """
+    caminho_progresso = os.path.join(path_paginas, '_progresso.json')
+    progresso_atual = {"resource_id": config['api']['resource_id'], "total": total, "limit": limit,
+                       "modificado": modificado, "concluido": False}
+    if os.path.exists(caminho_progresso):
+        with open(caminho_progresso, 'r') as f:
+            progresso_anterior = json.load(f)
+        mesma_carga = {**progresso_anterior, 'concluido': False} == progresso_atual
+        if mesma_carga and not progresso_anterior['concluido']:
+            logging.info("Checkpoint de download anterior encontrado. Retomando de onde parou...")
+            return caminho_progresso, False
+        if mesma_carga and modificado is not None:
+            return caminho_progresso, True
+    shutil.rmtree(path_paginas, ignore_errors=True)
+    os.makedirs(path_paginas, exist_ok=True)
+    with open(caminho_progresso, 'w') as f:
+        json.dump(progresso_atual, f)
+    return caminho_progresso, False
+
+
+def baixar_paginas_api():
+    """
+    Baixa o recurso da API da ANEEL em páginas concorrentes, gravando cada página em Parquet
+    no disco assim que chega. Páginas já gravadas são puladas, permitindo retomar downloads
+    interrompidos. Retorna (total da API, data de alteração do recurso, páginas gravadas, na
+    ordem dos offsets), ou None se o download não puder ser concluído.
+
+    Se a data de alteração do recurso é a mesma do último download completo, as páginas dele
+    são devolvidas sem novas requisições (quando só os arquivos locais mudaram, elas entram no
+    processamento para que a API prevaleça na remoção de duplicatas). Se nenhuma fonte mudou
+    desde a carga gravada, a marca d'água da tabela dispensa esta etapa (`fontes_sem_alteracao`).
+    """
+    logging.info("Iniciando carregamento de dados da API da ANEEL..."
+                 + (" Modo offline: apenas respostas do cache HTTP." if config['api']['offline'] else ""))
+    limit = config['api']['page_size']
+    max_workers = config['api']['max_workers']
+    path_paginas = config['paths']['api_pages']
+    cliente = _criar_cliente_api(max_workers)
+    try:
+        with coletor.etapa('api_download') as etapa:
+            return _baixar_paginas(cliente, etapa, limit, max_workers, path_paginas)
+    finally:
+        cliente.fechar()
+
+
+def _baixar_paginas(cliente, etapa, limit, max_workers, path_paginas):
+    """Download das páginas com o `cliente` já criado; a `etapa` recebe as contagens e o status."""
+    trava = threading.Lock()
+
+    def contar_resposta(resposta, *args, **kwargs):
+        # Chamado pelo requests a cada resposta; as páginas chegam de várias threads
+        tentativas = resposta.raw.retries.history if getattr(resposta.raw, 'retries', None) else ()
+        with trava:
+            etapa.valores['requisicoes_api'] = etapa.valores.get('requisicoes_api', 0) + 1
+            etapa.valores['retentativas_api'] = etapa.valores.get('retentativas_api', 0) + len(tentativas)
+            etapa.valores['bytes_lidos'] = etapa.valores.get('bytes_lidos', 0) + len(resposta.content)
+    cliente.sessao.hooks['response'].append(contar_resposta)
+
+    try:
+        total = _consultar_api(cliente, offset=0, limit=0).get("total")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Erro ao consultar o total de registros da API: {e}")
+        etapa.status = 'erro'
+        return None
+    if not total:
         logging.warning("Nenhum registro carregado da API.")
+        return None, None, []
+    modificado = cliente.modificacao_recurso(config['api']['resource_id'])
+    logging.info(f"A API informa {total:,} registros (dados alterados em {modificado or 'data não informada'}).")
+
+    caminho_progresso, carga_concluida = _preparar_checkpoint(path_paginas, total, limit, modificado)
+    paginas = {offset: os.path.join(path_paginas, f"pagina_{offset:010d}.parquet") for offset in range(0, total, limit)}
+    pendentes = {offset: caminho for offset, caminho in paginas.items() if not os.path.exists(caminho)}
+    sem_alteracao = carga_concluida and not pendentes
+    if sem_alteracao:
+        logging.info(f"A API não mudou desde o último download completo. Reaproveitando as {len(paginas)} páginas do disco.")
+    elif len(pendentes) < len(paginas):
+        logging.info(f"{len(paginas) - len(pendentes)} de {len(paginas)} páginas já estavam no disco.")
+    if pendentes:
+        logging.info(f"Baixando {len(pendentes)} páginas de {limit} registros com {max_workers} workers...")
+
+    def baixar_pagina(offset):
+        records = _consultar_api(cliente, offset, limit).get("records", [])
+        esperados = min(limit, total - offset)
+        if len(records) != esperados:
+            # Página curta (limite do servidor menor que api.page_size) ou dados mudando durante o
+            # download: a página não é gravada, para ser baixada de novo na próxima execução
+            raise ValueError(f"{len(records):,} registros recebidos, {esperados:,} esperados")
+        return _salvar_pagina(records, pendentes[offset])
+
+    falhas = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {executor.submit(baixar_pagina, offset): offset for offset in pendentes}
+        for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+            try:
+                futuro.result()
+                logging.info(f"Página {concluidas}/{len(pendentes)} da API carregada (offset {futuros[futuro]}).")
+            except (requests.exceptions.RequestException, ValueError) as e:
+                falhas += 1
+                logging.error(f"Erro na requisição à API (offset {futuros[futuro]}): {e}")
+    etapa.registrar(paginas_api=len(pendentes) - falhas, paginas_reaproveitadas=len(paginas) - len(pendentes),
+                    falhas_api=falhas, respostas_cache=cliente.respostas_cache,
+                    bytes_gravados=sum(os.path.getsize(caminho) for caminho in pendentes.values()
+                                       if os.path.exists(caminho)))
+
+    if falhas:
+        logging.error(f"{falhas} páginas falharam. Execute novamente para retomar o download a partir do checkpoint. "
+                      f"Se todas as páginas vierem incompletas, o servidor limita o tamanho da página: "
+                      f"reduza api.page_size (atual: {limit}).")
+        etapa.status = 'erro'
+        return None
+
+    with open(caminho_progresso, 'r') as f:
+        progresso = json.load(f)
+    progresso['concluido'] = True
+    with open(caminho_progresso, 'w') as f:
+        json.dump(progresso, f)
+
+    gravadas = [caminho for caminho in paginas.values() if os.path.exists(caminho)]
+    if not gravadas:
+        logging.warning("Nenhum registro carregado da API.")
+        return None, None, []
+    # A contagem vem dos metadados do Parquet, sem ler as páginas
+    linhas = sum(pq.ParquetFile(caminho).metadata.num_rows for caminho in gravadas)
+    if linhas != total:
+        logging.error(f"A API informou {total:,} registros, mas {linhas:,} foram recebidos. "
+                      f"A carga está incompleta e não será usada.")
+        etapa.status = 'erro'
+        return None
+    logging.info(f"Carregamento da API concluído. Total de {linhas:,} linhas.")
+    etapa.registrar(linhas_saida=linhas)
+    if sem_alteracao:
+        etapa.status = 'sem_alteracao'
+    return total, modificado, gravadas
+
+
+def processar_dados_api():
+    """
+    Baixa as páginas da API (veja `baixar_paginas_api`) e as limpa e pivota em um único
+    DataFrame, com o total e a data de alteração da API em `attrs`. Retorna None se o
+    download não puder ser concluído e um DataFrame vazio se não houver registros.
+    """
+    resultado = baixar_paginas_api()
+    if resultado is None:
+        return None
+    total, modificado, paginas = resultado
+    if not paginas:
         return pd.DataFrame()
-    df_api = pd.DataFrame(all_records)
-    logging.info(f"Carregamento da API concluído. Total de {len(df_api):,} linhas.")
-    return limpar_e_padronizar_dataframe(df_api)
+    df_api = pa_arrow.concat_tables([pq.read_table(caminho) for caminho in paginas],
+                                    promote_options='default').to_pandas()
 
+    with coletor.etapa('api_limpeza') as etapa_limpeza:
+        linhas_brutas = len(df_api)
+        df_api = limpar_e_padronizar_dataframe(df_api)
+        etapa_limpeza.registrar(linhas_entrada=linhas_brutas, linhas_saida=len(df_api))
+    df_api.attrs.update(total_api=total, modificado_api=modificado)
+    return df_api
+
+
+def ler_marca_dagua(tabela):
+    """Retorna a marca d'água gravada no commit mais recente que a possui (ou None)."""
+    for commit in tabela.history():
+        if 'marca_dagua' in commit:
+            return json.loads(commit['marca_dagua'])
+    return None
+
+
+def _alinhar_ao_esquema(tabela_arrow, tabela):
+    """Converte as colunas já existentes na tabela Delta para os tipos gravados nela."""
+    esquema_destino = pa_arrow.schema(tabela.schema())
+    for campo in esquema_destino:
+        if campo.name in tabela_arrow.column_names:
+            indice = tabela_arrow.column_names.index(campo.name)
+            tabela_arrow = tabela_arrow.set_column(indice, campo.name, tabela_arrow[campo.name].cast(campo.type))
+    return tabela_arrow
+
+
+def _filtrar_registros_alterados(dataset, df_novo):
+    """
+    Compara os dados novos com a versão atual da tabela (`dataset` do snapshot, lido apenas
+    nos anos presentes nos dados novos) e devolve somente as linhas cuja chave é nova ou cujos
+    valores mudaram.
+    """
+    colunas_tabela = dataset.schema.names
+    colunas_lidas = [col for col in df_novo.columns if col in colunas_tabela]
+    anos = [int(ano) for ano in df_novo['Ano'].unique()]
+    df_atual = dataset.to_table(
+        columns=colunas_lidas, filter=ds.field('Ano').isin(anos)
+    ).to_pandas()
+    if df_atual.empty:
+        return df_novo
+
+    # Categorias são comparadas como texto, pois as categorias dos dois lados diferem
+    colunas_texto = {col: str for col in df_novo.columns if isinstance(df_novo[col].dtype, pd.CategoricalDtype)}
+    df_novo_texto = df_novo.astype(colunas_texto)
+    df_atual = df_atual.astype({col: df_novo_texto[col].dtype for col in CHAVES_REGISTRO}).astype(
+        {col: str for col in colunas_texto if col in df_atual.columns})
+    df_atual = df_atual.drop_duplicates(subset=CHAVES_REGISTRO, keep='last')
+    df_comparacao = pd.merge(df_novo_texto, df_atual, on=CHAVES_REGISTRO, how='left', suffixes=('', '_atual'),
+                             indicator=True)
+    alterado = (df_comparacao['_merge'] == 'left_only').to_numpy().copy()
+    for col in df_novo.columns:
+        if col in CHAVES_REGISTRO:
+            continue
+        if col not in colunas_lidas:
+            alterado[:] = True  # Coluna nova: todas as linhas precisam ser gravadas
+            break
+        novo, atual = df_comparacao[col], df_comparacao[f"{col}_atual"]
+        alterado |= ~((novo == atual) | (novo.isna() & atual.isna())).to_numpy()
+    return df_novo[alterado]
+
+
+def _literal_sql(valor):
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def salvar_incremental(path_tabela, df_final, marca_dagua):
+    """
+    Faz MERGE (upsert) apenas das chaves novas ou alteradas, restringindo o predicado às
+    partições (Ano, Distribuidora) afetadas para que as demais não sejam reescritas.
+    Retorna as métricas do MERGE (vazio se não havia nada a gravar).
+    """
+    tabela = DeltaTable(path_tabela)
+    df_alterado = _filtrar_registros_alterados(dataset_snapshot(tabela), df_final)
+    if df_alterado.empty:
+        logging.info("Nenhum registro novo ou alterado em relação à versão atual da tabela. Nada a gravar.")
+        registrar_marca_dagua(tabela, marca_dagua)
+        return {}
+    logging.info(f"{len(df_alterado):,} registros novos ou alterados serão mesclados na tabela.")
+    return mesclar_registros(tabela, tabela_para_delta(df_alterado), df_alterado['Ano'].unique(),
+                             df_alterado['Distribuidora'].unique(), marca_dagua)
+
+
+def mesclar_registros(tabela, fonte, anos, distribuidoras, marca_dagua):
+    """MERGE da tabela do Arrow `fonte` em um único commit, com o predicado restrito às partições afetadas."""
+    anos = ", ".join(str(int(ano)) for ano in anos)
+    distribuidoras = ", ".join(_literal_sql(d) for d in distribuidoras)
+    predicado = " AND ".join(
+        [f"t.Ano IN ({anos})", f"t.Distribuidora IN ({distribuidoras})"] +
+        [f"t.{col} = s.{col}" for col in CHAVES_REGISTRO]
+    )
+    fonte = _alinhar_ao_esquema(fonte, tabela)
+    metricas = tabela.merge(
+        source=fonte, predicate=predicado, source_alias='s', target_alias='t', merge_schema=True,
+        commit_properties=CommitProperties(custom_metadata={'marca_dagua': json.dumps(marca_dagua)})
+    ).when_matched_update_all().when_not_matched_insert_all().execute()
+    logging.info(f"MERGE concluído: {metricas.get('num_target_rows_inserted', 0):,} inseridos, "
+                 f"{metricas.get('num_target_rows_updated', 0):,} atualizados, "
+                 f"{metricas.get('num_target_files_added', 0)} arquivos gravados.")
+    return metricas
+
+
+def registrar_marca_dagua(tabela, marca_dagua):
+    """
+    Grava só a marca d'água (commit sem arquivos) quando as fontes mudaram mas os dados da
+    tabela não. O commit leva a marca de manutenção, pois não altera o conteúdo da tabela.
+    """
+    if ler_marca_dagua(tabela) == marca_dagua:
+        return
+    tabela.create_write_transaction(
+        [], mode='append', schema=tabela.schema(), partition_by=tabela.metadata().partition_columns,
+        commit_properties=CommitProperties(custom_metadata={'marca_dagua': json.dumps(marca_dagua),
+                                                            METADADO_MANUTENCAO: 'true'}))
+    logging.info("Marca d'água das fontes atualizada na tabela.")
+
+
+def _nova_marca_dagua(total_api, modificado_api, arquivos_locais, marca_anterior):
+    """
+    Estado das fontes na carga gravada: total e data de alteração da API (os anteriores, se a
+    API não trouxe registros), hashes dos CSVs locais processados e a versão da normalização.
+    """
+    marca_api = {'total_api': total_api, 'modificado_api': modificado_api}
+    if total_api is None:
+        marca_api = {chave: (marca_anterior or {}).get(chave) for chave in marca_api}
+    return {**marca_api, 'arquivos_locais': arquivos_locais, 'versao_normalizacao': VERSAO_CACHE_LOCAL}
+
+
+def _estado_api():
+    """Total de registros e data de alteração do recurso na API, ou None se a consulta falhar."""
+    cliente = _criar_cliente_api(1)
+    try:
+        total = _consultar_api(cliente, offset=0, limit=0).get("total")
+        return total, cliente.modificacao_recurso(config['api']['resource_id'])
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.warning(f"Não foi possível consultar o estado da API: {e}")
+        return None
+    finally:
+        cliente.fechar()
+
+
+def fontes_sem_alteracao(marca_anterior):
+    """
+    Compara a marca d'água da tabela com o estado atual das fontes: a mesma data de alteração e
+    o mesmo total na API, os mesmos CSVs locais (por hash) e a mesma versão da normalização.
+    Sem a data de alteração da API (modo offline ou API sem a informação), nunca há como garantir.
+    """
+    if not marca_anterior or marca_anterior.get('modificado_api') is None:
+        return False
+    if marca_anterior.get('versao_normalizacao') != VERSAO_CACHE_LOCAL:
+        return False
+    if marca_anterior.get('arquivos_locais') != hashes_arquivos_locais():
+        return False
+    return _estado_api() == (marca_anterior['total_api'], marca_anterior['modificado_api'])
+
+
+def _normalizar_pagina_api(caminho_pagina, caminho_saida):
+    """Normaliza uma página baixada da API no mesmo formato longo do cache dos arquivos locais."""
+    df_pagina = normalizar_registros(pq.read_table(caminho_pagina).to_pandas()).dropna(subset=['Ano', 'Mes'])
+    pq.write_table(pa_arrow.Table.from_pandas(df_pagina[COLUNAS_ESSENCIAIS], schema=ESQUEMA_REGISTROS,
+                                              preserve_index=False), caminho_saida)
+    return len(df_pagina)
+
+
+def _mapa_nomes_fonte(arquivos):
+    """`mapa_nomes_conjuntos` sobre todos os registros de uma fonte, lendo um arquivo por vez."""
+    if not arquivos:
+        return None
+    mapas = [mapa_nomes_conjuntos(pq.read_table(arquivo, columns=['ConjuntoID', 'NomConjunto']).to_pandas())
+             for arquivo in arquivos]
+    return mapa_nomes_conjuntos(pd.concat(mapas, ignore_index=True))
+
+
+def _listar_particoes(arquivos, colunas):
+    """Combinações distintas das `colunas` de partição nos registros normalizados, lidas arquivo a arquivo."""
+    valores = set()
+    for arquivo in arquivos:
+        distintos = pq.read_table(arquivo, columns=colunas).group_by(colunas).aggregate([])
+        valores.update(zip(*[distintos.column(col).to_pylist() for col in colunas]))
+    return [dict(zip(colunas, combinacao)) for combinacao in sorted(valores)]
 
-def criar_pipeline_unificado():
-    """Executa o pipeline completo: processa, unifica, valida e salva em Delta Lake."""
-    logging.info("=" * 50)
-    logging.info("INICIANDO PIPELINE DE PROCESSAMENTO DE DADOS")
 
+def _processar_particao(particao, fontes, mapas, caminho_saida, snapshot=None):
+    """
+    Pivota, remove duplicatas e valida os registros de uma partição, lidos (com o filtro da
+    partição) dos Parquets normalizados de cada fonte; a memória usada depende só do tamanho
+    da partição. Executado em um processo separado por partição.
+    Grava o resultado em Arrow IPC (com o dataset `snapshot` da tabela, apenas as linhas novas
+    ou alteradas em relação a ela) e retorna o resumo da partição, com os casos de falha da
+    validação. O processo não usa o deltalake, que não pode ser usado após um fork.
+    """
+    filtro = reduce(operator.and_, [ds.field(col) == valor for col, valor in particao.items()])
+    partes, linhas_entrada = [], 0
+    for fonte, arquivos in fontes.items():  # A API vem por último e prevalece na remoção de duplicatas
+        if not arquivos:
+            continue
+        registros = ds.dataset(arquivos, schema=ESQUEMA_REGISTROS, format='parquet').to_table(filter=filtro)
+        if not registros.num_rows:
+            continue
+        linhas_entrada += registros.num_rows
+        if config['pipeline']['engine'] == 'polars':
+            partes.append(_pivotar_indicadores_polars(pl.from_arrow(registros).lazy(), mapas[fonte]))
+        else:
+            partes.append(pivotar_indicadores(registros.to_pandas(), mapas[fonte]))
+    resumo = {'particao': particao, 'caminho': None, 'linhas_entrada': linhas_entrada, 'linhas_saida': 0,
+              'linhas_gravadas': 0, 'anos': [], 'distribuidoras': [], 'falhas': None}
+    if not partes:
+        return resumo
+
+    df = aplicar_esquema_compacto(pd.concat(partes, ignore_index=True), config['pipeline']['float32_indicators'])
+    df.drop_duplicates(subset=CHAVES_REGISTRO, keep='last', inplace=True)
+    resumo['linhas_saida'] = len(df)
+
+    tabela = tabela_para_delta(df)
+    falhas = reunir_falhas(
+        validar_estrutura(SchemaDados, df),
+        validar_em_blocos(SchemaDados, tabela, indice=df.index.to_numpy(),
+                          linhas_por_bloco=config['data_quality']['chunk_rows'], max_workers=1))
+    if not falhas.empty:
+        resumo['falhas'] = falhas
+        return resumo
+
+    if snapshot is not None:
+        df = _filtrar_registros_alterados(snapshot, df)
+        tabela = tabela_para_delta(df)
+    if tabela.num_rows:
+        with pa_arrow.OSFile(caminho_saida, 'wb') as f, pa_arrow.ipc.new_file(f, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+        resumo.update(caminho=caminho_saida, linhas_gravadas=tabela.num_rows,
+                      anos=[int(ano) for ano in df['Ano'].unique()],
+                      distribuidoras=[str(d) for d in df['Distribuidora'].unique()])
+    return resumo
+
+
+def _ler_particoes(caminhos):
+    """
+    Leitor em streaming dos arquivos IPC das partições (lidos por memory-map), com as colunas
+    alinhadas a um esquema único: indicadores ausentes em uma partição vêm nulos.
+    """
+    leitores = [pa_arrow.ipc.open_file(pa_arrow.memory_map(caminho, 'r')) for caminho in caminhos]
+    esquema = pa_arrow.unify_schemas([leitor.schema for leitor in leitores])
+
+    def lotes():
+        for leitor in leitores:
+            for i in range(leitor.num_record_batches):
+                lote = leitor.get_batch(i)
+                yield pa_arrow.RecordBatch.from_arrays(
+                    [lote.column(campo.name) if campo.name in lote.schema.names
+                     else pa_arrow.nulls(lote.num_rows, campo.type) for campo in esquema], schema=esquema)
+    return pa_arrow.RecordBatchReader.from_batches(esquema, lotes())
+
+
+def _processar_em_lote(path_dados_processados, incremental, marca_anterior):
+    """
+    Processa todas as fontes em um único DataFrame: limpa, unifica, valida e salva em Delta Lake.
+    Retorna False se a execução foi interrompida antes de gravar os dados.
+    """
     df_local = processar_dados_locais()
     df_api = processar_dados_api()
-    df_final = pd.concat([df_local, df_api], ignore_index=True)
+    if df_api is None:
+        logging.warning("O download da API não foi concluído. Os dados NÃO serão salvos para não gravar uma carga parcial.")
+        return False
+    total_api, modificado_api = df_api.attrs.get('total_api'), df_api.attrs.get('modificado_api')
+    with coletor.etapa('unificacao') as etapa:
+        # As categorias de cada fonte diferem; o concat volta a texto e o esquema compacto é reaplicado
+        df_final = aplicar_esquema_compacto(pd.concat([df_local, df_api], ignore_index=True),
+                                            config['pipeline']['float32_indicators'])
 
-    if df_final.empty:
-        logging.warning("Nenhum dado foi processado. Encerrando o pipeline.")
-        return
+        if df_final.empty:
+            logging.warning("Nenhum dado foi processado. Encerrando o pipeline.")
+            return False
 
-    logging.info(f"Total de {len(df_final):,} linhas antes da remoção de duplicatas.")
-    df_final.drop_duplicates(subset=['Distribuidora', 'ConjuntoID', 'Ano', 'Mes'], keep='last', inplace=True)
-    logging.info(f"Total de {len(df_final):,} linhas após a remoção de duplicatas.")
-    df_final['Ano'] = df_final['Ano'].astype(int)
+        logging.info(f"Total de {len(df_final):,} linhas antes da remoção de duplicatas.")
+        linhas_unificadas = len(df_final)
+        df_final.drop_duplicates(subset=CHAVES_REGISTRO, keep='last', inplace=True)
+        logging.info(f"Total de {len(df_final):,} linhas após a remoção de duplicatas.")
+        etapa.registrar(linhas_entrada=linhas_unificadas, linhas_saida=len(df_final))
 
     # --- 4. VALIDAÇÃO DOS DADOS PROCESSADOS ---
-    try:
+    # A tabela do Arrow validada em blocos é a mesma entregue ao writer
+    tabela_final = tabela_para_delta(df_final)
+    with coletor.etapa('validacao', linhas_entrada=len(df_final)) as etapa:
         logging.info("Validando o esquema e a qualidade dos dados finais...")
-        SchemaDados.validate(df_final, lazy=True)
+        falhas = reunir_falhas(
+            validar_estrutura(SchemaDados, df_final),
+            validar_em_blocos(SchemaDados, tabela_final, indice=df_final.index.to_numpy(),
+                              linhas_por_bloco=config['data_quality']['chunk_rows'],
+                              max_workers=config['data_quality']['max_workers']))
+        if not falhas.empty:
+            logging.error("Falha na validação de qualidade de dados! Verifique os erros abaixo:")
+            logging.error(falhas)
+            logging.warning("Os dados NÃO serão salvos devido a falhas de qualidade.")
+            etapa.status = 'falhou'
+            etapa.registrar(falhas_validacao=len(falhas))
+            return False  # Interrompe a execução se algum bloco estiver ruim: nada é gravado
         logging.info("Validação de dados concluída com sucesso.")
-    except pa.errors.SchemaErrors as err:
-        logging.error("Falha na validação de qualidade de dados! Verifique os erros abaixo:")
-        logging.error(err.failure_cases)
-        logging.warning("Os dados NÃO serão salvos devido a falhas de qualidade.")
-        return  # Interrompe a execução se os dados estiverem ruins
 
     # --- 5. SALVANDO EM FORMATO DELTA LAKE ---
+    marca_dagua = _nova_marca_dagua(total_api, modificado_api, df_local.attrs.get('arquivos_locais', []),
+                                    marca_anterior)
+    with coletor.etapa('escrita_delta', linhas_entrada=len(df_final)) as etapa:
+        versao_anterior = versao_atual(path_dados_processados)
+        if incremental:
+            logging.info(f"Mesclando os dados processados em '{path_dados_processados}' (Delta Lake, incremental)...")
+            metricas_merge = salvar_incremental(path_dados_processados, df_final, marca_dagua)
+            etapa.registrar(linhas_saida=metricas_merge.get('num_target_rows_inserted', 0) +
+                            metricas_merge.get('num_target_rows_updated', 0))
+        else:
+            logging.info(f"Salvando os dados processados em '{path_dados_processados}' no formato Delta Lake...")
+            write_deltalake(
+                path_dados_processados,
+                tabela_final,
+                mode='overwrite',
+                partition_by=['Ano', 'Distribuidora'],
+                schema_mode='overwrite',
+                commit_properties=CommitProperties(custom_metadata={'marca_dagua': json.dumps(marca_dagua)})
+            )
+            etapa.registrar(linhas_saida=len(df_final))
+        etapa.registrar(bytes_gravados=bytes_adicionados(path_dados_processados, versao_anterior))
+    return True
+
+
+def _processar_por_particoes(path_dados_processados, incremental, marca_anterior):
+    """
+    Executor por partições: os registros normalizados das duas fontes ficam em Parquet no disco
+    e cada partição (`pipeline.shard_by`) é pivotada, deduplicada e validada em um processo do
+    pool, com memória proporcional à partição e não ao histórico inteiro. Os resultados das
+    partições são gravados na tabela em um único commit (overwrite ou MERGE), e nada é gravado
+    se alguma partição falhar na validação. Retorna False se a execução foi interrompida.
+    """
+    arquivos_locais = normalizar_dados_locais()
+    resultado_api = baixar_paginas_api()
+    if resultado_api is None:
+        logging.warning("O download da API não foi concluído. Os dados NÃO serão salvos para não gravar uma carga parcial.")
+        return False
+    total_api, modificado_api, paginas_api = resultado_api
+
+    path_preparacao = config['paths']['staging']
+    shutil.rmtree(path_preparacao, ignore_errors=True)
+    os.makedirs(os.path.join(path_preparacao, 'api'))
+    max_workers = config['pipeline']['shard_workers']
+    try:
+        with coletor.etapa('api_normalizacao') as etapa:
+            arquivos_api = [os.path.join(path_preparacao, 'api', os.path.basename(pagina)) for pagina in paginas_api]
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                linhas_api = sum(executor.map(_normalizar_pagina_api, paginas_api, arquivos_api))
+            etapa.registrar(arquivos_processados=len(paginas_api), linhas_saida=linhas_api)
+
+        # --- 4. LIMPEZA, DEDUPLICAÇÃO E VALIDAÇÃO POR PARTIÇÃO ---
+        fontes = {'local': arquivos_locais, 'api': arquivos_api}
+        particoes = _listar_particoes(arquivos_locais + arquivos_api, config['pipeline']['shard_by'])
+        if not particoes:
+            logging.warning("Nenhum dado foi processado. Encerrando o pipeline.")
+            return False
+        mapas = {fonte: _mapa_nomes_fonte(arquivos) for fonte, arquivos in fontes.items()}
+        logging.info(f"Processando {len(particoes)} partições ({', '.join(config['pipeline']['shard_by'])}) "
+                     f"com {max_workers} processos...")
+        snapshot = dataset_snapshot(DeltaTable(path_dados_processados)) if incremental else None
+        with coletor.etapa('particoes', particoes=len(particoes)) as etapa:
+            resumos = [None] * len(particoes)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futuros = {executor.submit(_processar_particao, particao, fontes, mapas,
+                                           os.path.join(path_preparacao, f"particao_{indice:05d}.arrow"),
+                                           snapshot): indice
+                           for indice, particao in enumerate(particoes)}
+                for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+                    resumo = resumos[futuros[futuro]] = futuro.result()
+                    logging.info(f"Partição {concluidas}/{len(particoes)} processada {resumo['particao']}: "
+                                 f"{resumo['linhas_saida']:,} linhas.")
+            etapa.registrar(linhas_entrada=sum(resumo['linhas_entrada'] for resumo in resumos),
+                            linhas_saida=sum(resumo['linhas_saida'] for resumo in resumos))
+
+            falhas = reunir_falhas(*[resumo['falhas'] for resumo in resumos])
+            if not falhas.empty:
+                for resumo in resumos:
+                    if resumo['falhas'] is not None:
+                        logging.error(f"Falha na validação da partição {resumo['particao']}:")
+                        logging.error(resumo['falhas'])
+                logging.warning("Os dados NÃO serão salvos devido a falhas de qualidade.")
+                etapa.status = 'falhou'
+                etapa.registrar(falhas_validacao=len(falhas))
+                return False  # Nenhuma partição é gravada se alguma falhar
+            logging.info("Validação de dados concluída com sucesso em todas as partições.")
+
+        # --- 5. SALVANDO EM FORMATO DELTA LAKE (UM ÚNICO COMMIT) ---
+        marca_dagua = _nova_marca_dagua(total_api, modificado_api, _hashes_das_saidas(arquivos_locais),
+                                        marca_anterior)
+        gravadas = [resumo for resumo in resumos if resumo['caminho']]
+        with coletor.etapa('escrita_delta', linhas_entrada=sum(resumo['linhas_gravadas'] for resumo in gravadas)) as etapa:
+            versao_anterior = versao_atual(path_dados_processados)
+            fonte = _ler_particoes([resumo['caminho'] for resumo in gravadas]) if gravadas else None
+            if incremental and fonte is None:
+                logging.info("Nenhum registro novo ou alterado em relação à versão atual da tabela. Nada a gravar.")
+                registrar_marca_dagua(DeltaTable(path_dados_processados), marca_dagua)
+            elif incremental:
+                logging.info(f"Mesclando {len(gravadas)} partições em '{path_dados_processados}' (Delta Lake, incremental)...")
+                metricas_merge = mesclar_registros(
+                    DeltaTable(path_dados_processados), fonte.read_all(),
+                    sorted({ano for resumo in gravadas for ano in resumo['anos']}),
+                    sorted({d for resumo in gravadas for d in resumo['distribuidoras']}), marca_dagua)
+                etapa.registrar(linhas_saida=metricas_merge.get('num_target_rows_inserted', 0) +
+                                metricas_merge.get('num_target_rows_updated', 0))
+            else:
+                logging.info(f"Salvando {len(gravadas)} partições em '{path_dados_processados}' no formato Delta Lake...")
+                write_deltalake(
+                    path_dados_processados,
+                    fonte,
+                    mode='overwrite',
+                    partition_by=['Ano', 'Distribuidora'],
+                    schema_mode='overwrite',
+                    commit_properties=CommitProperties(custom_metadata={'marca_dagua': json.dumps(marca_dagua)})
+                )
+                etapa.registrar(linhas_saida=sum(resumo['linhas_gravadas'] for resumo in gravadas))
+            etapa.registrar(bytes_gravados=bytes_adicionados(path_dados_processados, versao_anterior))
+    finally:
+        shutil.rmtree(path_preparacao, ignore_errors=True)
+    return True
+
+
+def _executar_pipeline():
+    """
+    Executa o pipeline completo: processa, unifica, valida e salva em Delta Lake.
+    Retorna False se a execução foi interrompida antes de gravar os dados.
+    """
+    logging.info("=" * 50)
+    logging.info("INICIANDO PIPELINE DE PROCESSAMENTO DE DADOS")
+
     path_dados_processados = config['paths']['processed_data']
-    logging.info(f"Salvando os dados processados em '{path_dados_processados}' no formato Delta Lake...")
-    write_deltalake(
-        path_dados_processados,
-        df_final,
-        mode='overwrite',
-        partition_by=['Ano', 'Distribuidora']
-    )
+    incremental = config['pipeline']['write_mode'] == 'incremental' and DeltaTable.is_deltatable(
+        path_dados_processados)
+    if incremental:
+        # Partições de gravações antigas, com espaços no nome da distribuidora, não casariam com
+        # as chaves já sem espaços no MERGE e todas as linhas seriam inseridas de novo
+        normalizar_particoes(path_dados_processados)
+    marca_anterior = ler_marca_dagua(DeltaTable(path_dados_processados)) if incremental else None
+    if marca_anterior:
+        logging.info(f"Modo incremental. Marca d'água atual: {marca_anterior}")
+
+    with coletor.etapa('marca_dagua') as etapa:
+        sem_alteracao = incremental and fontes_sem_alteracao(marca_anterior)
+        if sem_alteracao:
+            logging.info("As fontes não mudaram desde a carga gravada na tabela (marca d'água). "
+                         "Processamento e MERGE dispensados.")
+            etapa.status = 'sem_alteracao'
+    if not sem_alteracao:
+        processar = _processar_por_particoes if config['pipeline']['shard_by'] else _processar_em_lote
+        if not processar(path_dados_processados, incremental, marca_anterior):
+            return False
+
+    # --- 6. MANUTENÇÃO DA TABELA (OPCIONAL) ---
+    if config['maintenance']['run_after_pipeline']:
+        with coletor.etapa('manutencao'):
+            logging.info("Executando a manutenção da tabela (normalização, compactação e vacuum)...")
+            executar_manutencao(path_dados_processados, config['maintenance']['retention_hours'],
+                                config['maintenance']['target_file_size_mb'], config['maintenance']['z_order'])
+
+    # --- 7. CATÁLOGO DE PARTIÇÕES ---
+    with coletor.etapa('catalogo'):
+        catalogo = construir_catalogo(DeltaTable(path_dados_processados))
+        salvar_catalogo(path_dados_processados, catalogo)
+        logging.info(f"Catálogo da versão {catalogo['versao']} gravado com {len(catalogo['particoes'])} partições.")
+
+    # --- 8. TABELAS AGREGADAS PARA O DASHBOARD ---
+    path_agregados = config['paths']['aggregated_data']
+    with coletor.etapa('agregados') as etapa:
+        logging.info(f"Materializando as tabelas agregadas em '{path_agregados}'...")
+        versao_origem = versao_dados(path_dados_processados)
+        resultado = materializar_agregados(
+            DeltaTable(path_dados_processados), path_agregados, versao_origem, config['paths']['staging'])
+        if resultado is None:
+            logging.info(f"As tabelas agregadas já correspondem à versão {versao_origem} dos dados. Nada a recalcular.")
+            etapa.status = 'sem_alteracao'
+        else:
+            linhas_tabela, linhas_agregados = resultado
+            logging.info(f"Tabelas agregadas gravadas: {linhas_agregados}")
+            etapa.registrar(linhas_entrada=linhas_tabela, linhas_saida=sum(linhas_agregados.values()))
+
+    # --- 9. PREVISÕES EM LOTE ---
+    if config['forecasting']['enabled']:
+        with coletor.etapa('previsoes') as etapa:
+            logging.info("Gerando as previsões SARIMAX em lote...")
+            series = gerar_previsoes(path_agregados, versao_origem, max_workers=config['forecasting']['max_workers'],
+                                     passos=config['forecasting']['horizon_months'])
+            if series is None:
+                etapa.status = 'sem_alteracao'
+            else:
+                etapa.registrar(linhas_saida=series)
     logging.info("Pipeline de dados concluído com sucesso!")
     logging.info("=" * 50)
+    return True
+
+
+def exportar_metricas():
+    """Grava as métricas das etapas da execução em JSON lines e no textfile do Prometheus."""
+    if not config['metrics']['enabled']:
+        return
+    coletor.gravar_jsonl(config['metrics']['pipeline_jsonl'])
+    coletor.gravar_prometheus(config['metrics']['pipeline_prometheus'], 'aneel_pipeline')
+    logging.info(f"Métricas da execução {coletor.execucao} gravadas em '{config['metrics']['pipeline_jsonl']}' "
+                 f"e '{config['metrics']['pipeline_prometheus']}'.")
+
+
+def criar_pipeline_unificado(perfil=None, offline=False):
+    """
+    Executa o pipeline medindo cada etapa e exporta as métricas ao final, mesmo se ele falhar.
+    Com `perfil` ('cprofile' ou 'pyinstrument', padrão em `metrics.profiler`) grava também
+    o perfil da execução em logs/. Com `offline`, os dados da API vêm apenas do cache HTTP
+    (o mesmo que `api.offline` no config.yaml).
+    """
+    if offline:
+        config['api']['offline'] = True
+    coletor.nova_execucao()
+    try:
+        with Perfilador(perfil or config['metrics']['profiler'], f"logs/perfil_pipeline_{coletor.execucao}"):
+            with coletor.etapa('total') as etapa:
+                if not _executar_pipeline():
+                    etapa.status = 'interrompido'
+    finally:
+        exportar_metricas()
+
+
+def executar_agendado(perfil=None, offline=False):
+    """
+    Executa o pipeline agora e depois a cada `pipeline.refresh_interval_hours` horas (uma única
+    vez se 0). Usado pelo start.sh para atualizar os dados em segundo plano enquanto o dashboard
+    atende a partir do último snapshot: uma execução que falha fica no log e a tabela continua
+    na última versão gravada.
+    """
+    intervalo_horas = config['pipeline']['refresh_interval_hours']
+    while True:
+        try:
+            criar_pipeline_unificado(perfil, offline)
+        except Exception:
+            logging.exception("A atualização falhou. A tabela continua na última versão gravada.")
+        if not intervalo_horas:
+            return
+        logging.info(f"Próxima atualização dos dados em {intervalo_horas} h.")
+        time.sleep(intervalo_horas * 3600)
 
 
 if __name__ == "__main__":
-    criar_pipeline_unificado()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline de dados dos indicadores de continuidade da ANEEL.")
+    parser.add_argument('--perfil', choices=['cprofile', 'pyinstrument'],
+                        help="Grava o perfil desta execução em logs/ (padrão: metrics.profiler do config.yaml).")
+    parser.add_argument('--offline', action='store_true',
+                        help="Reconstrói os dados da API só com as respostas em cache, sem acessar a rede.")
+    parser.add_argument('--agendado', action='store_true',
+                        help="Executa agora e repete a cada pipeline.refresh_interval_hours (atualização em segundo plano).")
+    argumentos = parser.parse_args()
+    if argumentos.agendado:
+        executar_agendado(argumentos.perfil, argumentos.offline)
+    else:
+        criar_pipeline_unificado(argumentos.perfil, argumentos.offline)
@@ -1,9 +1,24 @@
 #!/bin/sh
-# Este script garante que o pipeline de dados seja executado e verificado antes de iniciar o dashboard.
+# Inicia o dashboard. Se já existe uma tabela Delta gravada (por exemplo, em um volume montado em
+# dados_processados/), o dashboard sobe imediatamente sobre esse último snapshot e o pipeline atualiza
+# os dados em segundo plano (e depois a cada pipeline.refresh_interval_hours); o dashboard passa para a
+# nova versão da tabela assim que o commit é gravado. Sem snapshot, o pipeline roda antes do dashboard.
+# Use MODO_INICIO=completo para sempre executar o pipeline inteiro antes de iniciar o dashboard.
 
 # Garante que o script pare se algum comando falhar
 set -e
 
+MODO_INICIO="${MODO_INICIO:-snapshot}"
+
+if [ "$MODO_INICIO" = "snapshot" ] && [ -d "dados_processados/_delta_log" ]; then
+    echo ">>> (1/2) Snapshot da tabela encontrado. Atualizando os dados em segundo plano..."
+    # Uma atualização que falha (ex.: API fora do ar) só fica no log; o dashboard segue na última versão
+    python processar_dados.py --agendado &
+
+    echo ">>> (2/2) Iniciando o dashboard Streamlit sobre o último snapshot..."
+    exec streamlit run dashboard_integrado.py
+fi
+
 echo ">>> (1/3) Iniciando o pipeline de processamento de dados..."
 python processar_dados.py
 
@@ -22,4 +37,4 @@ fi
 
 echo ">>> (3/3) Verificação concluída. Iniciando o dashboard Streamlit..."
 # O comando 'exec' substitui o processo do script pelo do Streamlit
-exec streamlit run dashboard_integrado.py
\ No newline at end of file
+exec streamlit run dashboard_integrado.py
@@ -0,0 +1,230 @@
+# tabela_delta.py
+"""
+Leitura da tabela Delta de dados processados a partir do log de transações (_delta_log).
+
+Usado pelo dashboard: a lista de arquivos vem do snapshot da versão commitada (e não de
+uma varredura das pastas), o que ignora arquivos órfãos de gravações anteriores e permite
+podar partições e colunas antes de abrir qualquer Parquet.
+"""
+from functools import reduce
+import json
+import operator
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from deltalake import DeltaTable
+
+# Colunas usadas pelas análises do dashboard (as demais colunas de indicadores ficam no disco)
+COLUNAS_DASHBOARD = ['Distribuidora', 'ConjuntoID', 'NomConjunto', 'Ano', 'Mes', 'DEC', 'FEC', 'DIC', 'FIC']
+INDICADORES = ['DEC', 'FEC', 'DIC', 'FIC']
+
+# Colunas de texto com poucos valores distintos, mantidas como categorias (dicionário) em memória
+COLUNAS_CATEGORICAS = ['Distribuidora', 'CNPJ', 'ConjuntoID', 'NomConjunto']
+
+# Chave que identifica um registro único na tabela
+CHAVES_REGISTRO = ['Distribuidora', 'ConjuntoID', 'Ano', 'Mes']
+
+# Formatos oferecidos na exportação e seus tipos MIME
+FORMATOS_EXPORTACAO = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Metadado de commit que marca as operações de manutenção (não alteram o conteúdo da tabela)
+METADADO_MANUTENCAO = 'manutencao'
+OPERACOES_SEM_ALTERACAO = {'OPTIMIZE', 'VACUUM START', 'VACUUM END'}
+
+# Arquivo com o catálogo de partições, gravado na raiz da tabela (o Delta ignora nomes iniciados por '_')
+NOME_CATALOGO = '_catalogo.json'
+
+
+def aplicar_esquema_compacto(df, indicadores_float32=False):
+    """
+    Tipos compactos usados do pipeline ao dashboard: categorias para as chaves de texto,
+    inteiros pequenos para Ano/Mes e, opcionalmente, float32 para os indicadores.
+    """
+    tipos = {col: 'category' for col in COLUNAS_CATEGORICAS if col in df.columns}
+    tipos.update({col: tipo for col, tipo in [('Ano', 'int16'), ('Mes', 'int8')] if col in df.columns})
+    if indicadores_float32:
+        tipos.update({col: 'float32' for col in df.select_dtypes('float64').columns})
+    return df.astype(tipos)
+
+
+def tabela_para_delta(df):
+    """
+    Converte o DataFrame para Arrow no formato gravado na tabela Delta. O Delta não tem tipo
+    dicionário, então as categorias voltam a ser texto (o Parquet as codifica por dicionário).
+    """
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    esquema = pa.schema([
+        pa.field(campo.name, campo.type.value_type) if pa.types.is_dictionary(campo.type) else campo
+        for campo in tabela.schema
+    ])
+    return tabela.cast(esquema)
+
+
+def abrir_tabela(path, versao=None):
+    """Abre a tabela Delta na versão mais recente ou na `versao` indicada."""
+    return DeltaTable(path, version=versao)
+
+
+def versao_atual(path):
+    """
+    Versão mais recente da tabela, obtida só pelos nomes dos arquivos de commit no
+    _delta_log (sem carregar o log). Retorna None se a tabela não existir.
+    """
+    path_log = os.path.join(path, '_delta_log')
+    if not os.path.isdir(path_log):
+        return None
+    versoes = [int(nome[:-5]) for nome in os.listdir(path_log) if nome.endswith('.json') and nome[:-5].isdigit()]
+    return max(versoes) if versoes else None
+
+
+def bytes_adicionados(path, versao_anterior=None):
+    """
+    Tamanho total dos arquivos adicionados pelos commits posteriores a `versao_anterior`
+    (todos, se None), somado a partir das ações `add` dos arquivos de commit do _delta_log.
+    """
+    versao_final = versao_atual(path)
+    if versao_final is None:
+        return 0
+    total = 0
+    primeira = 0 if versao_anterior is None else versao_anterior + 1
+    for versao in range(primeira, versao_final + 1):
+        caminho_commit = os.path.join(path, '_delta_log', f"{versao:020d}.json")
+        if not os.path.exists(caminho_commit):
+            continue
+        with open(caminho_commit, 'r') as f:
+            total += sum(json.loads(linha).get('add', {}).get('size', 0) for linha in f if linha.strip())
+    return total
+
+
+def versao_dados(path, versao=None):
+    """
+    Versão do último commit que alterou o conteúdo da tabela, ignorando compactações,
+    vacuums e demais commits de manutenção. Tabelas derivadas (agregados, previsões)
+    continuam válidas enquanto esta versão não muda.
+    """
+    for commit in abrir_tabela(path, versao).history():
+        if commit.get('operation') in OPERACOES_SEM_ALTERACAO or commit.get(METADADO_MANUTENCAO) == 'true':
+            continue
+        return commit['version']
+    return None
+
+
+def valores_particao(tabela, coluna):
+    """Valores distintos de uma coluna de partição no snapshot atual, lidos do log."""
+    return sorted({particao[coluna] for particao in tabela.partitions() if particao.get(coluna) is not None})
+
+
+def dataset_snapshot(tabela, filtro_particao=None):
+    """
+    Monta um dataset do PyArrow apenas com os arquivos ativos do snapshot cujas partições
+    passam em `filtro_particao` (função que recebe o dicionário de valores da partição).
+    Os valores das colunas de partição vêm do log, e não do nome das pastas.
+    """
+    esquema = pa.schema(tabela.schema())
+    caminhos, expressoes = [], []
+    for particao in tabela.partitions():
+        if filtro_particao is not None and not filtro_particao(particao):
+            continue
+        expressao = reduce(operator.and_, [
+            ds.field(col) == pa.scalar(valor).cast(esquema.field(col).type) for col, valor in particao.items()])
+        for caminho in tabela.file_uris(file_pruning_predicate=[(col, '=', valor) for col, valor in particao.items()]):
+            caminhos.append(caminho)
+            expressoes.append(expressao)
+    return ds.FileSystemDataset.from_paths(caminhos, schema=esquema, format=ds.ParquetFileFormat(),
+                                           filesystem=pafs.LocalFileSystem(), partitions=expressoes)
+
+
+def ler_distribuidora(tabela, distribuidora, colunas=None):
+    """
+    Lê apenas os arquivos das partições da distribuidora e apenas as `colunas` pedidas.
+    Os valores de partição são comparados sem espaços nas bordas, pois gravações antigas
+    usaram o nome da distribuidora com espaços à direita.
+    """
+    dataset = dataset_snapshot(
+        tabela, lambda particao: (particao.get('Distribuidora') or '').strip() == distribuidora)
+    if not dataset.files:
+        return None
+    if colunas is not None:
+        colunas = [col for col in colunas if col in dataset.schema.names]
+    return dataset.to_table(columns=colunas)
+
+
+def exportar_distribuidora(tabela, distribuidora, formato='csv'):
+    """
+    Gera o arquivo de exportação (CSV ou Parquet) com todas as colunas da distribuidora,
+    escrevendo lote a lote a partir dos arquivos da tabela, sem montar um DataFrame.
+    Retorna os bytes do arquivo, ou None se a distribuidora não existir no snapshot.
+    """
+    dataset = dataset_snapshot(
+        tabela, lambda particao: (particao.get('Distribuidora') or '').strip() == distribuidora)
+    if not dataset.files:
+        return None
+    destino = pa.BufferOutputStream()
+    if formato == 'parquet':
+        escritor = pq.ParquetWriter(destino, dataset.schema, compression='zstd')
+    else:
+        escritor = pacsv.CSVWriter(destino, dataset.schema)
+    posicao = dataset.schema.get_field_index('Distribuidora')
+    with escritor:
+        for lote in dataset.to_batches():
+            if posicao >= 0:
+                # Partições antigas guardam o nome com espaços à direita
+                lote = lote.set_column(posicao, 'Distribuidora', pc.utf8_trim_whitespace(lote.column(posicao)))
+            escritor.write_batch(lote)
+    return destino.getvalue().to_pybytes()
+
+
+def construir_catalogo(tabela):
+    """
+    Resume o snapshot da tabela por partição (Ano, Distribuidora) usando apenas o log:
+    linhas, arquivos, bytes, primeiro e último mês e indicadores com algum valor positivo.
+    """
+    acoes = pa.table(tabela.get_add_actions(flatten=True)).to_pylist()
+    particoes = {}
+    for acao in acoes:
+        ano, distribuidora = acao.get('partition.Ano'), (acao.get('partition.Distribuidora') or '').strip()
+        if ano is None or not distribuidora:
+            continue
+        resumo = particoes.setdefault((int(ano), distribuidora), {
+            'Ano': int(ano), 'Distribuidora': distribuidora, 'linhas': 0, 'arquivos': 0, 'bytes': 0,
+            'mes_min': None, 'mes_max': None, 'indicadores': set()})
+        resumo['linhas'] += acao.get('num_records') or 0
+        resumo['arquivos'] += 1
+        resumo['bytes'] += acao.get('size_bytes') or 0
+        if acao.get('min.Mes') is not None:
+            resumo['mes_min'] = min(filter(None, [resumo['mes_min'], acao['min.Mes']]))
+        if acao.get('max.Mes') is not None:
+            resumo['mes_max'] = max(filter(None, [resumo['mes_max'], acao['max.Mes']]))
+        for ind in INDICADORES:
+            # Sem estatística gravada não dá para descartar o indicador
+            if f'max.{ind}' not in acao or (acao[f'max.{ind}'] or 0) > 0:
+                resumo['indicadores'].add(ind)
+
+    lista_particoes = []
+    for resumo in sorted(particoes.values(), key=lambda r: (r['Distribuidora'], r['Ano'])):
+        resumo['indicadores'] = [ind for ind in INDICADORES if ind in resumo['indicadores']]
+        resumo['data_min'] = f"{resumo['Ano']}-{resumo.pop('mes_min') or 1:02d}"
+        resumo['data_max'] = f"{resumo['Ano']}-{resumo.pop('mes_max') or 12:02d}"
+        lista_particoes.append(resumo)
+    return {'versao': tabela.version(), 'particoes': lista_particoes}
+
+
+def salvar_catalogo(path, catalogo):
+    """Grava o catálogo na raiz da tabela de forma atômica."""
+    caminho = os.path.join(path, NOME_CATALOGO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(catalogo, f, ensure_ascii=False)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def ler_catalogo(path):
+    """Lê o catálogo gravado com a tabela, ou None se ele ainda não existir."""
+    caminho = os.path.join(path, NOME_CATALOGO)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
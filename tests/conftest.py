@@ -0,0 +1,20 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ_REPO)
+
+
+@pytest.fixture(scope='session')
+def processar_dados():
+    """Importa o pipeline a partir da raiz do repositório, onde ele lê o config.yaml."""
+    diretorio = os.getcwd()
+    os.chdir(RAIZ_REPO)
+    try:
+        import processar_dados
+    finally:
+        os.chdir(diretorio)
+    return processar_dados
@@ -0,0 +1,101 @@
+# tests/test_download_api.py
+# Download paginado da API contra o substituto local do CKAN (benchmarks/api_local.py) em uma porta livre.
+import json
+import os
+import sys
+
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from api_local import RESOURCE_ID_PADRAO, carregar_registros, criar_servidor, iniciar_em_segundo_plano  # noqa: E402
+from gerar_dados import gerar_registros  # noqa: E402
+
+TAMANHO_PAGINA = 100
+
+
+@pytest.fixture
+def registros(tmp_path):
+    caminho = tmp_path / 'registros.parquet'
+    gerar_registros(distribuidoras=2, conjuntos=3, ano_inicial=2020, ano_final=2021).to_parquet(caminho)
+    return carregar_registros(caminho)  # 2 × 3 × 2 anos × 12 meses × 4 indicadores = 576
+
+
+@pytest.fixture
+def api_local(processar_dados, registros, tmp_path, monkeypatch):
+    """Sobe a API local e aponta o pipeline para ela, com páginas e cache HTTP em `tmp_path`."""
+    servidores = []
+
+    def iniciar(limite_maximo=32000):
+        servidor = criar_servidor(registros, limite_maximo=limite_maximo)
+        servidores.append(servidor)
+        monkeypatch.setitem(processar_dados.config['api'], 'base_url', iniciar_em_segundo_plano(servidor))
+        return servidor
+
+    config = processar_dados.config
+    monkeypatch.setitem(config['api'], 'page_size', TAMANHO_PAGINA)
+    monkeypatch.setitem(config['api'], 'max_workers', 2)
+    monkeypatch.setitem(config['api'], 'offline', False)
+    monkeypatch.setitem(config['api'], 'resource_id', RESOURCE_ID_PADRAO)
+    monkeypatch.setitem(config['paths'], 'api_pages', str(tmp_path / 'dados_api'))
+    monkeypatch.setitem(config['paths'], 'http_cache', str(tmp_path / 'http_api'))
+    processar_dados.coletor.nova_execucao()
+    yield iniciar
+    for servidor in servidores:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def ultima_etapa_download(processar_dados):
+    return [registro for registro in processar_dados.coletor.registros if registro['etapa'] == 'api_download'][-1]
+
+
+def ler_progresso(processar_dados):
+    with open(os.path.join(processar_dados.config['paths']['api_pages'], '_progresso.json')) as f:
+        return json.load(f)
+
+
+def test_baixa_todas_as_paginas(processar_dados, api_local, registros):
+    servidor = api_local()
+    total, modificado, paginas = processar_dados.baixar_paginas_api()
+
+    assert total == len(registros) == 576
+    assert modificado == servidor.modificado
+    assert len(paginas) == 6
+    ids = [int(i) for pagina in paginas for i in pq.read_table(pagina, columns=['_id'])['_id'].to_pylist()]
+    assert ids == list(range(1, len(registros) + 1))
+    assert ler_progresso(processar_dados)['concluido']
+    assert ultima_etapa_download(processar_dados)['status'] == 'ok'
+
+
+def test_retoma_do_checkpoint_e_reaproveita_carga_concluida(processar_dados, api_local):
+    api_local()
+    _, _, paginas = processar_dados.baixar_paginas_api()
+
+    # Simula um download interrompido: duas páginas faltando e o checkpoint não concluído
+    for pagina in paginas[2:4]:
+        os.remove(pagina)
+    progresso = ler_progresso(processar_dados)
+    progresso['concluido'] = False
+    with open(os.path.join(processar_dados.config['paths']['api_pages'], '_progresso.json'), 'w') as f:
+        json.dump(progresso, f)
+
+    _, _, retomadas = processar_dados.baixar_paginas_api()
+    etapa = ultima_etapa_download(processar_dados)
+    assert retomadas == paginas
+    assert (etapa['paginas_api'], etapa['paginas_reaproveitadas']) == (2, 4)
+
+    # Mesma data de alteração e download concluído: nenhuma página é baixada de novo
+    processar_dados.baixar_paginas_api()
+    etapa = ultima_etapa_download(processar_dados)
+    assert (etapa['status'], etapa['paginas_api'], etapa['paginas_reaproveitadas']) == ('sem_alteracao', 0, 6)
+
+
+def test_pagina_incompleta_e_falha_de_download(processar_dados, api_local):
+    api_local(limite_maximo=TAMANHO_PAGINA // 2)  # O servidor corta as páginas pela metade
+
+    assert processar_dados.baixar_paginas_api() is None
+    assert not ler_progresso(processar_dados)['concluido']
+    assert not [nome for nome in os.listdir(processar_dados.config['paths']['api_pages']) if nome.endswith('.parquet')]
+    etapa = ultima_etapa_download(processar_dados)
+    assert (etapa['status'], etapa['falhas_api']) == ('erro', 6)
@@ -0,0 +1,91 @@
+# tests/test_engines.py
+# As engines 'pandas' e 'polars' de limpar_e_padronizar_dataframe (e do processamento por partição)
+# devem produzir o mesmo DataFrame.
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+
+def registros_bruto(linhas):
+    colunas = ['SigAgente', 'NumCNPJ', 'IdeConjUndConsumidoras', 'DscConjUndConsumidoras', 'AnoIndice',
+               'NumPeriodoIndice', 'VlrIndiceEnviado', 'SigIndicador']
+    return pd.DataFrame(linhas, columns=colunas)
+
+
+# Registros como vêm da API e dos CSVs: tudo texto, com vírgula decimal, espaços nas bordas,
+# valores ausentes ou inválidos, chaves repetidas e indicadores fora dos principais
+REGISTROS_BAGUNCADOS = [
+    ['AME ', '123', '10', 'Centro', '2020', '1', '1,5', 'DEC'],
+    ['AME', '123', '10', 'Centro', '2020', '1', '2,5', 'DEC'],  # Mesma chave: fica a média
+    ['AME', '123', ' 10', 'Centro Novo', '2020', '2', '3', 'FEC'],  # Último nome do conjunto vale para todos
+    ['AME', '123', '11', 'Norte', ' 2021', '12 ', ' 0,75 ', 'DIC'],
+    ['AME', '123', '11', 'Norte', '2021', '12', 'abc', 'FIC'],  # Valor inválido é descartado
+    ['AME', '123', '11', 'Norte', '2021', '11', '', 'DEC'],
+    ['AME', '123', '11', 'Norte', '2021', '11', '4,0', 'DECXP'],  # Indicador extra vira coluna própria
+    ['CEB', None, '20', 'Sul', '2019', '5', '7', 'DEC'],  # CNPJ ausente: linha fora do pivot
+    ['CEB', '456', '20', 'Sul', '2019', '5', '8', 'FEC'],
+    [None, '456', '21', 'Leste', '2019', '6', '1', 'DEC'],  # Sem distribuidora: descartado
+    ['CEB', '456', '21', None, '2019', '6', '1', 'DEC'],  # Sem nome do conjunto: descartado
+    ['CEB', '456', '22', 'Oeste', '2019', '', '9', 'DEC'],  # Sem mês: descartado
+    ['CEB', '456', '22', 'Oeste', '2019', '7', '-1,25', 'DIC'],
+]
+
+
+@pytest.mark.parametrize('registros', [
+    REGISTROS_BAGUNCADOS,
+    REGISTROS_BAGUNCADOS[::-1],
+    [linha for linha in REGISTROS_BAGUNCADOS if linha[7] == 'DEC'],  # Sem FEC, DIC e FIC
+], ids=['baguncados', 'ordem_inversa', 'so_dec'])
+def test_engines_produzem_o_mesmo_resultado(processar_dados, registros):
+    df_bruto = registros_bruto(registros)
+    df_pandas = processar_dados.limpar_e_padronizar_dataframe(df_bruto.copy(), 'pandas')
+    df_polars = processar_dados.limpar_e_padronizar_dataframe(df_bruto.copy(), 'polars')
+    pd.testing.assert_frame_equal(df_pandas, df_polars)
+
+
+def test_engines_com_valores_nulos_do_pandas(processar_dados):
+    df_bruto = registros_bruto(REGISTROS_BAGUNCADOS).replace({'': None})
+    df_bruto.loc[2, 'VlrIndiceEnviado'] = float('nan')
+    df_pandas = processar_dados.limpar_e_padronizar_dataframe(df_bruto.copy(), 'pandas')
+    df_polars = processar_dados.limpar_e_padronizar_dataframe(df_bruto.copy(), 'polars')
+    pd.testing.assert_frame_equal(df_pandas, df_polars)
+
+
+def registros_normalizados(processar_dados, df_bruto):
+    """Registros no formato longo do cache de cada fonte, como os lê o processamento por partição."""
+    df = processar_dados.normalizar_registros(df_bruto).dropna(subset=['Ano', 'Mes'])
+    return pa.Table.from_pandas(df[processar_dados.COLUNAS_ESSENCIAIS], schema=processar_dados.ESQUEMA_REGISTROS,
+                                preserve_index=False)
+
+
+def test_normalizacao_dos_registros_da_api(processar_dados):
+    # Páginas da API: todas as colunas como texto, com o `_id` do CKAN
+    df_bruto = registros_bruto(REGISTROS_BAGUNCADOS)
+    df_bruto.insert(0, '_id', [str(i) for i in range(1, len(df_bruto) + 1)])
+    esperado = registros_normalizados(processar_dados, df_bruto.copy())
+    df_polars = (processar_dados._normalizar_registros_polars(pl.from_pandas(df_bruto).lazy())
+                 .drop_nulls(subset=['Ano', 'Mes']).collect().to_pandas())
+    obtido = pa.Table.from_pandas(df_polars[processar_dados.COLUNAS_ESSENCIAIS],
+                                  schema=processar_dados.ESQUEMA_REGISTROS, preserve_index=False)
+    assert obtido.equals(esperado)
+
+
+@pytest.mark.parametrize('conjunto_fora_do_mapa', [None, '11'], ids=['mapa_completo', 'conjunto_sem_nome'])
+def test_engines_com_mapa_de_nomes_da_fonte(processar_dados, conjunto_fora_do_mapa):
+    # O mapa de nomes vem de todos os registros da fonte, e os registros pivotados são só os da partição
+    registros = registros_normalizados(processar_dados, registros_bruto(REGISTROS_BAGUNCADOS))
+    mapa_nomes = processar_dados.mapa_nomes_conjuntos(registros.to_pandas())
+    mapa_nomes = mapa_nomes[mapa_nomes['ConjuntoID'] != conjunto_fora_do_mapa]
+    # Fora a linha com o último nome do conjunto 10, que só chega à partição pelo mapa
+    particao = registros.filter(pc.not_equal(registros['Mes'], 2))
+
+    df_pandas = processar_dados.pivotar_indicadores(particao.to_pandas(), mapa_nomes)
+    df_polars = processar_dados._pivotar_indicadores_polars(pl.from_arrow(particao).lazy(), mapa_nomes)
+    float32 = processar_dados.config['pipeline']['float32_indicators']
+    pd.testing.assert_frame_equal(processar_dados.aplicar_esquema_compacto(df_pandas, float32),
+                                  processar_dados.aplicar_esquema_compacto(df_polars, float32))
+    nomes = dict(zip(df_pandas['ConjuntoID'].astype(str), df_pandas['NomConjunto'].astype(str)))
+    assert nomes['10'] == 'Centro Novo'
+    assert nomes['11'] == ('Não identificado' if conjunto_fora_do_mapa else 'Norte')
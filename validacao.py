@@ -0,0 +1,98 @@
+# validacao.py
+# Validação dos dados em blocos com o Arrow: a estrutura e os tipos são conferidos pelo próprio
+# esquema do Pandera (em um DataFrame vazio) e as regras de valor (faixas e nulos) rodam como
+# operações vetorizadas do Arrow, bloco a bloco e em paralelo.
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandera.errors import SchemaErrors
+
+COLUNAS_FALHAS = ['schema_context', 'column', 'check', 'check_number', 'failure_case', 'index']
+
+# Regras do Pandera traduzidas para o Arrow: nome da regra -> função (valores, estatísticas) -> máscara de aprovação
+REGRAS_ARROW = {
+    'greater_than_or_equal_to': lambda valores, est: pc.greater_equal(valores, est['min_value']),
+    'greater_than': lambda valores, est: pc.greater(valores, est['min_value']),
+    'less_than_or_equal_to': lambda valores, est: pc.less_equal(valores, est['max_value']),
+    'less_than': lambda valores, est: pc.less(valores, est['max_value']),
+    'equal_to': lambda valores, est: pc.equal(valores, est['value']),
+    'not_equal_to': lambda valores, est: pc.not_equal(valores, est['value']),
+    'isin': lambda valores, est: pc.is_in(valores, value_set=pa.array(list(est['allowed_values']))),
+    'in_range': lambda valores, est: pc.and_(
+        (pc.greater_equal if est.get('include_min', True) else pc.greater)(valores, est['min_value']),
+        (pc.less_equal if est.get('include_max', True) else pc.less)(valores, est['max_value'])),
+}
+
+
+def validar_estrutura(schema, df):
+    """Colunas e tipos, validados pelo Pandera em um DataFrame vazio com as mesmas colunas e tipos."""
+    try:
+        schema.validate(df.iloc[:0], lazy=True)
+    except SchemaErrors as err:
+        return err.failure_cases.reindex(columns=COLUNAS_FALHAS)
+    return pd.DataFrame(columns=COLUNAS_FALHAS)
+
+
+def _casos_de_falha(lote, coluna, descricao, numero, reprovados, inicio, indice):
+    posicoes = pc.indices_nonzero(reprovados).to_numpy()
+    if not len(posicoes):
+        return None
+    rotulos = posicoes + inicio if indice is None else indice[posicoes + inicio]
+    return pd.DataFrame({
+        'schema_context': 'Column', 'column': coluna, 'check': descricao, 'check_number': numero,
+        'failure_case': lote.column(coluna).take(pa.array(posicoes)).to_pylist(), 'index': rotulos,
+    })
+
+
+def _validar_lote(lote, colunas, inicio, indice):
+    """Aplica as regras de valor das colunas a um lote do Arrow e devolve os casos de falha."""
+    falhas = []
+    for nome, coluna in colunas.items():
+        if nome not in lote.schema.names:
+            continue  # A ausência da coluna já é reportada por validar_estrutura
+        valores = lote.column(nome)
+        validos = pc.is_valid(valores)
+        if pa.types.is_floating(valores.type):
+            validos = pc.and_(validos, pc.invert(pc.is_nan(valores)))
+        if not coluna.nullable:
+            falhas.append(_casos_de_falha(lote, nome, 'not_nullable', None, pc.invert(validos), inicio, indice))
+        for numero, regra in enumerate(coluna.checks):
+            if regra.name in REGRAS_ARROW:
+                aprovados = REGRAS_ARROW[regra.name](valores, regra.statistics)
+                # Como no Pandera, valores nulos não são avaliados pelas regras
+                reprovados = pc.and_(validos, pc.invert(pc.fill_null(aprovados, True)))
+            else:
+                # Regras sem equivalente no Arrow rodam no próprio Pandera, só sobre esta coluna
+                serie = valores.to_pandas()
+                resultado = regra(serie).check_output
+                reprovados = pa.array((~resultado.to_numpy(dtype=bool)) & validos.to_numpy(zero_copy_only=False))
+            falhas.append(_casos_de_falha(lote, nome, regra.error, numero, reprovados, inicio, indice))
+    return [falha for falha in falhas if falha is not None]
+
+
+def validar_em_blocos(schema, tabela, indice=None, linhas_por_bloco=250_000, max_workers=4):
+    """
+    Valida as regras de valor (faixas e nulos) das colunas de `schema` sobre a tabela do Arrow,
+    em blocos de `linhas_por_bloco` linhas avaliados em paralelo (as funções do Arrow liberam o GIL).
+    Retorna os casos de falha de todos os blocos em um único DataFrame, no formato do
+    `failure_cases` do Pandera; vazio se todos os blocos passaram. `indice` (opcional) traduz a
+    posição da linha para o rótulo do índice do DataFrame de origem.
+    """
+    colunas = schema.to_schema().columns
+    lotes = tabela.to_batches(max_chunksize=linhas_por_bloco)
+    inicios = [0]
+    for lote in lotes[:-1]:
+        inicios.append(inicios[-1] + lote.num_rows)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = executor.map(lambda args: _validar_lote(args[0], colunas, args[1], indice), zip(lotes, inicios))
+        return reunir_falhas(*[falha for resultado in resultados for falha in resultado])
+
+
+def reunir_falhas(*falhas):
+    """Junta os casos de falha de várias validações em um único relatório (vazio se não houver falhas)."""
+    falhas = [falha for falha in falhas if falha is not None and not falha.empty]
+    if not falhas:
+        return pd.DataFrame(columns=COLUNAS_FALHAS)
+    return pd.concat(falhas, ignore_index=True)[COLUNAS_FALHAS]